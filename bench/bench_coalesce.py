@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Measure 50 concurrent identical requests, coalesced or not.
+
+    python bench/bench_coalesce.py [repeat]
+
+Requests go to local stub server (see github_stub.py) answering after
+20ms, from 50 threads at once, without response cache. Memo window
+is off, so every round goes to the server at least once.
+"""
+import sys
+import threading
+import time
+
+from common import measure, report
+
+import github_stub
+
+from ws.http import SessionManager
+
+REQUESTS = 50
+LATENCY = 0.02
+
+
+class SlowHandler(github_stub.Handler):
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        super().do_GET()
+
+
+def burst(session, url):
+    threads = [threading.Thread(target=lambda: session.get(url).json()) for _ in range(REQUESTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(repeat=5):
+    server, url = github_stub.start()
+    server.RequestHandlerClass = SlowHandler
+    url += '/search/repositories?q=python&per_page=100'
+    results = {}
+    try:
+        for name, coalesce in (('separate', False), ('coalesced', True)):
+            session_manager = SessionManager(cache=False, coalesce=coalesce, memo_ttl=0, pool_maxsize=REQUESTS)
+            session = session_manager.session(url)
+            results[name] = measure(lambda: burst(session, url), repeat=repeat, items=REQUESTS)
+            session_manager.close()
+    finally:
+        server.shutdown()
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Measure service discovery with 10, 100 and 1000 generated services.
+
+    python bench/bench_discovery.py [repeat]
+
+Services are generated into a temporary package, with its own index file,
+and run with empty temporary home directory.
+"cold" rows start without index, so every service module is imported
+and described, "warm" ones with index saved by previous run, in new
+ServiceManager (like a new ws process), "hot" ones reuse ServiceManager
+(like shell or daemon). has_service rows time 1000 lookups.
+"json" rows do the same with json services (see ws.services.declarative),
+"cold" ones without compiled specs cached.
+"""
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from common import measure, report, temporary_home
+
+from ws.services import ServiceManager
+
+PACKAGE = 'ws_bench_services'
+SIZES = (10, 100, 1000)
+
+SERVICE_TEMPLATE = '''from ws.public import ArgumentDefinition, Command, Flag, Option, Service
+
+
+class Search(Command):
+    name = 'search'
+    description = 'search {name}'
+
+    def available_flags(self):
+        return [Flag('v', 'verbose', help='more details')]
+
+    def available_options(self):
+        return [Option('r', 'results', help='amount of results', default=10)]
+
+    def argument_definition(self):
+        return ArgumentDefinition(min_amount=1)
+
+
+class Service{number}(Service):
+    name = '{name}'
+    description = 'generated service number {number}'
+    endpoint = 'https://{name}.example.com'
+
+    def available_commands(self):
+        return [Search]
+'''
+
+
+def generate(root, size):
+    """
+    Create package with size services in root, return its directory.
+    """
+    package_dir = os.path.join(root, PACKAGE + str(size))
+    os.makedirs(package_dir)
+    open(os.path.join(package_dir, '__init__.py'), 'w').close()
+    for number in range(size):
+        name = 'service{}'.format(number)
+        os.makedirs(os.path.join(package_dir, name))
+        open(os.path.join(package_dir, name, '__init__.py'), 'w').close()
+        with open(os.path.join(package_dir, name, 'service.py'), 'w') as f:
+            f.write(SERVICE_TEMPLATE.format(name=name, number=number))
+    return package_dir
+
+
+def generate_json(root, size):
+    """
+    Create directory with size json services in root, return it.
+    """
+    services_dir = os.path.join(root, 'json{}'.format(size))
+    os.makedirs(services_dir)
+    for number in range(size):
+        name = 'service{}'.format(number)
+        spec = {
+            'description': 'generated service number {}'.format(number),
+            'endpoint': 'https://{}.example.com'.format(name),
+            'commands': [{
+                'name': 'search',
+                'description': 'search ' + name,
+                'path': '/search',
+                'flags': [{'shortname': 'v', 'longname': 'verbose', 'help': 'more details'}],
+                'options': [{'shortname': 'r', 'longname': 'results', 'help': 'amount of results',
+                             'default': 10, 'type': 'int'}],
+                'arguments': {'min_amount': 1, 'param': 'q'},
+                'response': {'items': 'items', 'template': '{name} {description}\n', 'limit': 'results'},
+            }],
+        }
+        with open(os.path.join(services_dir, name + '.json'), 'w') as f:
+            json.dump(spec, f)
+    return services_dir
+
+
+def forget(package):
+    """
+    Drop imported service modules, so they are imported again.
+    """
+    for name in list(sys.modules):
+        if name == package or name.startswith(package + '.'):
+            del sys.modules[name]
+    importlib.invalidate_caches()
+
+
+def run(repeat=5):
+    results = {}
+    with temporary_home(), tempfile.TemporaryDirectory() as root:
+        sys.path.insert(0, root)
+        try:
+            for size in SIZES:
+                package_dir = generate(root, size)
+                package = os.path.basename(package_dir)
+                index_path = os.path.join(root, 'index{}.json'.format(size))
+
+                empty_dir = os.path.join(root, 'empty')
+                os.makedirs(empty_dir, exist_ok=True)
+
+                def manager():
+                    return ServiceManager(package_dir, package, index_path, declarative_dir=empty_dir)
+
+                def cold():
+                    if os.path.exists(index_path):
+                        os.unlink(index_path)
+                    forget(package)
+                    manager().all_services()
+
+                hot_manager = manager()
+                hot_manager.all_services()
+                names = ['service{}'.format(number % size) for number in range(1000)]
+                missing = ['missing{}'.format(number) for number in range(1000)]
+
+                results['all_services cold, {} services'.format(size)] = measure(
+                    cold, repeat=repeat, warmup=0, items=size)
+                results['all_services warm, {} services'.format(size)] = measure(
+                    lambda: manager().all_services(), repeat=repeat, items=size)
+                results['all_services hot, {} services'.format(size)] = measure(
+                    hot_manager.all_services, repeat=repeat, items=size)
+                results['has_service x1000, {} services'.format(size)] = measure(
+                    lambda: [hot_manager.has_service(name) for name in names], repeat=repeat, items=1000)
+                results['has_service missing x1000, {} services'.format(size)] = measure(
+                    lambda: [hot_manager.has_service(name) for name in missing], repeat=repeat, items=1000)
+
+                json_dir = generate_json(root, size)
+                json_cache = os.path.join(root, 'compiled{}'.format(size))
+                json_index_path = os.path.join(root, 'json_index{}.json'.format(size))
+
+                def json_manager():
+                    return ServiceManager(empty_dir, package, json_index_path, json_dir, json_cache)
+
+                def json_cold():
+                    shutil.rmtree(json_cache, ignore_errors=True)
+                    json_manager().all_services()
+
+                hot_json_manager = json_manager()
+                hot_json_manager.all_services()
+                results['json all_services cold, {} services'.format(size)] = measure(
+                    json_cold, repeat=repeat, warmup=0, items=size)
+                results['json all_services warm, {} services'.format(size)] = measure(
+                    lambda: json_manager().all_services(), repeat=repeat, items=size)
+                results['json all_services hot, {} services'.format(size)] = measure(
+                    hot_json_manager.all_services, repeat=repeat, items=size)
+        finally:
+            sys.path.remove(root)
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Measure `ws github search` end to end against local stub server
+(see github_stub.py).
+
+    python bench/bench_e2e.py [repeat]
+
+"in process" rows parse and run the command in this process, with
+output to /dev/null and without response cache, so they show parsing,
+dispatch, http and output overhead. "process" rows run src/app.py
+with GitHub endpoint pointed to stub server, without daemon.
+Both use empty temporary home directory.
+"""
+import os
+import subprocess
+import sys
+
+from common import SRC, measure, report, temporary_home
+
+import github_stub
+
+from ws import Env, WsCommand
+from ws.http import SessionManager
+from ws.services import ServiceManager
+from ws.tokenize import argv_tokens
+from ws.utils import redirect_stdio
+
+LAUNCHER = '''
+import sys
+sys.path.insert(0, {src!r})
+import ws.services.github.service
+ws.services.github.service.Github.endpoint = {url!r}
+sys.argv[0] = 'ws'
+import app
+app.run()
+'''
+
+
+def run_in_process(service_manager, session_manager, argv):
+    wscmd = WsCommand(None, service_manager=service_manager, env=Env(http=session_manager))
+    wscmd.parse(argv_tokens(argv))
+    with open(os.devnull, 'w') as devnull, redirect_stdio(stdout=devnull):
+        wscmd.run()
+
+
+def run(repeat=10):
+    from ws.services.github.service import Github
+    server, url = github_stub.start()
+    endpoint = Github.endpoint
+    Github.endpoint = url
+    results = {}
+    try:
+        with temporary_home():
+            service_manager = ServiceManager()
+            session_manager = SessionManager(cache=False)
+            for amount in (10, 100, 300):
+                argv = ['github', 'search', '-r', str(amount), 'python']
+                results['in process, {} results'.format(amount)] = measure(
+                    lambda: run_in_process(service_manager, session_manager, argv), repeat=repeat, items=amount)
+            session_manager.close()
+        with temporary_home():
+            env = dict(os.environ, WS_NO_DAEMON='1')
+            launcher = LAUNCHER.format(src=SRC, url=url)
+            for amount in (10, 300):
+                command = [sys.executable, '-c', launcher, 'github', 'search', '-r', str(amount), 'python']
+                results['process, {} results'.format(amount)] = measure(
+                    lambda: subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True),
+                    repeat=repeat, items=amount)
+    finally:
+        Github.endpoint = endpoint
+        server.shutdown()
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Measure decoding of large json listing, streamed or whole.
+
+    python bench/bench_json.py [repeat]
+
+Body of 20000 items (about 10MB) is given in 64KB chunks, like response
+body. "first item" rows time until the first item with selected fields
+is available, "all items" rows until all of them are.
+"""
+import json
+import sys
+
+from common import measure, report
+
+from ws.jsonstream import JsonStream, parse_fields, project
+
+ITEMS = 20000
+CHUNK = 64 * 1024
+FIELDS = parse_fields('name,owner.login')
+
+
+def body():
+    return json.dumps({'total_count': ITEMS, 'items': [{
+        'name': 'repo{}'.format(number),
+        'description': 'repository number {} '.format(number) * 10,
+        'html_url': 'https://github.com/example/repo{}'.format(number),
+        'owner': {'login': 'user{}'.format(number), 'id': number, 'scores': list(range(20))},
+    } for number in range(ITEMS)]}).encode('utf-8')
+
+
+def run(repeat=5):
+    data = body()
+
+    def chunks():
+        return (data[start:start + CHUNK] for start in range(0, len(data), CHUNK))
+
+    def whole():
+        return (project(item, FIELDS) for item in json.loads(b''.join(chunks()))['items'])
+
+    def streamed():
+        return iter(JsonStream(chunks(), ('items',), FIELDS))
+
+    results = {}
+    for name, items in (('whole', whole), ('streamed', streamed)):
+        results['{}, first item'.format(name)] = measure(lambda: next(items()), repeat=repeat)
+        results['{}, all items'.format(name)] = measure(
+            lambda: sum(1 for item in items()), repeat=repeat, items=ITEMS)
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Measure writing 50000 records in every --output format.
+
+    python bench/bench_output.py [repeat]
+
+Records go through ws.output.write_result to a file opened on /dev/null.
+"print" row formats the same records with print, one line each,
+the way commands format their own text.
+"""
+import os
+import sys
+
+from common import measure, report
+
+from ws.output import FORMATS, write_result
+
+RECORDS = 50000
+
+
+def records():
+    for number in range(RECORDS):
+        yield {
+            'name': 'repo{}'.format(number),
+            'description': 'repository number {}'.format(number),
+            'stars': number * 7,
+            'owner': {'login': 'user{}'.format(number % 100), 'id': number % 100},
+        }
+
+
+def run(repeat=5):
+    results = {}
+    with open(os.devnull, 'w') as devnull:
+        def printed():
+            for record in records():
+                print('{} {} {}'.format(record['name'], record['description'], record['stars']), file=devnull)
+
+        results['print'] = measure(printed, repeat=repeat, items=RECORDS)
+        results['default'] = measure(lambda: write_result(records(), devnull), repeat=repeat, items=RECORDS)
+        for output_format in FORMATS:
+            results[output_format] = measure(
+                lambda: write_result(records(), devnull, output_format), repeat=repeat, items=RECORDS)
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Measure Command.parse on long command lines.
+
+    python bench/bench_parse.py [repeat]
+
+Lines are tokenized once, only parsing is timed. "args" rows parse
+a command taking any amount of arguments, "options" rows a command
+with many flags and options given repeatedly, "nested" rows go through
+a chain of subcommands.
+"""
+import sys
+
+from common import measure, report
+
+from ws.parse import ArgumentDefinition, Command, Flag, Option
+from ws.tokenize import tokenize
+
+
+class Leaf(Command):
+    name = 'leaf'
+
+    def available_flags(self):
+        return [Flag('v', 'verbose'), Flag('q', 'quiet')]
+
+    def argument_definition(self):
+        return ArgumentDefinition(min_amount=1)
+
+
+class Many(Command):
+    name = 'many'
+
+    def available_flags(self):
+        return [Flag(None, 'flag{}'.format(n)) for n in range(50)]
+
+    def available_options(self):
+        return [Option(None, 'option{}'.format(n), multiple=True) for n in range(50)]
+
+
+def nested(depth):
+    command = Leaf
+    for level in range(depth):
+        command = type('Level{}'.format(level), (Command,), {
+            'name': 'level{}'.format(level),
+            'available_commands': lambda self, command=command: [command],
+        })
+    return command
+
+
+class Root(Command):
+    def available_commands(self):
+        return [Leaf, Many, NESTED]
+
+
+NESTED = nested(100)
+
+
+def lines(size):
+    options = ' '.join('--flag{0} --option{0} value{1}'.format(n % 50, n) for n in range(size // 3))
+    levels = ' '.join('level{}'.format(level) for level in range(99, -1, -1))
+    args = ' '.join('argument{}'.format(n) for n in range(size))
+    return {
+        'args': 'leaf -v ' + args,
+        'options': 'many ' + options,
+        'nested': levels + ' leaf ' + args,
+    }
+
+
+def run(repeat=20):
+    results = {}
+    for size in (100, 1000, 10000):
+        for kind, line in lines(size).items():
+            tokens = tokenize(line)
+            results['{} {} ({} tokens)'.format(kind, size, len(tokens))] = measure(
+                lambda: Root(None).parse(tokens), repeat=repeat, items=len(tokens))
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
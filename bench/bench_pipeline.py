@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Measure passing 50000 records from one stage of pipeline to another.
+
+    python bench/bench_pipeline.py [repeat]
+
+"records" row passes them through ws.pipeline pipe as objects,
+"text" row reads them from the pipe as json lines (like :map does),
+"os pipe" row writes json lines to os pipe and parses them back,
+like `ws ... | ws ...` does, without startup of second process.
+"""
+import json
+import os
+import sys
+import threading
+
+from common import measure, report
+
+from ws.output import write_result
+from ws.pipeline import Pipe, PipeReader, PipeWriter
+
+RECORDS = 50000
+
+
+def records():
+    for number in range(RECORDS):
+        yield {'name': 'repo{}'.format(number), 'stars': number * 7, 'owner': {'login': 'user{}'.format(number % 100)}}
+
+
+def in_process(read):
+    pipe = Pipe()
+
+    def produce():
+        try:
+            write_result(records(), PipeWriter(pipe))
+        finally:
+            pipe.end()
+
+    thread = threading.Thread(target=produce)
+    thread.start()
+    count = sum(1 for item in read(PipeReader(pipe)))
+    thread.join()
+    assert count == RECORDS
+
+
+def os_pipe():
+    read_fd, write_fd = os.pipe()
+
+    def produce():
+        with open(write_fd, 'w') as stream:
+            write_result(records(), stream)
+
+    thread = threading.Thread(target=produce)
+    thread.start()
+    with open(read_fd) as stream:
+        count = sum(1 for line in stream if json.loads(line))
+    thread.join()
+    assert count == RECORDS
+
+
+def run(repeat=5):
+    return {
+        'records': measure(lambda: in_process(PipeReader.records), repeat=repeat, items=RECORDS),
+        'text': measure(lambda: in_process(iter), repeat=repeat, items=RECORDS),
+        'os pipe': measure(os_pipe, repeat=repeat, items=RECORDS),
+    }
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Measure :search index with 1000 and 20000 generated services.
+
+    python bench/bench_search.py [repeat]
+
+Services are given as index records, so no modules are involved.
+"build" rows index all of them, "load" ones read saved index,
+"reindex one" replaces a single service, like after it was updated.
+Query rows search hot index with exact, prefix, fuzzy and multi-word
+queries.
+"""
+import os
+import random
+import sys
+import tempfile
+
+from common import measure, report
+
+from ws.services.search import SearchIndex
+
+SIZES = (1000, 20000)
+WORDS = ('search', 'upload', 'translate', 'weather', 'forecast', 'image', 'resize', 'convert',
+         'repository', 'issues', 'payments', 'invoice', 'calendar', 'events', 'mail', 'send',
+         'storage', 'bucket', 'queue', 'message', 'music', 'playlist', 'video', 'stream')
+QUERIES = {
+    'exact': 'weather',
+    'prefix': 'trans',
+    'fuzzy': 'wether',
+    'multi-word': 'image resize convert',
+}
+
+
+def record(number, rng):
+    words = rng.sample(WORDS, 6)
+
+    def command(name):
+        return {
+            'name': name, 'aliases': [], 'description': '{} {}'.format(name, ' '.join(words[2:4])),
+            'flags': [{'longname': 'verbose', 'help': 'more details', 'description': None}],
+            'options': [{'longname': 'results', 'help': 'amount of results', 'description': None}],
+            'arguments': {'help': 'QUERY', 'description': None}, 'commands': [],
+        }
+
+    return {
+        'name': 'service{}'.format(number), 'aliases': [],
+        'description': 'service {} for {} and {}'.format(number, words[0], words[1]),
+        'flags': [], 'options': [], 'arguments': None,
+        'commands': [command(words[4]), command(words[5])],
+    }
+
+
+def build(path, records):
+    index = SearchIndex(path)
+    index._load()
+    for name, item in records.items():
+        index.add(name, None, item)
+    return index
+
+
+def run(repeat=5):
+    results = {}
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as root:
+        for size in SIZES:
+            records = dict(('service{}'.format(n), record(n, rng)) for n in range(size))
+            path = os.path.join(root, 'search{}.marshal'.format(size))
+            results['build, {} services'.format(size)] = measure(
+                lambda: build(path, records), repeat=repeat, warmup=0, items=size)
+            index = build(path, records)
+            index.save()
+
+            def load():
+                loaded = SearchIndex(path)
+                loaded._load()
+
+            results['load, {} services'.format(size)] = measure(load, repeat=repeat, items=size)
+
+            def reindex():
+                index.remove('service0')
+                index.add('service0', None, records['service0'])
+
+            results['reindex one, {} services'.format(size)] = measure(reindex, repeat=repeat)
+            for kind, query in QUERIES.items():
+                results['query {}, {} services'.format(kind, size)] = measure(
+                    lambda: index.search(query), repeat=repeat)
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Measure process startup of ws.
+
+    python bench/bench_startup.py [repeat]
+
+"interpreter" is a bare `python -c pass`, so the difference between it
+and other rows is what ws itself costs. All rows run with temporary
+home directory: "cold" rows with a new, empty one every time (so
+service index has to be built), "warm" ones with the one left by
+previous runs. "(daemon)" rows are run with a ws daemon listening
+on a temporary socket.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import APP, measure, report, run_app
+
+
+def start_daemon(env):
+    daemon = subprocess.Popen([sys.executable, APP, ':daemon'], env=env, stderr=subprocess.DEVNULL)
+    while not os.path.exists(env['WS_DAEMON_SOCKET']):
+        time.sleep(0.01)
+    return daemon
+
+
+def cold(env, *args):
+    with tempfile.TemporaryDirectory() as home:
+        run_app(*args, env=dict(env, HOME=home))
+
+
+def run(repeat=20):
+    with tempfile.TemporaryDirectory() as home:
+        no_daemon = dict(os.environ, HOME=home, WS_NO_DAEMON='1')
+        results = {
+            'interpreter': measure(
+                lambda: subprocess.run([sys.executable, '-c', 'pass'], check=False),
+                repeat=repeat),
+            'cold ws -V': measure(lambda: cold(no_daemon, '-V'), repeat=repeat),
+            'warm ws -V': measure(lambda: run_app('-V', env=no_daemon), repeat=repeat),
+            'cold ws :commands': measure(lambda: cold(no_daemon, ':commands'), repeat=repeat),
+            'warm ws :commands': measure(lambda: run_app(':commands', env=no_daemon), repeat=repeat),
+            'cold ws :help github': measure(lambda: cold(no_daemon, ':help', 'github'), repeat=repeat),
+            'warm ws :help github': measure(lambda: run_app(':help', 'github', env=no_daemon), repeat=repeat),
+        }
+        env = dict(os.environ, HOME=home, WS_DAEMON_SOCKET=os.path.join(home, 'daemon.sock'))
+        env.pop('WS_NO_DAEMON', None)
+        daemon = start_daemon(env)
+        try:
+            results['ws -V (daemon)'] = measure(lambda: run_app('-V', env=env), repeat=repeat)
+            results['ws :help github (daemon)'] = measure(
+                lambda: run_app(':help', 'github', env=env), repeat=repeat)
+        finally:
+            run_app(':daemon', '--stop', env=env)
+            daemon.wait()
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*[int(arg) for arg in sys.argv[1:2]]))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Measure tokenize on 100 KB command lines.
+
+    python bench/bench_tokenize.py [repeat]
+
+"legacy" rows run the character by character tokenizer ws used
+before quoting support, kept here for comparison. It does not handle
+quotes, so on "quoted" line it only splits on whitespace and does less
+work than tokenize, which has to remove quotes and escapes.
+"""
+import sys
+
+from common import measure, report
+
+from ws.tokenize import tokenize
+
+SIZE = 100 * 1024
+
+
+class LegacyToken:
+
+    def __init__(self, text, position):
+        self.text = text
+        self.position = position
+
+
+def legacy_tokenize(text):
+    tokens = []
+    if not text:
+        return tokens
+    in_space = text[0].isspace()
+    start = 0
+    for idx, ch in enumerate(text):
+        if ch.isspace() != in_space:
+            if not in_space:
+                tokens.append(LegacyToken(text[start:idx], start))
+            in_space = ch.isspace()
+            start = idx
+    if not in_space:
+        tokens.append(LegacyToken(text[start:], start))
+    return tokens
+
+
+def line(word):
+    words = []
+    size = 0
+    n = 0
+    while size < SIZE:
+        words.append(word.format(n))
+        size += len(words[-1]) + 1
+        n += 1
+    return ' '.join(words)
+
+
+LINES = {
+    'plain': line('argument{}'),
+    'short words': line('{}'),
+    'quoted': line('"quoted {}" \'single\'\\ escaped'),
+}
+
+
+def run(repeat=20):
+    results = {}
+    for name, text in LINES.items():
+        count = len(tokenize(text))
+        results['{} ({} tokens)'.format(name, count)] = measure(lambda: tokenize(text), repeat=repeat, items=count)
+        results['{} legacy'.format(name)] = measure(lambda: legacy_tokenize(text), repeat=repeat, items=count)
+    return results
+
+
+if __name__ == '__main__':
+    report(run(*(int(arg) for arg in sys.argv[1:2])))
@@ -0,0 +1,87 @@
+"""
+Helpers shared by ws benchmarks.
+"""
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+APP = os.path.join(SRC, 'app.py')
+
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+
+def measure(func, repeat=20, warmup=1, items=None):
+    """
+    Call func repeat times, return timings summary in seconds.
+    If items (processed by every call) are given, summary includes
+    throughput in items per second.
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings, items)
+
+
+def summarize(timings, items=None):
+    summary = {
+        'runs': len(timings),
+        'min': min(timings),
+        'mean': statistics.mean(timings),
+        'median': statistics.median(timings),
+    }
+    if items:
+        summary['items'] = items
+        summary['per_second'] = items / summary['median'] if summary['median'] else None
+    return summary
+
+
+def run_app(*args, env=None):
+    """
+    Run src/app.py in a fresh interpreter.
+    """
+    subprocess.run(
+        [sys.executable, APP] + list(args),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env=env, check=False,
+    )
+
+
+@contextlib.contextmanager
+def temporary_home():
+    """
+    Point HOME to empty temporary directory while suite runs in this
+    process, so it neither reads services, index and cache of the user
+    nor writes to their ~/.ws. Yield the directory.
+    """
+    previous = os.environ.get('HOME')
+    with tempfile.TemporaryDirectory() as home:
+        os.environ['HOME'] = home
+        try:
+            yield home
+        finally:
+            if previous is None:
+                del os.environ['HOME']
+            else:
+                os.environ['HOME'] = previous
+
+
+def report(results, file=None):
+    width = max(len(name) for name in results)
+    for name, summary in results.items():
+        line = '{}  min {:8.3f}ms  median {:8.3f}ms  mean {:8.3f}ms  ({} runs)'.format(
+            name.ljust(width), summary['min'] * 1000, summary['median'] * 1000,
+            summary['mean'] * 1000, summary['runs'])
+        if summary.get('per_second'):
+            line += '  {:.0f}/s'.format(summary['per_second'])
+        print(line, file=file)
@@ -0,0 +1,59 @@
+"""
+Local HTTP server answering like GitHub repository search.
+
+Every query has TOTAL results, served in pages of per_page items
+linked with Link headers, so ws paginates as with the real api.
+"""
+import http.server
+import json
+import threading
+import urllib.parse
+
+TOTAL = 300
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # ws process exited, keeping connection open
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        per_page = int(query.get('per_page', 30))
+        page = int(query.get('page', 1))
+        start = (page - 1) * per_page
+        items = [{
+            'name': 'repo{}'.format(number),
+            'description': 'repository {} matching {}'.format(number, query.get('q', '')),
+            'html_url': 'https://github.com/example/repo{}'.format(number),
+        } for number in range(start, min(TOTAL, start + per_page))]
+        body = json.dumps({'total_count': TOTAL, 'items': items}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if start + per_page < TOTAL:
+            query['page'] = page + 1
+            self.send_header('Link', '<http://{}{}?{}>; rel="next"'.format(
+                self.headers['Host'], url.path, urllib.parse.urlencode(query)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start():
+    """
+    Start server in background thread, return (server, its url).
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
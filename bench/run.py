@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Run ws benchmarks and compare them with a baseline.
+
+    python bench/run.py [--repeat N] [--only SUITE ...] [--output FILE]
+                        [--baseline FILE] [--threshold FRACTION]
+
+Human readable report goes to stderr, results as json to stdout
+(or to --output FILE). Results saved this way can be given later
+as --baseline: every row is compared by median and ones slower by more
+than --threshold (0.2 = 20% by default) are reported as regressions,
+making exit status 1.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from common import report
+
+import bench_coalesce
+import bench_discovery
+import bench_e2e
+import bench_json
+import bench_output
+import bench_parse
+import bench_pipeline
+import bench_search
+import bench_startup
+import bench_tokenize
+
+SUITES = {
+    'startup': bench_startup,
+    'tokenize': bench_tokenize,
+    'parse': bench_parse,
+    'discovery': bench_discovery,
+    'search': bench_search,
+    'json': bench_json,
+    'output': bench_output,
+    'pipeline': bench_pipeline,
+    'coalesce': bench_coalesce,
+    'e2e': bench_e2e,
+}
+
+
+def compare(results, baseline, threshold):
+    """
+    Return list of (suite, row, ratio of medians) for rows present in both,
+    and list of regressions among them.
+    """
+    rows = []
+    for suite, suite_results in results.items():
+        for name, summary in suite_results.items():
+            base = baseline.get(suite, {}).get(name)
+            if base and base['median']:
+                rows.append((suite, name, summary['median'] / base['median']))
+    return rows, [row for row in rows if row[2] > 1 + threshold]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run ws benchmarks.')
+    parser.add_argument('--repeat', type=int, help='runs per row (default depends on suite)')
+    parser.add_argument('--only', nargs='+', choices=sorted(SUITES), help='suites to run')
+    parser.add_argument('--output', help='file to write json results to, instead of stdout')
+    parser.add_argument('--baseline', help='json results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='slowdown of median counted as regression (default 0.2)')
+    args = parser.parse_args()
+
+    results = {}
+    for suite in args.only or SUITES:
+        print('{}:'.format(suite), file=sys.stderr)
+        suite_results = SUITES[suite].run() if args.repeat is None else SUITES[suite].run(args.repeat)
+        report(suite_results, file=sys.stderr)
+        results[suite] = suite_results
+
+    data = {
+        'time': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1)
+    else:
+        json.dump(data, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        rows, regressions = compare(results, baseline, args.threshold)
+        print('compared with {}:'.format(args.baseline), file=sys.stderr)
+        for suite, name, ratio in rows:
+            mark = '  REGRESSION' if ratio > 1 + args.threshold else ''
+            print('{} / {}: {:+.1f}%{}'.format(suite, name, (ratio - 1) * 100, mark), file=sys.stderr)
+        if regressions:
+            print('{} regression(s)'.format(len(regressions)), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,38 @@
 #!/usr/bin/env python3
 import sys
+import time
 
-from ws import WsCommand
-from ws.services import ServiceManager
-from ws.tokenize import Token
+START = time.perf_counter()
+
+from ws.client import forward  # noqa: E402 (imports are timed as startup)
 
 
 def run():
+    exitcode = forward(sys.argv[1:])
+    if exitcode is not None:
+        sys.exit(exitcode)
+
+    from ws import WsCommand
+    from ws.pipeline import is_pipeline
+    from ws.services import ServiceManager
+    from ws.tokenize import argv_tokens
+
     service_manager = ServiceManager()
     wscmd = WsCommand(parent=None, service_manager=service_manager)
-    tokens = []
-    idx = 0
-    for arg in sys.argv[1:]:
-        tokens.append(Token(arg, idx))
-        idx += len(arg) + 1
+    started = time.perf_counter()
+    tokens = argv_tokens(sys.argv[1:])
+    tokenized = time.perf_counter()
+    if is_pipeline(tokens):
+        from ws import pipeline
+        sys.exit(pipeline.run(tokens, service_manager))
     wscmd.parse(tokens)
-    wscmd.run()
+    parsed = time.perf_counter()
+    if wscmd.options['profile']:
+        from ws import profile
+        phases = [('startup', START, started), ('tokenize', started, tokenized), ('parse', tokenized, parsed)]
+        profile.run(wscmd.options['profile'], wscmd.run, phases, started=START)
+    else:
+        wscmd.run()
 
 
 if __name__ == '__main__':
@@ -100,13 +100,7 @@ Adding your service to service directory:
     and it should be soon added there.
 
 """
-import imp
-import json
 import os
-import re
-import readline
-import sys
-import traceback
 
 from . import commands
 
@@ -114,111 +108,69 @@ from .parse import ArgumentDefinition, Command, Flag, Option
 from .tokenize import tokenize, TokenType
 from .utils import quit
 
-try:
-    requests = imp.load_module('requests1', *imp.find_module('requests'))
-except ImportError:
-    quit('Cannot find requests library. Please install it,'
-         ' its awesome. Aborting.', exitcode=1)
-
-try:
-    from prompt_toolkit.shortcuts import get_input
-    from prompt_toolkit.history import FileHistory
-    from prompt_toolkit.validation import Validator, ValidationError
-    from prompt_toolkit.completion import Completer, Completion
-    from prompt_toolkit.layout.lexers import Lexer
-except ImportError:
-    quit('Cannot import prompt_toolkit. Please install it.', exitcode=1)
-
-# pygment is prompt_toolkit dependency, so we know its there
-from pygments import token as pygment_token
-
 
 BASEDIR = os.path.dirname((os.path.realpath(__file__)))
 VERSION = (0, 0, 1)  # major, minor, release
 VERSION_STR = '.'.join([str(v) for v in VERSION])
 
+# Interactive shell classes live in ws.shell, so that one-shot calls
+# don't pay for importing prompt_toolkit and pygments.
+_SHELL_NAMES = ('WsCmdValidator', 'WsCompleter', 'WsLexer', 'run_shell')
+
+
+def __getattr__(name):
+    if name in _SHELL_NAMES:
+        from . import shell
+        return getattr(shell, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
 
 def setup_user_directories():
     for dname in ('~/.ws/cache', '~/.ws/services',
                   '~/.ws/bin', '~/.ws/aliases'):
         expanded_name = os.path.expanduser(dname)
-    if not os.path.exists(expanded_name):
-        os.makedirs(expanded_name, exist_ok=True)
-
-
-class WsCmdValidator(Validator):
-
-    def __init__(self, service_manager):
-        self.service_manager = service_manager
-        super().__init__()
-
-    def validate(self, document):
-        try:
-            wscmd = WsCommand(None, service_manager=self.service_manager)
-            wscmd.parse(tokenize(document.text))
-        except Exception as e:
-            # raise ValidationError(message=repr(e), index=0)
-            raise
+        if not os.path.exists(expanded_name):
+            os.makedirs(expanded_name, exist_ok=True)
 
 
 class Env:
 
-    def __init__(self, username=None, variant=None):
+    def __init__(self, username=None, variant=None, http=None, files=None, record=None, replay=None, replay_latency=0,
+                 fields=None, output=None, input=None, pipe=None):
         self.username = username
         self.variant = variant
-
-
-class WsCompleter(Completer):
-
-    def get_completions(self, document, complete_event):
-        word = document.get_word_before_cursor()
-        for i in range(5):
-            yield Completion('abc' + str(i), -len(word), display_meta='banana:' + word)
-
-
-class WsLexer(Lexer):
-
-    def __init__(self, service_manager):
-        super().__init__()
-        self.service_manager = service_manager
-
-    def get_tokens(self, cli, text):
-        tokens = []
-        if not text:
-            return tokens
-        wscmd = WsCommand(None, service_manager=self.service_manager)
-        try:
-            ws_tokens = tokenize(text)
-            wscmd.parse(ws_tokens)
-        except Exception as e:
-            # TODO: specify exception type
-            pass
-        position = 0
-        for ws_token in ws_tokens:
-            if ws_token.position > position:
-                tokens.append((pygment_token.Whitespace, text[position:ws_token.position]))
-            token_type = pygment_token.Generic
-            if ws_token.tokentype == TokenType.Service:
-                token_type = pygment_token.Keyword
-            elif ws_token.tokentype == TokenType.Flag:
-                token_type = pygment_token.Number
-            elif ws_token.tokentype == TokenType.OptionName:
-                token_type = pygment_token.Literal
-            elif ws_token.tokentype == TokenType.Command:
-                token_type = pygment_token.Operator
-
-            tokens.append((token_type, ws_token.text))
-            position = ws_token.position + len(ws_token.text)
-        if len(text) > position:
-                tokens.append((pygment_token.Whitespace, text[position:]))
-        return tokens
+        self._http = http
+        self.files = files or []  # ws.upload.UploadFile list, from --file options
+        # archive directories and latency from --record and --replay options (see ws.archive)
+        self.record = record
+        self.replay = replay
+        self.replay_latency = replay_latency
+        self.fields = fields  # field paths from --fields (see ws.jsonstream)
+        self.output = output  # format of records from --output (see ws.output)
+        # in pipeline, ws.pipeline.PipeReader of previous stage output
+        # and ws.pipeline.Pipe to next stage
+        self.input = input
+        self.pipe = pipe
+
+    @property
+    def http(self):
+        """
+        ws.http.SessionManager used by services,
+        process-wide one (or one shared by commands recording
+        or replaying the same archive), unless given explicitly.
+        """
+        if self._http is None:
+            from .http import get_session_manager
+            self._http = get_session_manager(self.record, self.replay, self.replay_latency)
+        return self._http
 
 
 class WsCommand(Command):
 
-    def __init__(self, *args, service_manager=None, **kwargs):
+    def __init__(self, *args, service_manager=None, env=None, **kwargs):
         self.service_manager = service_manager
         self.service = None
+        self.env = env or Env()
         super().__init__(*args, **kwargs)
 
     def available_flags(self):
@@ -227,18 +179,52 @@ class WsCommand(Command):
             Flag('V', 'version', help='display version number'),
         ]
 
+    def available_options(self):
+        return [
+            Option(None, 'file', nargs=2, multiple=True,
+                   help='REMOTENAME LOCALNAME: send local file (- for stdin) to service, can be repeated'),
+            Option(None, 'record', help='DIR: save http requests and responses of service to archive in DIR'),
+            Option(None, 'replay', help='DIR: answer http requests of service from archive saved with --record'),
+            Option(None, 'replay-latency', default=0, type=float, help='MS: delay every replayed response'),
+            Option(None, 'fields', multiple=True,
+                   help='FIELD,...: output only given fields of records (like name,owner.login), can be repeated'),
+            Option(None, 'select', canonical='fields', multiple=True, help='the same as --fields'),
+            Option(None, 'output', help='FORMAT: write records as jsonl, csv, tsv or table'),
+            Option(None, 'profile', flag_value='table',
+                   help='time phases of the run and print them to stderr, --profile=jsonl prints json line, '
+                        '--profile=cprofile saves cProfile stats to ws.pstats'),
+        ]
+
     def available_commands(self):
         return commands.top_level_commands
 
     def parse_unknown(self, tokens):
         if self.service_manager.has_service(tokens[0].text):
             service_class = self.service_manager.get_service(tokens[0].text)
-            self.service = service_class(env=None)
+            if self.options['file']:
+                from .upload import UploadFile
+                self.env.files = [UploadFile(name, path) for name, path in self.options['file']]
+            if self.options['replay']:
+                from .archive import check_archive
+                check_archive(self.options['replay'])
+            if self.options['record'] or self.options['replay']:
+                self.env.record = self.options['record']
+                self.env.replay = self.options['replay']
+                self.env.replay_latency = float(self.options['replay-latency']) / 1000
+            if self.options['fields']:
+                from .jsonstream import parse_fields
+                self.env.fields = parse_fields(self.options['fields'])
+            if self.options['output']:
+                from .output import FORMATS
+                if self.options['output'] not in FORMATS:
+                    raise Exception('unknown output format: {} (use one of: {})'.format(
+                        self.options['output'], ', '.join(FORMATS)))
+                self.env.output = self.options['output']
+            self.service = service_class(env=self.env)
             tokens[0].tokentype = TokenType.Service
-            if len(tokens) > 1:
-                return self.service.parse(tokens[1:])
+            return self.service.parse(tokens, 1)
         else:
-            raise Exception('unknown command or service: '.format(tokens[0].text))
+            raise Exception('unknown command or service: {}'.format(tokens[0].text))
 
     def run(self):
         if self.flags['help']:
@@ -247,10 +233,17 @@ class WsCommand(Command):
         elif self.flags['version']:
             print(VERSION_STR)
             quit(msg=None)
-        elif self.command:
-            self.command.run()
-        elif self.service:
-            self.service.run()
+        elif self.command or self.service:
+            target = (self.command or self.service).resolve()
+            if target.leaf().arun is not None:
+                from . import aio
+                result = aio.run(aio.run_command(target))
+            else:
+                result = target.run()
+            if result is not None:
+                from .output import write_result
+                if not write_result(result, format=self.env.output, fields=self.env.fields):
+                    quit(msg=None, exitcode=1)
         else:
             self.run_shell()
 
@@ -258,29 +251,5 @@ class WsCommand(Command):
         """
         Run interactive shell
         """
-        print('Welcome to ws shell (v{}) '.format(VERSION_STR))
-        print('type :help for help, type :q or press ^D to quit')
-        setup_user_directories()
-        histfile = os.path.join(os.path.expanduser("~/.ws"), "history")
-        history = FileHistory(histfile)
-        prompt = 'ws: '
-        completer = WsCompleter()
-
-        while True:
-            try:
-                line = get_input(
-                    prompt,
-                    history=history,
-                    validator=WsCmdValidator(self.service_manager),
-                    completer=completer,
-                    lexer=WsLexer(self.service_manager)
-                ).strip()
-            except EOFError:
-                quit()
-            wscmd = WsCommand(None, service_manager=self.service_manager)
-            try:
-                wscmd.parse(tokenize(line))
-                wscmd.run()
-            except Exception as e:
-                print('error: ' + repr(e), file=sys.stderr)
-                traceback.print_exc(file=sys.stderr)
+        from .shell import run_shell
+        run_shell(self.service_manager)
@@ -0,0 +1,103 @@
+"""
+Asyncio execution engine.
+
+Commands may implement `async def arun(self)` instead of (or next to) run().
+Such commands run natively in event loop, while plain synchronous
+commands run on a shared thread pool, so any mix of them can be
+executed concurrently from one loop (see :batch).
+
+Blocking calls, like http requests made through pooled sessions,
+can be awaited with to_thread(), or through ws.http.AsyncSession.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import functools
+import threading
+
+MAX_WORKERS = 256
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """
+    Return process-wide thread pool running synchronous code for event loops.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=MAX_WORKERS, thread_name_prefix='ws-aio')
+    return _executor
+
+
+async def to_thread(func, *args, **kwargs):
+    """
+    Run func in thread pool, in a copy of current context.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor(), functools.partial(context.run, func, *args, **kwargs))
+
+
+def is_async(command):
+    return command.leaf().arun is not None
+
+
+async def run_command(command):
+    """
+    Run parsed command (and its subcommands), natively if innermost command
+    is asynchronous, otherwise in thread pool.
+    """
+    command = command.resolve()
+    if is_async(command):
+        return await command.leaf().arun()
+    return await to_thread(command.run)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def bounded(jobs, concurrency, ordered=True):
+    """
+    Run coroutine functions from jobs iterable, at most concurrency at once,
+    and yield their results - in order of jobs, or as they complete
+    when ordered is False.
+
+    jobs is consumed lazily (in thread pool, as reading it may block),
+    so it can be an endless stream.
+    """
+    jobs = iter(jobs)
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = collections.deque()
+
+    async def limited(job):
+        async with semaphore:
+            return await job()
+
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency * 2:
+                job = await to_thread(next, jobs, None)
+                if job is None:
+                    exhausted = True
+                else:
+                    pending.append(asyncio.ensure_future(limited(job)))
+            if not pending:
+                return
+            if ordered:
+                yield await pending.popleft()
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in [task for task in pending if task in done]:
+                    pending.remove(task)
+                    yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,216 @@
+"""
+Recording HTTP exchanges to archive and replaying them from it.
+
+Archive is a directory with two files: index.jsonl, a line of json
+per exchange (request, response status and headers, body position),
+and bodies, with response bodies one after another. Bodies are stored
+decoded, as services read them, and streamed ones are recorded
+as they are read, up to the point where reading stopped.
+
+Replayed responses are matched by method, url and request body.
+Requests repeated when recording get their responses in recorded order,
+the last one is served again once they run out.
+
+Several processes can record to the same archive at once, appends
+are serialized with a lock on bodies file. Archive being replayed
+is loaded again when its index changes.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+
+from .cache import SKIP_HEADERS
+from .utils import resolve_path
+
+INDEX_FILE = 'index.jsonl'
+BODIES_FILE = 'bodies'
+# not saved, to keep credentials out of archives
+SECRET_HEADERS = ('authorization', 'cookie', 'proxy-authorization')
+
+
+def body_hash(body):
+    """
+    Return hash of request body, None for no body or streamed one.
+    """
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if not isinstance(body, bytes):
+        return None
+    return hashlib.sha1(body).hexdigest()
+
+
+def check_archive(path):
+    """
+    Raise exception if there is no archive to replay in path.
+    """
+    path = resolve_path(path)
+    if not all(os.path.isfile(os.path.join(path, name)) for name in (INDEX_FILE, BODIES_FILE)):
+        raise Exception('no archive to replay in {} (save one with --record)'.format(path))
+
+
+def exchange_key(method, url, body):
+    return '{} {} {}'.format(method, url, body or '')
+
+
+class TeeRaw:
+    """
+    Wrapper of response.raw passing body to done(body, complete)
+    once it is read whole or response is closed.
+    """
+
+    def __init__(self, raw, done):
+        self.raw = raw
+        self.done = done
+        self.chunks = []
+        self.finished = False
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        for chunk in self.raw.stream(amt, decode_content=decode_content):
+            self.chunks.append(chunk)
+            yield chunk
+        self.finish(True)
+
+    def read(self, amt=None, *args, **kwargs):
+        data = self.raw.read(amt, *args, **kwargs)
+        if data:
+            self.chunks.append(data)
+        if not data or amt is None:
+            self.finish(True)
+        return data
+
+    def close(self):
+        self.finish(False)
+        self.raw.close()
+
+    def finish(self, complete):
+        if not self.finished:
+            self.finished = True
+            self.done(b''.join(self.chunks), complete)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class Recorder:
+    """
+    Append exchanges to archive in path.
+    """
+
+    def __init__(self, path):
+        self.path = resolve_path(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.index = open(os.path.join(self.path, INDEX_FILE), 'a')
+        self.bodies = open(os.path.join(self.path, BODIES_FILE), 'ab')
+        self.lock = threading.Lock()
+
+    def record(self, request, response):
+        """
+        Arrange for exchange to be saved when response body is read.
+        """
+        def done(body, complete):
+            self.write(request, response, body, complete)
+
+        if response._content not in (False, None):
+            # already read, by response cache
+            done(response._content, True)
+        else:
+            response.raw = TeeRaw(response.raw, done)
+        return response
+
+    def write(self, request, response, body, complete):
+        entry = {
+            'method': request.method,
+            'url': request.url,
+            'request_headers': dict((name, value) for name, value in request.headers.items()
+                                    if name.lower() not in SECRET_HEADERS),
+            'request_body': body_hash(request.body),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict((name, value) for name, value in response.headers.items()
+                            if name.lower() not in SKIP_HEADERS),
+            'length': len(body),
+            'complete': complete,
+            'elapsed': response.elapsed.total_seconds(),  # until headers were received
+        }
+        with self.lock:
+            fcntl.flock(self.bodies.fileno(), fcntl.LOCK_EX)
+            try:
+                # other writers may have appended since
+                entry['offset'] = os.fstat(self.bodies.fileno()).st_size
+                self.bodies.write(body)
+                self.bodies.flush()
+                self.index.write(json.dumps(entry) + '\n')
+                self.index.flush()
+            finally:
+                fcntl.flock(self.bodies.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        with self.lock:
+            self.index.close()
+            self.bodies.close()
+
+
+class Archive:
+    """
+    Recorded exchanges loaded for replay.
+    """
+
+    def __init__(self, path):
+        check_archive(path)
+        self.path = resolve_path(path)
+        self.index_path = os.path.join(self.path, INDEX_FILE)
+        self.exchanges = {}
+        self.served = {}
+        self.bodies = None
+        self.stamp = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def index_stamp(self):
+        stat = os.stat(self.index_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """
+        Read index and open bodies. Called with lock held (or before it is needed).
+        """
+        stamp = self.index_stamp()
+        exchanges = {}
+        with open(self.index_path) as f:
+            for line in f:
+                entry = json.loads(line)
+                key = exchange_key(entry['method'], entry['url'], entry['request_body'])
+                exchanges.setdefault(key, []).append(entry)
+        bodies = os.open(os.path.join(self.path, BODIES_FILE), os.O_RDONLY)
+        if self.bodies is not None:
+            os.close(self.bodies)
+        self.exchanges = exchanges
+        self.served = dict((key, self.served.get(key, 0)) for key in exchanges)
+        self.bodies = bodies
+        self.stamp = stamp
+
+    def find(self, request):
+        """
+        Return (entry, body) recorded for request, or None.
+        """
+        key = exchange_key(request.method, request.url, body_hash(request.body))
+        with self.lock:
+            try:
+                if self.index_stamp() != self.stamp:
+                    self.load()
+            except OSError:
+                # archive removed, keep serving what was loaded
+                pass
+            entries = self.exchanges.get(key)
+            if not entries:
+                return None
+            entry = entries[min(self.served[key], len(entries) - 1)]
+            self.served[key] += 1
+            # under lock, as load() replaces file descriptor
+            return entry, os.pread(self.bodies, entry['length'], entry['offset'])
+
+    def close(self):
+        with self.lock:
+            os.close(self.bodies)
@@ -0,0 +1,346 @@
+"""
+HTTP response cache stored in ~/.ws/cache/http.
+
+Entries are keyed by method, url (including query parameters),
+credentials and Accept header of request, and stored one per file.
+Entry of response with Vary header is served only to requests with the
+same values of headers it names (Vary: * is not stored). Each file
+holds a line of json metadata
+followed by response body. Files are touched on every hit and the least
+recently used ones are removed when cache grows over max_size.
+
+Freshness follows Cache-Control (max-age, no-cache, no-store) and Expires
+headers, unless service overrides it with cache_ttl. Stale entries with
+ETag or Last-Modified are revalidated with conditional requests.
+"""
+import atexit
+import email.utils
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_DIR = '~/.ws/cache/http'
+MAX_SIZE = 256 * 1024 * 1024
+MAX_ENTRY_SIZE = 8 * 1024 * 1024
+STATS_FILE = 'stats.json'
+# headers describing encoded body, we store decoded one
+SKIP_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def parse_http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers, now):
+    """
+    Return for how many seconds response with given headers
+    can be served without revalidation.
+    """
+    cache_control = parse_cache_control(headers.get('cache-control'))
+    if 'no-cache' in cache_control:
+        return 0
+    if cache_control.get('max-age'):
+        try:
+            return int(cache_control['max-age'])
+        except ValueError:
+            return 0
+    expires = parse_http_date(headers.get('expires'))
+    if expires is not None:
+        date = parse_http_date(headers.get('date')) or now
+        return max(0, expires - date)
+    return 0
+
+
+def vary_headers(headers):
+    """
+    Return lowercase names of request headers listed in Vary header
+    of response with given (lowercase) headers.
+    """
+    return [name.strip().lower() for name in headers.get('vary', '').split(',') if name.strip()]
+
+
+def vary_values(headers, request_headers):
+    """
+    Return dict of values of request headers response varies by.
+    """
+    return dict((name, request_headers.get(name)) for name in vary_headers(headers))
+
+
+class Entry:
+
+    def __init__(self, meta, body):
+        self.meta = meta
+        self.body = body
+
+    @property
+    def headers(self):
+        return self.meta['headers']
+
+    def matches(self, request_headers):
+        """
+        Tell if entry can answer request with given headers
+        (has the same values of headers named in Vary).
+        """
+        return all(request_headers.get(name) == value for name, value in self.meta.get('vary', {}).items())
+
+    def is_fresh(self, now, ttl=None):
+        lifetime = ttl if ttl is not None else self.meta['lifetime']
+        return now - self.meta['stored'] < lifetime
+
+    def validators(self):
+        """
+        Return headers for conditional request revalidating this entry.
+        """
+        headers = {}
+        if 'etag' in self.headers:
+            headers['If-None-Match'] = self.headers['etag']
+        if 'last-modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['last-modified']
+        return headers
+
+
+class ResponseCache:
+
+    def __init__(self, path=CACHE_DIR, max_size=MAX_SIZE, max_entry_size=MAX_ENTRY_SIZE):
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.max_entry_size = max_entry_size
+        self.size = None  # total size of entries, computed on first store
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stored': 0, 'evicted': 0}
+        self.stats_registered = False
+
+    @staticmethod
+    def key(method, url, credentials=None, accept=None):
+        data = '\n'.join([method.upper(), url, credentials or '', accept or ''])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+            if not self.stats_registered:
+                self.stats_registered = True
+                atexit.register(self.save_stats)
+
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline().decode('utf-8'))
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        try:
+            # mtime tracks last use, for LRU eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return Entry(meta, body)
+
+    def cacheable(self, headers, ttl=None, streamed=False):
+        """
+        Return True if response with given (lowercase) headers is worth storing.
+        For streamed responses body size must be known upfront.
+        """
+        cache_control = parse_cache_control(headers.get('cache-control'))
+        if 'no-store' in cache_control or '*' in vary_headers(headers):
+            return False
+        length = headers.get('content-length')
+        if length is None or not length.isdigit():
+            if streamed:
+                return False
+        elif int(length) > self.max_entry_size:
+            return False
+        if ttl is None and 'etag' not in headers and 'last-modified' not in headers:
+            return freshness_lifetime(headers, time.time()) > 0
+        return True
+
+    def put(self, key, status, reason, headers, body, now=None, vary=None):
+        """
+        Store response. headers should be a dict with lowercase names,
+        vary dict of request headers named in Vary (see vary_values).
+        """
+        if len(body) > self.max_entry_size:
+            return None
+        now = now or time.time()
+        headers = dict((name, value) for name, value in headers.items() if name not in SKIP_HEADERS)
+        meta = {
+            'status': status,
+            'reason': reason,
+            'headers': headers,
+            'stored': now,
+            'lifetime': freshness_lifetime(headers, now),
+        }
+        if vary:
+            meta['vary'] = vary
+        entry = Entry(meta, body)
+        self.write(key, entry)
+        self.count('stored')
+        return entry
+
+    def refresh(self, key, entry, headers, now=None):
+        """
+        Update entry after server confirmed it is still valid (304 response).
+        """
+        now = now or time.time()
+        entry.headers.update(
+            (name, value) for name, value in headers.items() if name not in SKIP_HEADERS)
+        entry.meta['stored'] = now
+        entry.meta['lifetime'] = freshness_lifetime(entry.headers, now)
+        self.write(key, entry)
+        self.count('revalidated')
+
+    def write(self, key, entry):
+        path = self.entry_path(key)
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        data = json.dumps(entry.meta).encode('utf-8') + b'\n' + entry.body
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self.account(len(data) - old_size)
+
+    def entries(self):
+        """
+        Yield (path, size, mtime) of all cache entries.
+        """
+        try:
+            subdirs = os.scandir(self.path)
+        except OSError:
+            return
+        with subdirs:
+            for subdir in subdirs:
+                if not subdir.is_dir():
+                    continue
+                with os.scandir(subdir.path) as files:
+                    for entry in files:
+                        if entry.name.endswith('.tmp'):
+                            continue
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime
+
+    def account(self, delta):
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+            else:
+                self.size += delta
+            over_limit = self.size > self.max_size
+        if over_limit:
+            self.evict()
+
+    def evict(self, target=None):
+        """
+        Remove least recently used entries until cache size is below target
+        (90% of max_size by default).
+        """
+        if target is None:
+            target = self.max_size * 0.9
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self.count('evicted')
+        with self.lock:
+            self.size = total
+
+    def purge(self):
+        self.evict(target=0)
+
+    def stats_path(self):
+        return os.path.join(self.path, STATS_FILE)
+
+    def load_stats(self):
+        try:
+            with open(self.stats_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_stats(self):
+        """
+        Add counters of this process to totals in stats file.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            for name in self.counters:
+                self.counters[name] = 0
+        if not any(counters.values()):
+            return
+        stats = self.load_stats()
+        for name, value in counters.items():
+            stats[name] = stats.get(name, 0) + value
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.stats_path(), 'w') as f:
+                json.dump(stats, f)
+        except OSError:
+            pass
+
+    def stats(self):
+        """
+        Return dict with entry count, total size and hit/miss counters.
+        """
+        self.save_stats()
+        entries = list(self.entries())
+        stats = dict.fromkeys(self.counters, 0)
+        stats.update(self.load_stats())
+        stats['entries'] = len(entries)
+        stats['size'] = sum(size for _, size, _ in entries)
+        stats['max_size'] = self.max_size
+        return stats
+
+    def reset_stats(self):
+        with self.lock:
+            for name in self.counters:
+                self.counters[name] = 0
+        try:
+            os.unlink(self.stats_path())
+        except OSError:
+            pass
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Return process-wide ResponseCache.
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
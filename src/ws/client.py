@@ -0,0 +1,145 @@
+"""
+Thin client for ws daemon.
+
+Kept free of heavy imports: it runs on every ws invocation,
+before we know whether the command will execute in this process at all.
+Importing it still imports the ws package (command line parser and
+built-in commands, needed anyway when command runs in this process),
+but not services, requests or prompt_toolkit.
+
+Wire protocol (over unix socket):
+
+    client sends one line of json: {"argv": [...], "cwd": "...", "stdin": bool}
+    followed by raw standard input, if "stdin" is true,
+    then shuts down its writing side.
+
+    daemon replies with frames: one byte frame type, 4 bytes big-endian
+    payload length and payload. Frame types:
+
+        o - standard output data
+        e - standard error data
+        x - exit status (ascii digits), always the last frame
+"""
+import json
+import os
+import socket
+import struct
+import sys
+
+FRAME_HEADER = struct.Struct('>cI')
+STDOUT, STDERR, EXIT = b'o', b'e', b'x'
+
+# commands that must run in calling process
+LOCAL_COMMANDS = (':daemon',)
+
+
+def socket_path():
+    return os.environ.get('WS_DAEMON_SOCKET') or os.path.expanduser('~/.ws/daemon.sock')
+
+
+def connect():
+    """
+    Return socket connected to running daemon, or None.
+    """
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def send_request(sock, request, stdin=None):
+    """
+    Send request header, then copy stdin file descriptor (if given)
+    to daemon in background.
+    """
+    sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+    if stdin is None:
+        sock.shutdown(socket.SHUT_WR)
+    else:
+        # copy stdin in background, so that daemon output
+        # can be streamed back before all input is consumed
+        import threading
+        thread = threading.Thread(target=_send_stream, args=(sock, stdin), daemon=True)
+        thread.start()
+
+
+def _send_stream(sock, fd):
+    # reading file descriptor directly rather than sys.stdin:
+    # buffered streams can't be left blocked in a daemon thread
+    # while interpreter shuts down
+    try:
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            sock.sendall(chunk)
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        # daemon finished without reading all of the input
+        pass
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('ws daemon closed connection')
+        data += chunk
+    return bytes(data)
+
+
+def read_frames(sock):
+    """
+    Yield (frame type, payload) pairs until exit frame is received.
+    """
+    while True:
+        frame_type, length = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+        payload = _recv_exact(sock, length) if length else b''
+        yield frame_type, payload
+        if frame_type == EXIT:
+            return
+
+
+def forward(argv):
+    """
+    Run command in ws daemon, if one is running.
+
+    Return exit status, or None if command should be executed
+    in current process instead.
+    """
+    if not argv or argv[0] in LOCAL_COMMANDS or os.environ.get('WS_NO_DAEMON'):
+        return None
+    if any(arg == '--profile' or arg.startswith('--profile=') for arg in argv):
+        # profile this process, not daemon
+        return None
+    sock = connect()
+    if sock is None:
+        return None
+    stdin = None
+    if sys.stdin is not None and not sys.stdin.isatty():
+        stdin = sys.stdin.fileno()
+    outputs = {STDOUT: sys.stdout.buffer, STDERR: sys.stderr.buffer}
+    try:
+        send_request(sock, {'argv': argv, 'cwd': os.getcwd(), 'stdin': stdin is not None}, stdin)
+        for frame_type, payload in read_frames(sock):
+            if frame_type == EXIT:
+                return int(payload)
+            try:
+                outputs[frame_type].write(payload)
+                outputs[frame_type].flush()
+            except BrokenPipeError:
+                # reader of our output went away (ws ... | head)
+                os.dup2(os.open(os.devnull, os.O_WRONLY), outputs[frame_type].fileno())
+                return 1
+    except ConnectionError as e:
+        print('ws daemon: {}'.format(e), file=sys.stderr)
+        return 1
+    finally:
+        sock.close()
@@ -1,5 +1,11 @@
-from .parse import Command, ArgumentDefinition
-from .utils import quit
+import functools
+import os
+import re
+import shlex
+import sys
+
+from .parse import Command, ArgumentDefinition, Flag, Option
+from .utils import quit, resolve_path
 
 
 class Quit(Command):
@@ -26,7 +32,7 @@ class Help(Command):
         else:
             line += option.longname
         line += ' ' + option.help
-        line += ' defaults to: ' + option.default
+        line += ' defaults to: ' + str(option.default)
         return line
 
     def flag_help(self, flag):
@@ -100,6 +106,287 @@ class Alias(Command):
 
 class BinAlias(Command):
     name = ':binalias'
+    description = 'create executable in ~/.ws/bin calling ws with given service'
+
+    def argument_definition(self):
+        return ArgumentDefinition(help='SERVICE NAME', min_amount=2, max_amount=2)
+
+    def run(self):
+        from . import BASEDIR, setup_user_directories
+        service, name = self.arguments
+        setup_user_directories()
+        ws_path = os.path.realpath(os.path.join(BASEDIR, '..', '..', 'ws'))
+        path = os.path.join(os.path.expanduser('~/.ws/bin'), name)
+        with open(path, 'w') as f:
+            # ws itself forwards to daemon when one is running
+            f.write('#!/bin/sh\nexec {} {} "$@"\n'.format(shlex.quote(ws_path), shlex.quote(service)))
+        os.chmod(path, 0o755)
+        print('created ' + path)
+
+
+class Batch(Command):
+    name = ':batch'
+    description = 'run ws commands from FILE (or stdin if FILE is -), one per line'
+
+    def available_flags(self):
+        return [
+            Flag('u', 'unordered', help='write output of commands as they finish, not in input order'),
+            Flag('s', 'status', help='report exit status of every line on stderr'),
+        ]
+
+    def available_options(self):
+        return [Option('j', 'jobs', help='amount of commands to run at once', default=4, type=int)]
+
+    def argument_definition(self):
+        return ArgumentDefinition(help='FILE', min_amount=1, max_amount=1)
+
+    def read_lines(self):
+        if self.arguments[0] == '-':
+            yield from sys.stdin
+        else:
+            with open(resolve_path(self.arguments[0])) as f:
+                yield from f
+
+    def jobs(self):
+        from .runner import acapture
+        from .tokenize import tokenize
+        service_manager = self.parent.service_manager
+        for line_number, line in enumerate(self.read_lines(), 1):
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield functools.partial(self.run_line, acapture, tokenize(line), service_manager, line_number)
+
+    @staticmethod
+    async def run_line(acapture, tokens, service_manager, line_number):
+        return (line_number,) + await acapture(tokens, service_manager)
+
+    async def arun(self):
+        from .aio import bounded
+        failed = 0
+        results = bounded(self.jobs(), int(self.options['jobs']), ordered=not self.flags['unordered'])
+        async for line_number, exitcode, out, err in results:
+            sys.stdout.write(out)
+            sys.stderr.write(err)
+            if exitcode:
+                failed += 1
+            if exitcode or self.flags['status']:
+                print('line {}: exit status {}'.format(line_number, exitcode), file=sys.stderr)
+        if failed:
+            quit(msg=None, exitcode=1)
+
+
+PLACEHOLDER = '{}'
+# {} or {field}, {field.subfield} of record
+PLACEHOLDERS = re.compile(r'\{([\w.-]*)\}')
+
+
+def item_text(item):
+    """
+    Return text substituted for {}: item itself when it is a line,
+    value of single-field record, or record as json.
+    """
+    from .output import row_values
+    while isinstance(item, dict) and len(item) == 1:
+        item = next(iter(item.values()))
+    if isinstance(item, str):
+        return item
+    value = row_values({'value': item}, [('value',)])[0]
+    return '' if value is None else str(value)
+
+
+def field_text(item, field):
+    """
+    Return text of dotted field of record, empty if it is missing.
+    """
+    from .output import row_values
+    value = row_values(item, [tuple(field.split('.'))])[0]
+    return '' if value is None else str(value)
+
+
+def item_label(item, fields=()):
+    """
+    Return text identifying item in prefixed output and errors:
+    the line itself, values of fields substituted for placeholders
+    when item is a record, or value of its first field (like name)
+    when there are no {field} placeholders.
+    """
+    if isinstance(item, str):
+        return item
+    if fields:
+        return ' '.join(field_text(item, field) for field in fields)
+    while isinstance(item, dict) and item:
+        item = next(iter(item.values()))
+    return item_text(item)
+
+
+def substitute(value, item):
+    """
+    Replace {} with item in parsed option or argument value,
+    and {field} with its field, when item is a record.
+    """
+    if isinstance(value, str):
+        if isinstance(item, str):
+            return value.replace(PLACEHOLDER, item)
+
+        def replace(match):
+            field = match.group(1)
+            return field_text(item, field) if field else item_text(item)
+        return PLACEHOLDERS.sub(replace, value)
+    elif isinstance(value, (list, tuple)):
+        return type(value)(substitute(element, item) for element in value)
+    return value
+
+
+class Map(Command):
+    name = ':map'
+    description = ('run COMMAND once for every line of FILE (or stdin), with {} replaced by the line '
+                   '(and {field} by field of records from pipeline)')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.template = None
+        self.fields = []  # fields of {field} placeholders in template
+
+    def available_flags(self):
+        return [
+            Flag('u', 'unordered', help='write output of commands as they finish, not in input order'),
+            Flag('p', 'prefix', help='prefix every output line with value it was produced for '
+                                     '(values of {field} placeholders, or first field, for records)'),
+        ]
+
+    def available_options(self):
+        return [
+            Option('e', 'each', help='FILE with one value per line, - for stdin', default='-'),
+            Option('j', 'jobs', help='amount of commands to run at once', default=4, type=int),
+        ]
+
+    def parse_unknown(self, tokens):
+        # the rest is command to run, parsed once into template;
+        # without {} in it, values are given as its last argument
+        from . import WsCommand
+        from .tokenize import Token
+        for token in tokens:
+            for field in PLACEHOLDERS.findall(token.text):
+                if field and field not in self.fields:
+                    self.fields.append(field)
+        if not any(PLACEHOLDERS.search(token.text) for token in tokens):
+            tokens = tokens + [Token(PLACEHOLDER, tokens[-1].end + 1)]
+        self.template = WsCommand(None, service_manager=self.parent.service_manager, env=self.parent.env)
+        self.template.parse(tokens)
+
+    def read_values(self):
+        if self.options['each'] == '-':
+            env = self.parent.env
+            if env is not None and env.input is not None:
+                # records of previous pipeline stage, as they are
+                yield from self.values(env.input.records())
+                return
+            # stdin is not ours to close
+            yield from self.values(sys.stdin)
+        else:
+            with open(resolve_path(self.options['each'])) as f:
+                yield from self.values(f)
+
+    @staticmethod
+    def values(items):
+        for item in items:
+            if isinstance(item, str):
+                item = item.strip()
+                if not item:
+                    continue
+            yield item
+
+    def instantiate(self, command, parent, item):
+        """
+        Return copy of parsed template command (with its subcommands),
+        with item substituted for placeholders.
+        """
+        from .lineparser import copy_command
+        clone = copy_command(command, parent)
+        clone.options = {name: substitute(value, item) for name, value in command.options.items()}
+        clone.arguments = substitute(command.arguments, item)
+        child = command.command or getattr(command, 'service', None)
+        if child is not None:
+            self.instantiate(child, clone, item)
+        return clone
+
+    def jobs(self):
+        for item in self.read_values():
+            yield functools.partial(self.run_item, self.instantiate(self.template, None, item),
+                                    item_label(item, self.fields))
+
+    @staticmethod
+    async def run_item(wscmd, label):
+        from .runner import arun, capture
+        return (label,) + await capture(arun(wscmd))
+
+    def prefixed(self, label, text):
+        if not self.flags['prefix'] or not text:
+            return text
+        return ''.join(label + '\t' + line for line in text.splitlines(True))
+
+    async def arun(self):
+        from .aio import bounded
+        if self.template is None:
+            quit('missing command to run', exitcode=1)
+        failed = 0
+        results = bounded(self.jobs(), int(self.options['jobs']), ordered=not self.flags['unordered'])
+        async for label, exitcode, out, err in results:
+            sys.stdout.write(self.prefixed(label, out))
+            sys.stderr.write(self.prefixed(label, err))
+            if exitcode:
+                failed += 1
+                print('{}: exit status {}'.format(label, exitcode), file=sys.stderr)
+        if failed:
+            quit(msg=None, exitcode=1)
+
+
+class Cache(Command):
+    name = ':cache'
+    description = 'show http cache statistics or purge it'
+
+    def available_flags(self):
+        return [Flag('p', 'purge', help='remove all cached responses')]
+
+    def run(self):
+        from .cache import get_response_cache
+        cache = get_response_cache()
+        if self.flags['purge']:
+            cache.purge()
+            cache.reset_stats()
+            print('cache purged')
+            return
+        stats = cache.stats()
+        print('Http cache ({}):'.format(cache.path))
+        print('   entries: {}'.format(stats['entries']))
+        print('   size: {:.1f} of {:.1f} MB'.format(stats['size'] / 1048576, stats['max_size'] / 1048576))
+        for name in ('hits', 'misses', 'revalidated', 'stored', 'evicted'):
+            print('   {}: {}'.format(name, stats[name]))
+        self.print_rate_limits()
+        self.print_single_flight()
+
+    @staticmethod
+    def print_single_flight():
+        from .singleflight import get_single_flight
+        stats = get_single_flight().stats
+        print('Request coalescing (this process):')
+        print('   misses: {}, joined in flight: {}, memo hits: {}, not shared: {}'.format(
+            stats['misses'], stats['joined'], stats['hits'], stats['unshared']))
+
+    @staticmethod
+    def print_rate_limits():
+        import time
+        from .ratelimit import get_rate_limiter
+        limiter = get_rate_limiter()
+        stats = limiter.stats
+        print('Rate limiting (this process):')
+        print('   requests: {}, delayed: {}, waited: {:.1f}s, retries: {}'.format(
+            stats['requests'], stats['delayed'], stats['waited'], stats['retries']))
+        for bucket in list(limiter.buckets.values()):
+            if bucket.limit is not None:
+                reset = max(0, (bucket.reset or 0) - time.time())
+                print('   {}: {:.0f} of {:.0f} left, resets in {:.0f}s'.format(
+                    bucket.name, bucket.tokens, bucket.limit, reset))
 
 
 class Commands(Command):
@@ -121,6 +408,45 @@ class Commands(Command):
             print('  ', command.name, command.description)
 
 
+class Daemon(Command):
+    name = ':daemon'
+    description = 'run ws daemon, making subsequent ws calls faster'
+
+    def available_flags(self):
+        return [Flag('s', 'stop', help='stop running daemon')]
+
+    def run(self):
+        from . import daemon
+        if self.flags['stop']:
+            if not daemon.stop():
+                quit('ws daemon is not running', exitcode=1)
+        else:
+            daemon.serve(self.parent.service_manager)
+
+
+class Search(Command):
+    name = ':search'
+    description = 'search services by name, description and commands'
+
+    def available_flags(self):
+        return [Flag('u', 'update', help='check every service for changes before searching')]
+
+    def available_options(self):
+        return [Option('n', 'results', help='amount of results to show', default=10, type=int)]
+
+    def argument_definition(self):
+        return ArgumentDefinition(help='QUERY', min_amount=1)
+
+    def run(self):
+        index = self.parent.service_manager.search_index()
+        index.update(self.parent.service_manager, force=self.flags['update'])
+        results = index.search(' '.join(self.arguments), int(self.options['results']))
+        if not results:
+            print('No services matching {}'.format(' '.join(self.arguments)))
+        for score, name, description in results:
+            print('  ', name, description)
+
+
 class Services(Command):
     name = ':services'
     description = 'list available services'
@@ -133,5 +459,5 @@ class Services(Command):
             print('  ', service.name, service.description)
 
 top_level_commands = [
-    Quit, Help, Alias, BinAlias, Commands, Services
+    Quit, Help, Alias, Batch, BinAlias, Cache, Commands, Daemon, Map, Search, Services
 ]
@@ -0,0 +1,117 @@
+"""
+Shell completion backed by prefix indexes.
+
+Every command class gets a sorted index of words that can follow it:
+its subcommands (with aliases), flags and options. Top level index
+also holds service names. Indexes are built once from command grammar
+(services are described by their index entries, so nothing is imported)
+and queried with binary search, so completion cost doesn't grow
+with amount of candidates.
+"""
+import bisect
+
+MAX_COMPLETIONS = 200
+
+
+class PrefixIndex:
+    """
+    Sorted set of words with descriptions, queried by prefix.
+    """
+
+    def __init__(self, items=()):
+        self.meta = {}
+        self.words = []
+        for word, meta in items:
+            self.meta[word] = meta
+        self.words = sorted(self.meta)
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, word, meta=''):
+        if word not in self.meta:
+            bisect.insort(self.words, word)
+        self.meta[word] = meta
+
+    def remove(self, word):
+        if word in self.meta:
+            del self.meta[word]
+            del self.words[bisect.bisect_left(self.words, word)]
+
+    def complete(self, prefix, limit=MAX_COMPLETIONS):
+        """
+        Return list of (word, description) pairs for words starting with prefix.
+        """
+        result = []
+        idx = bisect.bisect_left(self.words, prefix)
+        while idx < len(self.words) and len(result) < limit and self.words[idx].startswith(prefix):
+            word = self.words[idx]
+            result.append((word, self.meta[word]))
+            idx += 1
+        return result
+
+
+def command_words(command):
+    """
+    Yield (word, description) pairs of everything that can follow
+    command instance on command line.
+    """
+    for cmd in command.available_commands():
+        yield cmd.name, cmd.description or ''
+        for alias in cmd.aliases:
+            yield alias, cmd.description or ''
+    for item in list(command.available_flags()) + list(command.available_options()):
+        if item.shortname:
+            yield '-' + item.shortname, item.help or ''
+        if item.longname:
+            yield '--' + item.longname, item.help or ''
+
+
+class CompletionIndex:
+    """
+    Prefix indexes for all commands (keyed by command class).
+    """
+
+    def __init__(self, service_manager):
+        self.service_manager = service_manager
+        self.indexes = {}
+        self.services = set()
+        self.services_version = None
+
+    def index_for(self, command):
+        index = self.indexes.get(type(command))
+        if index is None:
+            index = self.indexes[type(command)] = PrefixIndex(command_words(command))
+        if command.parent is None:
+            self.update_services(index)
+        return index
+
+    def update_services(self, index):
+        """
+        Add new and remove uninstalled services from top level index.
+        """
+        service_index = self.service_manager.index
+        declarative = self.service_manager.declarative
+        names = service_index.service_names() | declarative.service_names()
+        version = (service_index.version, declarative.version)
+        if version == self.services_version:
+            return
+        for name in self.services - names:
+            index.remove(name)
+        for name in sorted(names - self.services):
+            record = service_index.cached(name)
+            if record is None and declarative.has(name) and not service_index.has(name):
+                try:
+                    record = {'description': declarative.get(name).description}
+                except Exception:
+                    record = None
+            index.add(name, record['description'] if record and record['description'] else 'service')
+        self.services = set(names)
+        self.services_version = version
+
+    def complete(self, command, prefix, limit=MAX_COMPLETIONS):
+        """
+        Return (word, description) pairs that can follow parsed command
+        and start with prefix.
+        """
+        return self.index_for(command).complete(prefix, limit)
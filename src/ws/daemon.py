@@ -0,0 +1,130 @@
+"""
+ws daemon: a warm process executing ws commands on behalf of thin clients.
+
+Services stay imported and http connections stay pooled between calls,
+so repeated invocations skip interpreter startup and connection setup.
+See ws.client for the wire protocol.
+"""
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+
+from .client import EXIT, FRAME_HEADER, STDERR, STDOUT, connect, send_request, read_frames, socket_path
+from .runner import execute
+from .tokenize import argv_tokens
+from .utils import install_context_stdio, redirect_stdio
+
+
+class FrameWriter(io.RawIOBase):
+    """
+    Binary stream sending everything written to it as frames of given type.
+    """
+
+    def __init__(self, wfile, frame_type, lock):
+        self.wfile = wfile
+        self.frame_type = frame_type
+        self.lock = lock
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        with self.lock:
+            self.wfile.write(FRAME_HEADER.pack(self.frame_type, len(data)))
+            self.wfile.write(data)
+            self.wfile.flush()
+        return len(data)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def text_stream(self, frame_type, lock):
+        return io.TextIOWrapper(
+            io.BufferedWriter(FrameWriter(self.wfile, frame_type, lock)),
+            encoding='utf-8', errors='replace')
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        lock = threading.Lock()
+        stdout = self.text_stream(STDOUT, lock)
+        stderr = self.text_stream(STDERR, lock)
+        stdin = io.TextIOWrapper(self.rfile, encoding='utf-8')
+        if request.get('stop'):
+            exitcode = 0
+        elif not request.get('argv'):
+            print('ws daemon: interactive shell is not supported', file=stderr)
+            exitcode = 1
+        else:
+            with redirect_stdio(stdin=stdin, stdout=stdout, stderr=stderr, cwd=request['cwd']):
+                exitcode = execute(argv_tokens(request['argv']), self.server.service_manager)
+        try:
+            stdout.flush()
+            stderr.flush()
+            self.wfile.write(FRAME_HEADER.pack(EXIT, len(str(exitcode))) + str(exitcode).encode('ascii'))
+        except OSError:
+            # client went away
+            pass
+        if request.get('stop'):
+            threading.Thread(target=self.server.shutdown).start()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service_manager):
+        self.service_manager = service_manager
+        super().__init__(path, RequestHandler)
+
+
+def serve(service_manager):
+    """
+    Run daemon in foreground until stopped.
+    """
+    path = socket_path()
+    sock = connect()
+    if sock is not None:
+        sock.close()
+        raise Exception('ws daemon is already running at ' + path)
+    if os.path.exists(path):
+        # left over by daemon that didn't exit cleanly
+        os.unlink(path)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    # import all python services upfront, so that first calls are fast too
+    # (json services have no modules, see ws.services.declarative)
+    for service_name in service_manager.index.all():
+        service_manager.load_service(service_name)
+    install_context_stdio()
+    # socket is created accessible to owner only, no other user
+    # may connect before it could be restricted
+    umask = os.umask(0o177)
+    try:
+        server = Server(path, service_manager)
+    finally:
+        os.umask(umask)
+    print('ws daemon listening on ' + path, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
+def stop():
+    """
+    Ask running daemon to exit. Return False if there was none.
+    """
+    sock = connect()
+    if sock is None:
+        return False
+    try:
+        send_request(sock, {'stop': True})
+        for _ in read_frames(sock):
+            pass
+    finally:
+        sock.close()
+    return True
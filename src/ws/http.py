@@ -0,0 +1,472 @@
+"""
+HTTP support for services.
+
+This module imports requests, so it is imported only by services
+and commands that actually talk to the network.
+
+Services get pooled sessions through SessionManager, available as
+Service.env.http (or via Service.session() shortcut). Connections are kept
+alive between commands run in the same process: in the shell,
+in batch runs and in ws daemon.
+
+Identical GET requests made at the same time (or within MEMO_TTL)
+share one network call, and one decoded json body (see ws.singleflight).
+"""
+import datetime
+import functools
+import io
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+from . import profile
+from .archive import Archive, Recorder
+from .cache import get_response_cache, vary_values
+from .ratelimit import get_rate_limiter
+from .singleflight import MEMO_TTL, get_single_flight
+from .utils import quit, resolve_path
+
+
+def import_requests():
+    """
+    Return requests module, aborting if it is not installed.
+    """
+    try:
+        import requests
+    except ImportError:
+        quit('Cannot find requests library. Please install it,'
+             ' its awesome. Aborting.', exitcode=1)
+    return requests
+
+
+requests = import_requests()
+from requests.adapters import HTTPAdapter  # noqa: E402 (needs requests check above)
+from requests.structures import CaseInsensitiveDict  # noqa: E402
+from requests.utils import get_encoding_from_headers  # noqa: E402
+
+DEFAULT_OPTIONS = {
+    'pool_connections': 4,  # amount of hosts to keep connection pools for
+    'pool_maxsize': 10,  # max connections per host
+    'pool_block': True,  # wait for free connection rather than exceed pool_maxsize
+    'max_retries': 0,
+    'timeout': (3.05, 30),  # connect, read
+    'keep_alive': True,
+    'cache': True,  # use response cache for GET requests
+    'cache_ttl': None,  # seconds, overrides freshness declared by server
+    'rate_limit': True,  # pace requests by rate limit headers, retry limited ones (see ws.ratelimit)
+    'record': None,  # directory to record requests and responses to (see ws.archive)
+    'replay': None,  # directory to replay recorded responses from, instead of using network
+    'replay_latency': 0,  # seconds to wait before replayed response
+    'coalesce': True,  # share one call between identical concurrent GET requests (see ws.singleflight)
+    'memo_ttl': MEMO_TTL,  # seconds to answer identical GET requests with result of previous one
+}
+# streamed responses larger than that (or of unknown size) are not shared,
+# smaller ones are read whole anyway (see ws.pagination.STREAM_MIN_SIZE)
+SHARE_MAX_SIZE = 512 * 1024
+_NOTHING = object()
+
+
+class SharedBody:
+    """
+    Response read whole, to be shared by coalesced requests.
+    """
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.reason = response.reason
+        self.headers = response.headers
+        self.encoding = response.encoding
+        self.content = response.content
+        self.elapsed = response.elapsed
+        self.from_cache = getattr(response, 'from_cache', False)
+        self.json = _NOTHING
+        self.lock = threading.Lock()
+
+    def response(self, request, adapter):
+        response = SharedResponse()
+        response.shared = self
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.encoding = self.encoding
+        response.raw = io.BytesIO(self.content)
+        response._content = self.content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = adapter
+        response.elapsed = self.elapsed
+        response.from_cache = self.from_cache
+        return response
+
+
+class SharedResponse(requests.Response):
+    """
+    Response with body shared by coalesced requests. Its json is decoded
+    once for all of them, so it must not be modified.
+    """
+    shared = None
+
+    def json(self, **kwargs):
+        if kwargs:
+            return super().json(**kwargs)
+        shared = self.shared
+        if shared.json is _NOTHING:
+            with shared.lock:
+                if shared.json is _NOTHING:
+                    shared.json = super().json()
+        return shared.json
+
+
+class WsAdapter(HTTPAdapter):
+    """
+    Transport adapter serving GET requests from ResponseCache when possible,
+    and sending the rest through RateLimiter.
+    Identical GET requests are coalesced by SingleFlight, if given.
+    Responses are saved by Recorder, if given.
+    """
+
+    def __init__(self, cache=None, cache_ttl=None, rate_limiter=None, recorder=None,
+                 single_flight=None, memo_ttl=MEMO_TTL, **kwargs):
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.rate_limiter = rate_limiter
+        self.recorder = recorder
+        self.single_flight = single_flight
+        self.memo_ttl = memo_ttl
+        super().__init__(**kwargs)
+
+    def transmit(self, request, stream=False, **kwargs):
+        """
+        Send request over network.
+        """
+        send = functools.partial(super().send, stream=stream, **kwargs)
+        if self.rate_limiter is not None:
+            send = functools.partial(self.rate_limiter.send, send, host=endpoint_key(request.url))
+        return profile.time_request(send, request)
+
+    def send(self, request, stream=False, **kwargs):
+        if self.single_flight is not None and self.coalescible(request):
+            response = self.single_flight.call(
+                self.flight_key(request), functools.partial(self.fetch_shared, request, stream=stream, **kwargs),
+                self.memo_ttl)
+            if isinstance(response, SharedBody):
+                response = response.response(request, self)
+        else:
+            if self.single_flight is not None and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                # results of reading what this may change are stale
+                self.single_flight.forget(lambda key: key[1].partition('?')[0] == request.url.partition('?')[0])
+            response = self.fetch(request, stream=stream, **kwargs)
+        if self.recorder is not None:
+            response = self.recorder.record(request, response)
+        return response
+
+    @staticmethod
+    def coalescible(request):
+        headers = request.headers
+        return (request.method == 'GET' and request.body is None
+                and 'If-None-Match' not in headers and 'If-Modified-Since' not in headers and 'Range' not in headers
+                and 'no-cache' not in headers.get('Cache-Control', '')
+                and 'no-store' not in headers.get('Cache-Control', ''))
+
+    @staticmethod
+    def flight_key(request):
+        headers = request.headers
+        return (request.method, request.url, headers.get('Authorization'), headers.get('Cookie'),
+                headers.get('Accept'))
+
+    def fetch_shared(self, request, stream=False, **kwargs):
+        """
+        Fetch response for SingleFlight: SharedBody, unless it is
+        streamed and too large to keep in memory.
+        """
+        response = self.fetch(request, stream=stream, **kwargs)
+        if response.status_code >= 500:
+            # likely to be different next time
+            return response, False
+        if stream and response._content is False:
+            length = response.headers.get('Content-Length')
+            if length is None or not length.isdigit() or int(length) > SHARE_MAX_SIZE:
+                return response, False
+        return SharedBody(response), True
+
+    def fetch(self, request, stream=False, **kwargs):
+        if (self.cache is None or request.method != 'GET'
+                or 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+                or 'no-store' in request.headers.get('Cache-Control', '')):
+            return self.transmit(request, stream=stream, **kwargs)
+        cache = self.cache
+        key = cache.key(request.method, request.url, request.headers.get('Authorization'),
+                        request.headers.get('Accept'))
+        with profile.phase('http cache'):
+            entry = cache.get(key)
+        if entry is not None and not entry.matches(request.headers):
+            # response varies by header this request has different
+            entry = None
+        now = time.time()
+        if entry is not None:
+            if 'no-cache' not in request.headers.get('Cache-Control', '') and entry.is_fresh(now, self.cache_ttl):
+                cache.count('hits')
+                return self.cached_response(request, entry)
+            request.headers.update(entry.validators())
+        response = self.transmit(request, stream=stream, **kwargs)
+        if entry is not None and response.status_code == 304:
+            cache.count('hits')
+            cache.refresh(key, entry, self.response_headers(response), now)
+            response.close()
+            return self.cached_response(request, entry)
+        cache.count('misses')
+        if response.status_code == 200:
+            headers = self.response_headers(response)
+            if cache.cacheable(headers, self.cache_ttl, streamed=stream):
+                # reading body here is fine even for stream=True,
+                # cacheable() rejected large ones
+                cache.put(key, response.status_code, response.reason, headers, response.content, now,
+                          vary_values(headers, request.headers))
+        return response
+
+    @staticmethod
+    def response_headers(response):
+        return dict((name.lower(), value) for name, value in response.headers.items())
+
+    def cached_response(self, request, entry):
+        response = requests.Response()
+        response.status_code = entry.meta['status']
+        response.reason = entry.meta['reason']
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(entry.body)
+        response._content = entry.body
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = datetime.timedelta(0)
+        response.from_cache = True
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    Transport adapter answering requests with responses from Archive,
+    without touching network.
+    """
+
+    def __init__(self, archive, latency=0, **kwargs):
+        self.archive = archive
+        self.latency = latency
+        super().__init__(**kwargs)
+
+    def send(self, request, stream=False, **kwargs):
+        return profile.time_request(self.replay, request)
+
+    def replay(self, request):
+        found = self.archive.find(request)
+        if found is None:
+            raise requests.exceptions.ConnectionError(
+                'no recorded response for {} {}'.format(request.method, request.url), request=request)
+        entry, body = found
+        if self.latency:
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+class WsSession(requests.Session):
+    """
+    requests session applying default timeout to all requests.
+    """
+
+    def __init__(self, timeout=None):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class AsyncSession:
+    """
+    Awaitable interface to pooled session, for commands implementing arun().
+
+    Requests run on ws.aio thread pool, so they share connection pool,
+    response cache and everything else with synchronous callers.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def request(self, method, url, **kwargs):
+        from .aio import to_thread
+        return await to_thread(self.session.request, method, url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+
+def iter_body(response, chunk_size=64 * 1024):
+    """
+    Return iterator of response body in chunks, without loading it whole.
+    Response should be requested with stream=True. It is closed when
+    body ends, or when iterator is closed (even before it started).
+    """
+    return BodyChunks(response, chunk_size)
+
+
+class BodyChunks:
+
+    def __init__(self, response, chunk_size):
+        self.response = response
+        self.chunks = response.iter_content(chunk_size)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.chunks)
+        except BaseException:
+            self.response.close()
+            raise
+
+    def close(self):
+        self.response.close()
+
+
+def endpoint_key(endpoint):
+    """
+    Return scheme://host:port part of endpoint url.
+    """
+    parts = urlsplit(endpoint)
+    return '{}://{}'.format(parts.scheme, parts.netloc).lower()
+
+
+class SessionManager:
+    """
+    Create and keep one pooled session per endpoint.
+
+    Options (see DEFAULT_OPTIONS) can be given to constructor as defaults
+    for all endpoints, set per endpoint with configure(),
+    or passed by service to session(). Options only take effect
+    when session for an endpoint is created.
+    """
+
+    def __init__(self, **options):
+        self.options = dict(DEFAULT_OPTIONS, **options)
+        self.endpoint_options = {}
+        self.sessions = {}
+        self.archives = {}  # ws.archive Recorder or Archive by directory
+        self.lock = threading.Lock()
+
+    def configure(self, endpoint, **options):
+        self.endpoint_options.setdefault(endpoint_key(endpoint), {}).update(options)
+
+    def session(self, endpoint, **options):
+        """
+        Return session for endpoint, creating it if needed.
+        """
+        key = endpoint_key(endpoint)
+        session = self.sessions.get(key)
+        if session is None:
+            with self.lock:
+                session = self.sessions.get(key)
+                if session is None:
+                    options = dict(self.options, **options)
+                    options.update(self.endpoint_options.get(key, {}))
+                    session = self.sessions[key] = self.create_session(options)
+        return session
+
+    def create_session(self, options):
+        from . import VERSION_STR
+        session = WsSession(timeout=options['timeout'])
+        if options['replay']:
+            adapter = ReplayAdapter(
+                self.archive(options['replay'], Archive),
+                latency=options['replay_latency'],
+            )
+        else:
+            adapter = WsAdapter(
+                cache=get_response_cache() if options['cache'] else None,
+                cache_ttl=options['cache_ttl'],
+                rate_limiter=get_rate_limiter() if options['rate_limit'] else None,
+                recorder=self.archive(options['record'], Recorder) if options['record'] else None,
+                single_flight=get_single_flight() if options['coalesce'] else None,
+                memo_ttl=options['memo_ttl'],
+                pool_connections=options['pool_connections'],
+                pool_maxsize=options['pool_maxsize'],
+                pool_block=options['pool_block'],
+                max_retries=options['max_retries'],
+            )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = 'ws/' + VERSION_STR
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        session.headers['Connection'] = 'keep-alive' if options['keep_alive'] else 'close'
+        return session
+
+    def archive(self, path, archive_class):
+        """
+        Return archive_class instance for path, shared by all sessions.
+        Called with lock held.
+        """
+        if path not in self.archives:
+            self.archives[path] = archive_class(path)
+        return self.archives[path]
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+            for archive in self.archives.values():
+                archive.close()
+            self.archives.clear()
+
+
+_session_manager = None
+_session_manager_lock = threading.Lock()
+# SessionManagers recording or replaying archives, by directories and latency
+_archive_session_managers = {}
+
+
+def get_session_manager(record=None, replay=None, replay_latency=0):
+    """
+    Return process-wide SessionManager, or, with record or replay
+    directory given, the one recording to or replaying from them.
+    Those are kept for the life of process too, so that every archive
+    is written by one Recorder (and read by one Archive), no matter
+    how many commands use it.
+    """
+    global _session_manager
+    if record or replay:
+        key = (resolve_path(record) if record else None, resolve_path(replay) if replay else None,
+               replay_latency if replay else 0)
+        with _session_manager_lock:
+            session_manager = _archive_session_managers.get(key)
+            if session_manager is None:
+                session_manager = _archive_session_managers[key] = SessionManager(
+                    record=key[0], replay=key[1], replay_latency=key[2])
+        return session_manager
+    if _session_manager is None:
+        with _session_manager_lock:
+            if _session_manager is None:
+                _session_manager = SessionManager()
+    return _session_manager
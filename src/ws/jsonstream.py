@@ -0,0 +1,248 @@
+"""
+Incremental decoding of json responses.
+
+JsonStream reads body chunk by chunk and yields items of one array
+inside the document (like "items" of search results) as soon as each
+of them arrives, instead of decoding whole body first. Items are
+decoded one at a time (with json's C decoder) and reduced to selected
+fields right away, so memory use doesn't grow with size of response.
+Other values of the top level object are collected in stream.document.
+
+Fields are paths like "name" or "owner.login", as given with
+--fields / --select.
+"""
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = ',]}' + _WHITESPACE
+# drop consumed text from buffer once it grows over this
+_TRIM = 64 * 1024
+_NOTHING = object()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def parse_fields(values):
+    """
+    Return list of field paths (tuples) from option values,
+    each a comma separated list of dotted paths, or None.
+    """
+    if not values:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    fields = []
+    for value in values:
+        for field in value.split(','):
+            field = field.strip()
+            if field:
+                fields.append(tuple(field.split('.')))
+    return fields or None
+
+
+def format_fields(fields):
+    """
+    Return fields as comma separated string, as sent to servers.
+    """
+    return ','.join('.'.join(field) for field in fields)
+
+
+def project(value, fields):
+    """
+    Return copy of value with only given field paths.
+    Lists are projected item by item, missing fields are left out.
+    """
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    result = {}
+    for field in fields:
+        if field[0] not in value:
+            continue
+        if len(field) == 1:
+            result[field[0]] = value[field[0]]
+        else:
+            projected = project(value[field[0]], [field[1:]])
+            previous = result.get(field[0])
+            if isinstance(previous, dict) and isinstance(projected, dict):
+                previous.update(projected)
+            elif isinstance(previous, list) and isinstance(projected, list):
+                for old, new in zip(previous, projected):
+                    if isinstance(old, dict) and isinstance(new, dict):
+                        old.update(new)
+            else:
+                result[field[0]] = projected
+    return result
+
+
+class JsonStream:
+    """
+    Iterable of items of array at path in json document read from chunks
+    (bytes or str), projected to fields.
+
+    Empty path means the document itself is the array. If there is
+    no array at path, there are no items.
+    """
+
+    def __init__(self, chunks, path=(), fields=None, encoding='utf-8'):
+        self.chunks = iter(chunks)
+        self.path = tuple(path)
+        self.fields = fields
+        self.document = {}
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.value = _NOTHING
+
+    @classmethod
+    def decoded(cls, value, path=(), fields=None):
+        """
+        Return JsonStream of document decoded already.
+        """
+        stream = cls((), path, fields)
+        stream.value = value
+        return stream
+
+    def _decoded_items(self):
+        items = self.value
+        if isinstance(items, dict) and self.path:
+            self.document = dict((key, value) for key, value in items.items() if key != self.path[0])
+        for key in self.path:
+            items = items.get(key) if isinstance(items, dict) else None
+        if isinstance(items, list):
+            for item in items:
+                yield project(item, self.fields)
+        elif not self.path:
+            self.document = items
+
+    def _read(self, minimum=1):
+        """
+        Add at least minimum characters to buffer, return False at end.
+        """
+        if self.pos > _TRIM:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        added = 0
+        parts = [self.buffer]
+        while added < minimum and not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self.decoder.decode(b'', final=True)
+            elif isinstance(chunk, str):
+                text = chunk
+            else:
+                text = self.decoder.decode(chunk)
+            parts.append(text)
+            added += len(text)
+        self.buffer = ''.join(parts)
+        return added > 0
+
+    def _peek(self):
+        """
+        Skip whitespace, return next character ('' at end).
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError('invalid json: expected {} at {!r}'.format(
+                ' or '.join(repr(c) for c in chars), self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def _value(self):
+        """
+        Decode value starting at current position.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                end = None
+            # number not followed by delimiter may continue in next chunk
+            if end is not None and (self.eof or not _is_number(value)
+                                    or end < len(self.buffer) and self.buffer[end] in _DELIMITERS):
+                self.pos = end
+                return value
+            if self.eof:
+                raise ValueError('invalid json at {!r}'.format(self.buffer[self.pos:self.pos + 20]))
+            # grow buffer geometrically, so large values are retried few times
+            self._read(max(len(self.buffer) - self.pos, 1))
+
+    def _members(self, depth):
+        """
+        Go through members of object just opened, descending into
+        the one at path[depth], collecting top level ones to document.
+        """
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == self.path[depth]:
+                yield from self._at(depth + 1)
+            else:
+                value = self._value()
+                if depth == 0:
+                    self.document[key] = value
+            if self._expect(',}') == '}':
+                return
+
+    def _at(self, depth):
+        """
+        Yield items of the array at path, where value at path[:depth] starts.
+        """
+        char = self._peek()
+        if depth == len(self.path):
+            if char != '[':
+                value = self._value()
+                if depth == 0:
+                    self.document = value
+                return
+            self.pos += 1
+            if self._peek() == ']':
+                self.pos += 1
+                return
+            while True:
+                yield project(self._value(), self.fields)
+                if self._expect(',]') == ']':
+                    return
+        elif char == '{':
+            self.pos += 1
+            yield from self._members(depth)
+        else:
+            self._value()
+
+    def __iter__(self):
+        if self.value is not _NOTHING:
+            yield from self._decoded_items()
+            return
+        yield from self._at(0)
+        if self._peek():
+            raise ValueError('invalid json: extra data')
+
+    def close(self):
+        """
+        Stop reading, releasing response the chunks come from.
+        """
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,212 @@
+"""
+Incremental parsing of command line being edited in the shell.
+
+Lexer, validator and completer all need parsed form of the same text,
+and it changes by a character or two between calls. LineParser keeps
+results for recent texts, retokenizes only from the edited token onward,
+and reparses only commands owning tokens from the edit point on
+(in `ws github search -r 5 node`, typing in "node" reparses only
+search command, while WsCommand and github service are reused).
+
+In pipelines (see ws.pipeline) command is the one of the last stage,
+earlier stages are parsed again only when they change.
+"""
+import collections
+import copy
+
+from .pipeline import is_pipe
+from .service_utils import Service
+from .tokenize import Token, TokenType, tokenize
+
+
+class ParsedLine:
+
+    def __init__(self, text, tokens, command, error, start=0, stages_error=None):
+        self.text = text
+        self.tokens = tokens
+        self.command = command  # WsCommand, possibly partially parsed
+        self.start = start  # index of first token of last pipeline stage
+        self.stages_error = stages_error  # error in earlier stages
+        self.error = stages_error or error  # exception raised by parser, if any
+
+    def levels(self):
+        """
+        Return list of (command, index of its first token) pairs,
+        from WsCommand down to innermost parsed command.
+        """
+        levels = []
+        command = self.command
+        while command is not None and command.token_count is not None:
+            levels.append((command, len(self.tokens) - command.token_count))
+            command = command.command or getattr(command, 'service', None)
+        return levels
+
+
+def common_prefix_length(a, b):
+    if b.startswith(a):
+        return len(a)
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def retokenize(old_text, old_tokens, text):
+    """
+    Tokenize text, reusing tokens of old_text that end before first change.
+    Return (tokens, amount of reused tokens).
+
+    Reused tokens are copied, as parsing retypes them, and cached
+    ParsedLine of old_text still refers to the old ones.
+    """
+    changed = common_prefix_length(old_text, text)
+    kept = len(old_tokens)
+    while kept and old_tokens[kept - 1].end >= changed:
+        kept -= 1
+    restart = old_tokens[kept - 1].end if kept else 0
+    tokens = [Token(token.text, token.position, token.tokentype, token.end) for token in old_tokens[:kept]]
+    for token in tokenize(text[restart:]):
+        token.position += restart
+        token.end += restart
+        tokens.append(token)
+    return tokens, kept
+
+
+def last_stage(tokens):
+    """
+    Return index of first token of last pipeline stage.
+    """
+    for idx in range(len(tokens) - 1, -1, -1):
+        if is_pipe(tokens[idx]):
+            return idx + 1
+    return 0
+
+
+def first_difference(old_tokens, tokens, start=0):
+    for idx in range(start, min(len(old_tokens), len(tokens))):
+        if old_tokens[idx].text != tokens[idx].text:
+            return idx
+    return min(len(old_tokens), len(tokens))
+
+
+class LineParser:
+
+    def __init__(self, command_factory, cache_size=32):
+        """
+        command_factory() should return new, unparsed WsCommand.
+        """
+        self.command_factory = command_factory
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.last = None
+
+    def parse(self, text):
+        """
+        Return ParsedLine for text. Results are cached,
+        so all callers get the same object for the same text.
+        """
+        parsed = self.cache.get(text)
+        if parsed is not None:
+            self.cache.move_to_end(text)
+        else:
+            parsed = self.parse_incremental(text) if self.last else self.parse_full(text, tokenize(text))
+            self.cache[text] = parsed
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        self.last = parsed
+        return parsed
+
+    def parse_full(self, text, tokens):
+        start = last_stage(tokens)
+        stages_error = None
+        stage_start = 0
+        for idx in range(start):
+            if is_pipe(tokens[idx]):
+                tokens[idx].tokentype = TokenType.Command
+                error = self.run_parser(self.command_factory(), tokens[:idx], stage_start)
+                if stage_start == idx:
+                    error = Exception('empty pipeline stage')
+                stages_error = stages_error or error
+                stage_start = idx + 1
+        command = self.command_factory()
+        error = self.run_parser(command, tokens, start)
+        return ParsedLine(text, tokens, command, error, start, stages_error)
+
+    @staticmethod
+    def run_parser(command, tokens, start):
+        """
+        Parse tokens[start:] with command, return exception raised, if any.
+        """
+        for token in tokens[start:]:
+            token.tokentype = TokenType.Unknown
+        try:
+            command.parse(tokens, start)
+        except Exception as e:
+            return e
+        return None
+
+    def parse_incremental(self, text):
+        last = self.last
+        tokens, kept = retokenize(last.text, last.tokens, text)
+        changed = first_difference(last.tokens, tokens, kept)
+        start = last_stage(tokens)
+        if start != last.start or changed < start:
+            return self.parse_full(text, tokens)
+        # retokenized tokens before change are new objects with the same text
+        for idx in range(kept, changed):
+            tokens[idx].tokentype = last.tokens[idx].tokentype
+        levels = last.levels()
+        for depth in range(len(levels) - 1, 0, -1):
+            command, start = levels[depth]
+            if start <= changed:
+                # commands above are reused, but copied,
+                # as cached ParsedLine for last text still refers to them
+                ancestors = []
+                for ancestor, ancestor_start in levels[:depth]:
+                    ancestor = copy_command(ancestor, ancestors[-1] if ancestors else None)
+                    ancestor.token_count = len(tokens) - ancestor_start
+                    ancestors.append(ancestor)
+                command = fresh_copy(command, ancestors[-1])
+                error = self.run_parser(command, tokens, start)
+                return ParsedLine(text, tokens, ancestors[0], error, last.start, last.stages_error)
+        return self.parse_full(text, tokens)
+
+
+def attach(parent, child):
+    """
+    Make child subcommand (or service) of parent, replacing previous one.
+    """
+    if parent.command is not None:
+        parent.command = child
+    else:
+        parent.service = child
+
+
+def copy_command(command, parent):
+    """
+    Return shallow copy of parsed command, attached to parent (if given).
+    """
+    clone = copy.copy(command)
+    if command.parent is command:
+        clone.parent = clone
+    elif parent is not None:
+        clone.parent = parent
+    if parent is not None:
+        attach(parent, clone)
+    return clone
+
+
+def fresh_copy(command, parent):
+    """
+    Return new, unparsed instance of the same command, attached to parent.
+    """
+    if isinstance(command, Service):
+        clone = type(command)(env=command.env)
+    else:
+        clone = type(command)(parent)
+    attach(parent, clone)
+    return clone
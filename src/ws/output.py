@@ -0,0 +1,322 @@
+"""
+Writing command results to output streams.
+
+Results are written as they are produced, through a bounded buffer,
+so memory use doesn't depend on output size and slow readers
+naturally slow down producers (a generator isn't resumed until
+previous chunk is written). Buffer is flushed when it fills up,
+or when FLUSH_INTERVAL passed since last flush, so output
+of slow commands isn't held back.
+
+Records (anything but text) are written as json lines by default,
+or encoded in format chosen with --output:
+
+    jsonl   compact json lines, with orjson or ujson if installed
+    csv     comma separated values with header line
+    tsv     tab separated values with header line
+    table   columns aligned to the first TABLE_ROWS rows
+
+Columns of csv, tsv and table are fields selected with --fields,
+or fields of the first record. Nested objects are flattened to dotted
+names (owner.login). Text chunks are written as they are.
+"""
+import csv
+import json
+import os
+import sys
+import time
+
+from . import profile
+from .parse import Result
+
+BUFFER_SIZE = 64 * 1024
+FLUSH_INTERVAL = 0.2
+FORMATS = ('jsonl', 'csv', 'tsv', 'table')
+# faster json encoders, used for jsonl when installed
+JSON_MODULES = ('orjson', 'ujson')
+TABLE_ROWS = 100
+TABLE_WAIT = 1.0
+
+
+class OutputBuffer:
+    """
+    Bounded buffer in front of text stream, accepting str and bytes.
+
+    Bytes go to stream.buffer when there is one, so binary output
+    is passed through unchanged.
+    """
+
+    def __init__(self, stream, size=BUFFER_SIZE):
+        self.stream = stream
+        self.size = size
+        self.binary = getattr(stream, 'buffer', None)
+        self.encoding = getattr(stream, 'encoding', None) or 'utf-8'
+        try:
+            self.interactive = stream.isatty()
+        except (AttributeError, ValueError):
+            self.interactive = False
+        self.chunks = []
+        self.pending = 0
+        self.flushed = time.monotonic()
+        # anything printed before goes first
+        stream.flush()
+
+    def write(self, chunk):
+        if self.binary is not None:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self.encoding, 'replace')
+        elif isinstance(chunk, (bytes, bytearray)):
+            chunk = chunk.decode(self.encoding, 'replace')
+        self.chunks.append(chunk)
+        self.pending += len(chunk)
+        if self.pending >= self.size or self.interactive or time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            if self.binary is not None:
+                self.binary.write(b''.join(self.chunks))
+            else:
+                self.stream.write(''.join(self.chunks))
+            self.chunks = []
+            self.pending = 0
+        (self.binary or self.stream).flush()
+        self.flushed = time.monotonic()
+
+
+_encode_record = json.JSONEncoder(default=str).encode
+
+
+def format_record(record):
+    return _encode_record(record) + '\n'
+
+
+def json_lines_encoder():
+    """
+    Return function encoding record as compact json line (str or bytes),
+    using the fastest json module available.
+    """
+    for name in JSON_MODULES:
+        try:
+            module = __import__(name)
+        except ImportError:
+            continue
+        if name == 'orjson':
+            option = module.OPT_APPEND_NEWLINE | module.OPT_NON_STR_KEYS
+            return lambda record: module.dumps(record, default=str, option=option)
+        return lambda record: module.dumps(record, ensure_ascii=False, default=str) + '\n'
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str).encode
+    return lambda record: encode(record) + '\n'
+
+
+def flatten(record, prefix='', flat=None):
+    """
+    Return dict of values of record, with nested objects
+    flattened to dotted names.
+    """
+    if flat is None:
+        flat = {}
+    if not isinstance(record, dict):
+        flat[prefix or 'value'] = record
+        return flat
+    for key, value in record.items():
+        name = '{}.{}'.format(prefix, key) if prefix else str(key)
+        if isinstance(value, dict) and value:
+            flatten(value, name, flat)
+        else:
+            flat[name] = value
+    return flat
+
+
+def row_values(record, paths):
+    """
+    Return list of values of record at paths (tuples of keys),
+    ready for csv writer: missing are None, lists and objects
+    are json, booleans lowercase.
+    """
+    values = []
+    for path in paths:
+        value = record
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value.__class__ in _JSON_CELLS:
+            value = _encode_record(value)
+        elif value.__class__ is bool:
+            value = 'true' if value else 'false'
+        values.append(value)
+    return values
+
+
+_JSON_CELLS = (list, dict)
+
+
+class JsonLinesEncoder:
+
+    def __init__(self, output, columns=None):
+        self.output = output
+        self.encode = json_lines_encoder()
+
+    def write(self, record):
+        self.output.write(self.encode(record))
+
+    def close(self):
+        pass
+
+
+class DelimitedEncoder:
+    """
+    Csv (or tsv, with delimiter='\t') encoder, writing rows
+    straight to output buffer.
+    """
+
+    def __init__(self, output, columns=None, delimiter=','):
+        self.output = output
+        self.columns = columns
+        self.paths = None
+        self.writer = csv.writer(output, delimiter=delimiter, lineterminator='\n')
+
+    def write(self, record):
+        if not isinstance(record, dict):
+            record = {'value': record}
+        if self.paths is None:
+            if self.columns is None:
+                self.columns = list(flatten(record))
+            self.paths = [tuple(column.split('.')) for column in self.columns]
+            self.writer.writerow(self.columns)
+        self.writer.writerow(row_values(record, self.paths))
+
+    def close(self):
+        pass
+
+
+class TableEncoder:
+    """
+    Encoder of aligned columns. Widths are taken from the first TABLE_ROWS
+    rows (or rows that came in TABLE_WAIT seconds), longer values
+    in later rows are not cut.
+    """
+
+    def __init__(self, output, columns=None):
+        self.output = output
+        self.columns = columns
+        self.paths = None
+        self.rows = []
+        self.widths = None
+        self.started = None
+
+    def write(self, record):
+        if not isinstance(record, dict):
+            record = {'value': record}
+        if self.paths is None:
+            if self.columns is None:
+                self.columns = list(flatten(record))
+            self.paths = [tuple(column.split('.')) for column in self.columns]
+        cells = ['' if value is None else str(value).replace('\n', ' ')
+                 for value in row_values(record, self.paths)]
+        if self.widths is not None:
+            self.write_row(cells)
+            return
+        if self.started is None:
+            self.started = time.monotonic()
+        self.rows.append(cells)
+        if len(self.rows) >= TABLE_ROWS or time.monotonic() - self.started >= TABLE_WAIT:
+            self.write_rows()
+
+    def write_row(self, row):
+        self.output.write('  '.join(value.ljust(width) for value, width in zip(row, self.widths)).rstrip() + '\n')
+
+    def write_rows(self):
+        header = [column.upper() for column in self.columns]
+        self.widths = [max(len(value) for value in values) for values in zip(header, *self.rows)]
+        self.write_row(header)
+        for row in self.rows:
+            self.write_row(row)
+        self.rows = []
+
+    def close(self):
+        if self.widths is None and self.columns is not None:
+            self.write_rows()
+
+
+ENCODERS = {
+    'jsonl': JsonLinesEncoder,
+    'csv': DelimitedEncoder,
+    'tsv': lambda output, columns=None: DelimitedEncoder(output, columns, delimiter='\t'),
+    'table': TableEncoder,
+}
+
+
+def silence(stream):
+    """
+    Point stream file descriptor to /dev/null, so that nothing
+    (like flush at interpreter exit) fails on a closed pipe again.
+    Streams without file descriptor (captured output, ws daemon clients)
+    are left alone.
+    """
+    try:
+        fd = stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, fd)
+    os.close(devnull)
+
+
+def write_result(result, stream=None, format=None, fields=None):
+    """
+    Write result (Result or any value Result accepts) to stream (stdout by default).
+
+    Records are encoded in given format (see FORMATS), json lines
+    by default, with only given fields (see ws.jsonstream.parse_fields).
+
+    Records are written as they are to streams having write_record
+    (stages of ws.pipeline), unless format is given.
+
+    Returns False if reader went away before everything was written
+    (like in `ws ... | head`), True otherwise.
+    """
+    if stream is None:
+        stream = sys.stdout
+    if not isinstance(result, Result):
+        result = Result(result)
+    write_record = getattr(stream, 'write_record', None)
+    if fields is not None:
+        from .jsonstream import format_fields, project
+        columns = format_fields(fields).split(',')
+    else:
+        columns = None
+    timing = profile.current()
+    spent = 0.0
+    try:
+        # pipeline stages buffer themselves
+        output = OutputBuffer(stream) if write_record is None else stream
+        encoder = ENCODERS[format](output, columns) if format else None
+        for chunk in result:
+            if timing is not None:
+                start = time.perf_counter()
+            if isinstance(chunk, (str, bytes, bytearray)):
+                output.write(chunk)
+            else:
+                if fields is not None:
+                    chunk = project(chunk, fields)
+                if encoder is not None:
+                    encoder.write(chunk)
+                elif write_record is not None:
+                    write_record(chunk)
+                else:
+                    output.write(format_record(chunk))
+            if timing is not None:
+                spent += time.perf_counter() - start
+        start = time.perf_counter()
+        if encoder is not None:
+            encoder.close()
+        output.flush()
+        spent += time.perf_counter() - start
+    except (BrokenPipeError, ConnectionResetError):
+        silence(stream)
+        return False
+    finally:
+        result.close()
+        if timing is not None:
+            timing.add('output', spent)
+    return True
@@ -0,0 +1,188 @@
+"""
+Lazy iteration over paginated listings.
+
+Next pages are fetched in background while current one is being
+consumed (lookahead pages at most), and fetching stops as soon as
+consumer stops iterating. Pages fetched ahead and not consumed
+are closed then, releasing their connections.
+"""
+import contextvars
+import threading
+
+from . import profile
+
+_DONE = object()
+# smaller json bodies are decoded whole by stream_json
+STREAM_MIN_SIZE = 512 * 1024
+
+
+def next_link(response):
+    """
+    Return url of next page from Link header (rel="next"), or None.
+    """
+    link = response.links.get('next')
+    return link['url'] if link else None
+
+
+def decode_json(response):
+    response.raise_for_status()
+    with profile.phase('json decode'):
+        return response.json()
+
+
+def stream_json(path=(), fields=None):
+    """
+    Return decode function for iter_pages making pages
+    ws.jsonstream.JsonStream of items at path, decoded as they arrive.
+    Pages should be requested with stream=True.
+
+    Bodies smaller than STREAM_MIN_SIZE are decoded at once instead,
+    as that is faster (and done while previous page is consumed).
+    """
+    from .http import iter_body
+    from .jsonstream import JsonStream
+
+    def decode(response):
+        response.raise_for_status()
+        length = response.headers.get('content-length')
+        if length is not None and length.isdigit() and int(length) < STREAM_MIN_SIZE:
+            with profile.phase('json decode'):
+                return JsonStream.decoded(response.json(), path, fields)
+        return JsonStream(iter_body(response), path, fields)
+    return decode
+
+
+def close_page(page):
+    """
+    Release response page was read from, if it is still open
+    (like JsonStream of streamed response).
+    """
+    close = getattr(page, 'close', None)
+    if close is not None:
+        close()
+
+
+def pages_needed(limit, page_size):
+    """
+    Return amount of pages of page_size items holding limit items.
+    """
+    return max(1, -(-limit // page_size))
+
+
+def iter_pages(session, url, params=None, next_page=next_link, decode=decode_json,
+               lookahead=1, max_pages=None, **kwargs):
+    """
+    Yield decoded pages of a listing, starting from url,
+    at most max_pages of them, if given.
+
+    next_page(response) returns url of the next page, or (url, params)
+    for cursor-based apis, or None after the last page. Links returned
+    by next_link already contain all query parameters.
+    decode(response) turns response into page object.
+    Remaining kwargs are passed to session.get.
+
+    No page past max_pages is requested, not even in background,
+    so pass it when amount of items needed is known.
+    """
+    def fetch(url, params):
+        response = session.get(url, params=params, **kwargs)
+        following = next_page(response)
+        if isinstance(following, tuple):
+            following_url, following_params = following
+        else:
+            following_url, following_params = following, None
+        return decode(response), following_url, following_params
+
+    if max_pages is not None and max_pages <= 1:
+        # nothing to fetch ahead
+        lookahead = 0
+    if lookahead < 1:
+        fetched = 0
+        while url and (max_pages is None or fetched < max_pages):
+            page, url, params = fetch(url, params)
+            fetched += 1
+            yield page
+        return
+
+    # pages (or exception) fetched in background, in order
+    fetched = []
+    ready = threading.Condition()
+    # free slots: consumer's current page plus lookahead pages ahead
+    slots = threading.Semaphore(lookahead + 1)
+    stopped = threading.Event()
+
+    def producer(url, params):
+        remaining = max_pages
+        while url and remaining != 0:
+            slots.acquire()
+            if stopped.is_set():
+                return
+            try:
+                page, url, params = fetch(url, params)
+            except Exception as e:
+                page, url = e, None
+            if remaining is not None:
+                remaining -= 1
+            with ready:
+                if stopped.is_set():
+                    # consumer is gone, nobody else would close it
+                    if not isinstance(page, Exception):
+                        close_page(page)
+                    return
+                fetched.append(page)
+                ready.notify()
+        with ready:
+            fetched.append(_DONE)
+            ready.notify()
+
+    thread = threading.Thread(
+        target=contextvars.copy_context().run, args=(producer, url, params), daemon=True)
+    thread.start()
+    try:
+        while True:
+            with ready:
+                while not fetched:
+                    ready.wait()
+                page = fetched.pop(0)
+            if page is _DONE:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+            slots.release()
+    finally:
+        with ready:
+            stopped.set()
+            unread, fetched[:] = fetched[:], []
+        slots.release()
+        for page in unread:
+            if page is not _DONE and not isinstance(page, Exception):
+                close_page(page)
+
+
+def paginate(session, url, params=None, items=None, limit=None, page_size=None, **kwargs):
+    """
+    Yield items from all pages of a listing, lazily.
+
+    items(page) returns items of decoded page (page itself by default).
+    Iteration stops after limit items, if given. With page_size
+    (items per page) given too, pages past limit are not requested.
+    Other arguments are the same as for iter_pages.
+    """
+    if limit is not None and page_size:
+        kwargs.setdefault('max_pages', pages_needed(limit, page_size))
+    pages = iter_pages(session, url, params, **kwargs)
+    page = None
+    count = 0
+    try:
+        for page in pages:
+            for item in (items(page) if items else page):
+                yield item
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+    finally:
+        pages.close()
+        if page is not None:
+            # stopped in the middle of it
+            close_page(page)
@@ -8,6 +8,9 @@ class Command:
     name = ''
     aliases = ()
     description = ''  # one-line description
+    # define `async def arun(self)` to make command run natively in event loop
+    # (see ws.aio), instead of in a thread
+    arun = None
 
     def __init__(self, parent, flags=None, options=None, arguments=None, command=None):
         self.parent = parent
@@ -15,10 +18,24 @@ class Command:
         self.options = options or {}
         self.arguments = arguments or []
         self.command = command
-        for flag in self.available_flags():
-            self.flags[flag.canonical] = flag.default
-        for option in self.available_options():
-            self.options[option.canonical] = option.default
+        self.token_count = None
+        grammar = self.grammar()
+        self.flags.update(grammar.flag_defaults)
+        self.options.update(grammar.option_defaults)
+
+    def grammar(self):
+        """
+        Return Grammar compiled from own definition.
+
+        It is compiled once per class, so available_flags, available_options,
+        available_commands and argument_definition are expected to return
+        the same definitions for every instance.
+        """
+        grammar = type(self).__dict__.get('_grammar')
+        if grammar is None:
+            grammar = Grammar(self)
+            type(self)._grammar = grammar
+        return grammar
 
     def help(self):
         pass
@@ -40,34 +57,47 @@ class Command:
             return self.command.run()
         raise NotImplementedError
 
+    def resolve(self):
+        """
+        Return object to run in place of this command.
+        Lets stubs (see ws.services.index) load real implementation.
+        """
+        return self
+
+    def leaf(self):
+        """
+        Return innermost parsed subcommand, or self if there is none.
+        """
+        command = self
+        while command.command:
+            command = command.command
+        return command
+
     def is_valid_flag(self, token):
-        flags = self.available_flags()
-        for flag in flags:
-            if token.text.startswith('--') and flag.longname == token.text[2:]:
-                return flag
-            elif token.text.startswith('-') and flag.shortname == token.text[1:]:
-                return flag
-        return False
+        return self.grammar().flags.get(token.text, False)
 
     def is_valid_option(self, name, value):
         # TODO: add option value validation
-        options = self.available_options()
-        for option in options:
-            if name.startswith('--') and option.longname == name[2:]:
-                return option
-            elif name.startswith('-') and option.shortname == name[1:]:
-                return option
-        return False
+        return self.grammar().options.get(name, False)
+
+    def set_option(self, option, values):
+        """
+        Store option value(s) taken from command line.
+        Options with nargs > 1 get tuple of values,
+        multiple options collect list of all values given.
+        """
+        value = values[0] if option.nargs == 1 else tuple(values)
+        if option.multiple:
+            self.options[option.canonical] = (self.options[option.canonical] or []) + [value]
+        else:
+            self.options[option.canonical] = value
 
     def get_command(self, cmdname):
         """
         return Command class if cmd represents valid command name,
         otherwise return None
         """
-        for cmd in self.available_commands():
-            if cmd.name == cmdname or cmdname in cmd.aliases:
-                return cmd
-        return None
+        return self.grammar().commands.get(cmdname)
 
     def parse_unknown(self, tokens):
         """
@@ -76,67 +106,120 @@ class Command:
         """
         raise Exception('leftovers')
 
-    def parse(self, tokens):
+    def parse(self, tokens, start=0):
         """
         set options, flags, arguments and command according to own specification
-        or raise an InvalidInput exception
+        (parsing tokens[start:]) or raise an InvalidInput exception
         also set tokentype on all parsed tokens
         """
-        _tokens = tokens[:]
-        while _tokens:
-            token = _tokens[0]
-            if token.text.startswith('-'):
-                flag = self.is_valid_flag(token)
+        grammar = self.grammar()
+        count = len(tokens)
+        # this tells where own tokens start in the whole command line
+        # (see ws.lineparser)
+        self.token_count = count - start
+        idx = start
+        while idx < count:
+            token = tokens[idx]
+            text = token.text
+            if text[:1] == '-' and text != '-':
+                flag = grammar.flags.get(text)
                 if flag:
                     self.flags[flag.canonical] = True
                     token.tokentype = TokenType.Flag
-                    _tokens.pop(0)
+                    idx += 1
                     continue
-
-                if len(_tokens) > 1:
-                    option = self.is_valid_option(_tokens[0].text, _tokens[1].text)
-                    if option:
-                        self.options[option.canonical] = _tokens[1].text
-                        _tokens[0].tokentype = TokenType.OptionName
-                        _tokens[1].tokentype = TokenType.OptionValue
-                        _tokens.pop(0)
-                        _tokens.pop(0)
+                option = grammar.options.get(text)
+                if option is None and text[:2] == '--' and '=' in text:
+                    # --name=value
+                    name, _, value = text.partition('=')
+                    option = grammar.options.get(name)
+                    if option and option.nargs == 1:
+                        self.set_option(option, [value])
+                        token.tokentype = TokenType.OptionName
+                        idx += 1
                         continue
-                else:
-                    raise Exception('missing option value')
-            else:
-                command = self.get_command(token.text)
-                if command:
-                    self.command = command(self)
-                    token.tokentype = TokenType.Command
-                    _tokens.pop(0)
-                    self.command.parse(_tokens)
-                    return
-                elif self.argument_definition():
-                    arg_def = self.argument_definition()
-                    if arg_def.min_amount:
-                        if len(_tokens) < arg_def.min_amount:
-                            raise Exception('Not enough arguments. Expected at least {}, got {}'.format(arg_def.min_amount, len(_tokens)))
-                    if arg_def.max_amount:
-                        argument_tokens = _tokens[:arg_def.max_amount]
-                    else:
-                        argument_tokens = _tokens[:]
-                    for argument_token in argument_tokens:
-                        argument_token.tokentype = TokenType.Argument
-                        _tokens.pop(0)
-                    self.arguments = [argument_token.text for argument_token in argument_tokens]
-                if _tokens:
-                    self.parse_unknown(_tokens)
-                    _tokens.clear()
+                    option = None
+                if option and option.flag_value is not None:
+                    # value can only be given as --name=value
+                    self.set_option(option, [option.flag_value])
+                    token.tokentype = TokenType.OptionName
+                    idx += 1
+                    continue
+                if option:
+                    if count - idx <= option.nargs:
+                        raise Exception('missing option value')
+                    value_tokens = tokens[idx + 1:idx + option.nargs + 1]
+                    self.set_option(option, [value_token.text for value_token in value_tokens])
+                    token.tokentype = TokenType.OptionName
+                    for value_token in value_tokens:
+                        value_token.tokentype = TokenType.OptionValue
+                    idx += option.nargs + 1
+                    continue
+                # unknown option names are left to arguments or parse_unknown
+            command = grammar.commands.get(text)
+            if command:
+                self.command = command(self)
+                token.tokentype = TokenType.Command
+                self.command.parse(tokens, idx + 1)
+                return
+            arg_def = grammar.argument_definition
+            if arg_def:
+                if arg_def.min_amount and count - idx < arg_def.min_amount:
+                    raise Exception('Not enough arguments. Expected at least {}, got {}'.format(arg_def.min_amount, count - idx))
+                end = min(count, idx + arg_def.max_amount) if arg_def.max_amount else count
+                for argument_token in tokens[idx:end]:
+                    argument_token.tokentype = TokenType.Argument
+                self.arguments = [argument_token.text for argument_token in tokens[idx:end]]
+                idx = end
+            if idx < count:
+                self.parse_unknown(tokens[idx:])
+                break
         # check if there are any missing required options or arguments
-        for option in self.available_options():
-            if option.required and option.canonical not in self.options:
+        for option in grammar.required_options:
+            if option.canonical not in self.options:
                 raise Exception('required option missing: ' + option.canonical)
-        if self.argument_definition() and self.argument_definition().min_amount is not None:
+        if grammar.argument_definition and grammar.argument_definition.min_amount is not None:
             if not self.arguments:
                 raise Exception('Command {} is missing required arguments.'.format(self.name))
 
 
+class Grammar:
+    """
+    Command definition compiled into lookup tables used by Command.parse:
+    flags and options keyed by '-s' and '--long' names,
+    subcommand classes keyed by name and aliases.
+    """
+    def __init__(self, command):
+        self.flags = {}
+        self.options = {}
+        self.commands = {}
+        self.flag_defaults = {}
+        self.option_defaults = {}
+        self.required_options = []
+        for flag in command.available_flags():
+            self.add_names(self.flags, flag)
+            self.flag_defaults[flag.canonical] = flag.default
+        for option in command.available_options():
+            self.add_names(self.options, option)
+            self.option_defaults[option.canonical] = option.default
+            if option.required:
+                self.required_options.append(option)
+        # reversed, so the first of commands sharing a name wins, as before
+        for cmd in reversed(command.available_commands()):
+            for alias in cmd.aliases:
+                self.commands[alias] = cmd
+            self.commands[cmd.name] = cmd
+        self.argument_definition = command.argument_definition()
+
+    @staticmethod
+    def add_names(table, definition):
+        # earlier definitions win, as with linear search
+        if definition.longname:
+            table.setdefault('--' + definition.longname, definition)
+        if definition.shortname:
+            table.setdefault('-' + definition.shortname, definition)
+
+
 class Flag:
     def __init__(self, shortname, longname, canonical=None, default=False, help=None, description=None):
         self.shortname = shortname
@@ -148,7 +231,8 @@ class Flag:
 
 
 class Option:
-    def __init__(self, shortname, longname, canonical=None, default=None, help=None, description=None, type=str, required=False):
+    def __init__(self, shortname, longname, canonical=None, default=None, help=None, description=None, type=str, required=False,
+                 nargs=1, multiple=False, flag_value=None):
         self.shortname = shortname
         self.longname = longname
         self.canonical = canonical or self.longname or self.shortname
@@ -157,6 +241,10 @@ class Option:
         self.description = description
         self.type = type
         self.required = required
+        self.nargs = nargs  # amount of values following option name
+        self.multiple = multiple  # option can be repeated
+        # if set, option given without =value gets it, instead of taking next token
+        self.flag_value = flag_value
 
 
 class ArgumentDefinition:
@@ -170,6 +258,9 @@ class ArgumentDefinition:
 class Result:
     """
     Command result
+
+    Returned from Command.run (or arun) and written to stdout
+    by ws.output.write_result as it is produced.
     """
     def __init__(self, value):
         """
@@ -177,5 +268,20 @@ class Result:
             string
             bytes
             generator returning strings or bytes
+            (or other objects - records, written as json, one per line)
         """
-        pass
+        self.value = value
+
+    def __iter__(self):
+        if isinstance(self.value, (str, bytes, bytearray)):
+            yield self.value
+        elif self.value is not None:
+            yield from self.value
+
+    def close(self):
+        """
+        Stop producing output, releasing resources held by generator.
+        """
+        close = getattr(self.value, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,421 @@
+"""
+In-process pipelines of ws commands:
+
+    ws github search node ':|' :map -j 8 other/service cmd {name}
+
+In ws shell :| is typed without quotes (quoted, it is plain argument).
+Command line is split at it and every stage is parsed as separate
+command line. All stages run
+concurrently in one process (see ws.aio), connected with pipes -
+bounded queues of records and text or bytes chunks. Records are passed
+as objects, not encoded to json and parsed back: stage writing to
+a pipe produces records rather than formatted text (see
+Service.wants_records), and a stage reading records can take them
+with Service.input_records() (:map does, filling {field} placeholders
+from them). Anything reading stdin (like :batch or --file NAME -)
+gets them as text, records as json lines.
+
+Writer waits while pipe is full, so producer doesn't run ahead of
+slower consumer. When a stage ends, its input pipe is closed and
+writes to it raise BrokenPipeError, which stops previous stage
+the way SIGPIPE stops unix commands.
+
+Exit status is the last non-zero status of stages, not counting
+stages stopped because the next one ended.
+"""
+import codecs
+import collections
+import io
+import json
+import threading
+import time
+
+PIPE = ':|'
+PIPE_SIZE = 16  # batches
+BATCH_SIZE = 256  # items in batch
+FLUSH_INTERVAL = 0.2
+
+
+def is_pipe(token):
+    # quoted ':|' is longer on the command line than its text
+    return token.text == PIPE and token.end - token.position == len(PIPE)
+
+
+def is_pipeline(tokens):
+    return any(is_pipe(token) for token in tokens)
+
+
+def split(tokens):
+    """
+    Return list of token lists of stages.
+    """
+    stages = [[]]
+    for token in tokens:
+        if is_pipe(token):
+            stages.append([])
+        else:
+            stages[-1].append(token)
+    return stages
+
+
+class Pipe:
+    """
+    Bounded queue of batches (lists) of items, between two threads.
+    """
+
+    def __init__(self, size=PIPE_SIZE):
+        self.size = size
+        self.batches = collections.deque()
+        self.condition = threading.Condition()
+        self.ended = False  # writer is done
+        self.closed = False  # reader is done
+
+    def put(self, batch):
+        with self.condition:
+            while len(self.batches) >= self.size and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                raise BrokenPipeError('next pipeline stage ended')
+            self.batches.append(batch)
+            self.condition.notify_all()
+
+    def get(self):
+        """
+        Return next batch, or None after writer ended.
+        """
+        with self.condition:
+            while not self.batches and not self.ended:
+                self.condition.wait()
+            if not self.batches:
+                return None
+            batch = self.batches.popleft()
+            self.condition.notify_all()
+            return batch
+
+    def end(self):
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.batches.clear()
+            self.condition.notify_all()
+
+    def items(self):
+        while True:
+            batch = self.get()
+            if batch is None:
+                return
+            yield from batch
+
+
+class PipeWriter:
+    """
+    Text stream writing to pipe, used as stdout of pipeline stage.
+
+    Chunks (str, or bytes through .buffer) and records (through
+    write_record, see ws.output.write_result) are sent in batches
+    of BATCH_SIZE, or earlier when FLUSH_INTERVAL passed since last one.
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.items = []
+        self.flushed = time.monotonic()
+        self.buffer = _BinaryWriter(self)
+
+    def send(self, item):
+        self.items.append(item)
+        if len(self.items) >= BATCH_SIZE or time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def write(self, text):
+        if text:
+            self.send(text)
+        return len(text)
+
+    def write_record(self, record):
+        self.send(record)
+
+    def flush(self):
+        if self.items:
+            items, self.items = self.items, []
+            self.pipe.put(items)
+        self.flushed = time.monotonic()
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        raise io.UnsupportedOperation('pipeline stage has no file descriptor')
+
+
+class _BinaryWriter:
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data):
+        if data:
+            self.writer.send(bytes(data))
+        return len(data)
+
+    def flush(self):
+        self.writer.flush()
+
+
+def parse_line(line):
+    """
+    Return json value of text line, or the line itself if it isn't json.
+    """
+    line = line.rstrip('\r\n')
+    if line[:1] in ('{', '['):
+        try:
+            return json.loads(line)
+        except ValueError:
+            pass
+    return line
+
+
+class PipeReader:
+    """
+    Text stream reading from pipe, used as stdin of pipeline stage
+    (and as Env.input, for records).
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, pipe):
+        from .output import format_record
+        self.pipe = pipe
+        self.items = pipe.items()
+        self.format_record = format_record
+        self.decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        self.text = ''
+        self.pos = 0
+        self.buffer = _BinaryReader(self)
+
+    def next_text(self):
+        """
+        Return text of next item, or None at end.
+        """
+        item = next(self.items, None)
+        if item is None:
+            return None
+        if isinstance(item, str):
+            return item
+        if isinstance(item, bytes):
+            return self.decoder.decode(item)
+        return self.format_record(item)
+
+    def _more(self):
+        text = self.next_text()
+        if text is None:
+            return False
+        self.text = self.text[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = [self.text[self.pos:]]
+            while True:
+                text = self.next_text()
+                if text is None:
+                    break
+                parts.append(text)
+            self.text, self.pos = '', 0
+            return ''.join(parts)
+        while len(self.text) - self.pos < size and self._more():
+            pass
+        chunk = self.text[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+    def readline(self, size=-1):
+        searched = self.pos
+        while True:
+            end = self.text.find('\n', searched)
+            if end >= 0:
+                end += 1
+                break
+            searched = len(self.text) - self.pos
+            if not self._more():
+                end = len(self.text)
+                break
+        if size is not None and size >= 0:
+            end = min(end, self.pos + size)
+        line = self.text[self.pos:end]
+        self.pos = end
+        return line
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def records(self):
+        """
+        Yield records written by previous stage as they are,
+        and lines of text as their json value (or as strings,
+        when they are not json).
+        """
+        pending = self.text[self.pos:]
+        self.text, self.pos = '', 0
+        for item in self.items:
+            if isinstance(item, (str, bytes)):
+                if isinstance(item, bytes):
+                    item = self.decoder.decode(item)
+                lines = (pending + item).split('\n')
+                pending = lines.pop()
+                for line in lines:
+                    yield parse_line(line)
+            else:
+                if pending:
+                    yield parse_line(pending)
+                    pending = ''
+                yield item
+        pending += self.decoder.decode(b'', final=True)
+        if pending:
+            yield parse_line(pending)
+
+    def readable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        raise io.UnsupportedOperation('pipeline stage has no file descriptor')
+
+    def close(self):
+        pass
+
+
+class _BinaryReader:
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.data = b''
+
+    def read1(self, size=-1):
+        if not self.data:
+            reader = self.reader
+            if reader.pos < len(reader.text):
+                # left over from reading text
+                chunk = reader.text[reader.pos:]
+                reader.text, reader.pos = '', 0
+            else:
+                chunk = self.next_chunk()
+            if chunk is None:
+                return b''
+            self.data = chunk if isinstance(chunk, bytes) else chunk.encode(reader.encoding)
+        if size is None or size < 0:
+            size = len(self.data)
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def next_chunk(self):
+        item = next(self.reader.items, None)
+        if item is None or isinstance(item, (str, bytes)):
+            return item
+        return self.reader.format_record(item)
+
+    def read(self, size=-1):
+        if size is not None and size >= 0:
+            return self.read1(size)
+        parts = []
+        while True:
+            chunk = self.read1()
+            if not chunk:
+                return b''.join(parts)
+            parts.append(chunk)
+
+    def close(self):
+        pass
+
+
+def parse(tokens, service_manager):
+    """
+    Return list of parsed WsCommands of stages, with pipes
+    between them set as their Env.input and Env.pipe.
+    """
+    from . import Env, WsCommand
+    stages = split(tokens)
+    commands = []
+    source = None
+    for idx, stage in enumerate(stages):
+        if not stage:
+            raise Exception('empty pipeline stage')
+        sink = Pipe() if idx < len(stages) - 1 else None
+        wscmd = WsCommand(None, service_manager=service_manager,
+                          env=Env(input=PipeReader(source) if source else None, pipe=sink))
+        wscmd.parse(stage)
+        commands.append(wscmd)
+        source = sink
+    return commands
+
+
+async def run_stage(wscmd):
+    """
+    Run stage with stdin and stdout connected to its pipes,
+    return its exit status.
+    """
+    from . import aio
+    from .runner import arun
+    from .utils import redirect_stdio
+    reader = wscmd.env.input
+    writer = PipeWriter(wscmd.env.pipe) if wscmd.env.pipe else None
+    try:
+        with redirect_stdio(stdin=reader, stdout=writer):
+            exitcode = await arun(wscmd)
+        if writer is not None:
+            try:
+                await aio.to_thread(writer.flush)
+            except BrokenPipeError:
+                pass
+    finally:
+        if reader is not None:
+            reader.pipe.close()
+        if writer is not None:
+            writer.pipe.end()
+    if writer is not None and writer.pipe.closed:
+        # stopped early by next stage
+        return 0
+    return exitcode
+
+
+async def arun(tokens, service_manager):
+    """
+    Parse and run pipeline in current event loop, return its exit status.
+    """
+    import asyncio
+    import sys
+    try:
+        commands = parse(tokens, service_manager)
+    except SystemExit as e:
+        from .runner import exit_status
+        return exit_status(e)
+    except Exception as e:
+        print('error: ' + repr(e), file=sys.stderr)
+        return 1
+    exitcode = 0
+    for status in await asyncio.gather(*(run_stage(wscmd) for wscmd in commands)):
+        if status:
+            exitcode = status
+    return exitcode
+
+
+def run(tokens, service_manager):
+    """
+    Parse and run pipeline, return its exit status.
+    """
+    from . import aio
+    return aio.run(arun(tokens, service_manager))
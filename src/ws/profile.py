@@ -0,0 +1,203 @@
+"""
+Timing of phases of a ws run, for --profile option.
+
+Code on hot paths wraps its work in `with profile.phase(name):`,
+which costs a function call when profiling is off.
+
+    --profile          print table of phases to stderr
+    --profile=jsonl    print the same as a json line to stderr
+    --profile=cprofile save cProfile statistics to ws.pstats
+
+HTTP requests sent over network are timed until response headers arrive
+("http first byte", which includes connecting, TLS and server time,
+as requests doesn't report them separately) and while their body
+is read ("http body"). Response cache lookups are timed as "http cache".
+Requests made in background (like prefetched pages) overlap with other
+phases, so phase times can add up to more than total.
+"""
+import contextlib
+import json
+import sys
+import threading
+import time
+
+MODES = ('table', 'jsonl', 'cprofile')
+PSTATS_FILE = 'ws.pstats'
+
+_current = None
+_null = contextlib.nullcontext()
+
+
+class Profile:
+
+    def __init__(self):
+        self.phases = {}  # name: [count, seconds]
+        self.requests = []
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def add(self, name, seconds):
+        with self.lock:
+            totals = self.phases.setdefault(name, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add_request(self, method, url, status, first_byte, body, queue_wait=0):
+        with self.lock:
+            self.requests.append({
+                'method': method, 'url': url, 'status': status,
+                'queue_wait': queue_wait, 'first_byte': first_byte, 'body': body,
+            })
+
+    def summary(self, total):
+        return {
+            'total': total,
+            'phases': dict((name, {'count': count, 'seconds': seconds})
+                           for name, (count, seconds) in self.phases.items()),
+            'requests': self.requests,
+        }
+
+
+def phase(name):
+    """
+    Return context manager timing its block as phase name,
+    if profiling is on.
+    """
+    if _current is None:
+        return _null
+    return _current.phase(name)
+
+
+def current():
+    """
+    Return Profile being collected, or None.
+    """
+    return _current
+
+
+class TimedRaw:
+    """
+    Wrapper of response.raw adding time spent reading body to profile.
+    """
+
+    def __init__(self, raw, done):
+        self.raw = raw
+        self.done = done
+        self.seconds = 0.0
+        self.finished = False
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        chunks = self.raw.stream(amt, decode_content=decode_content)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            self.seconds += time.perf_counter() - start
+            if chunk is None:
+                break
+            yield chunk
+        self.finish()
+
+    def read(self, amt=None, *args, **kwargs):
+        start = time.perf_counter()
+        data = self.raw.read(amt, *args, **kwargs)
+        self.seconds += time.perf_counter() - start
+        if not data or amt is None:
+            self.finish()
+        return data
+
+    def close(self):
+        self.finish()
+        self.raw.close()
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            self.done(self.seconds)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def time_request(send, request):
+    """
+    Send request with send(request), adding its timings to profile.
+    """
+    profile = _current
+    if profile is None:
+        return send(request)
+    start = time.perf_counter()
+    response = send(request)
+    first_byte = time.perf_counter() - start
+    queue_wait = getattr(response, 'queue_wait', 0)
+    profile.add('http first byte', first_byte - queue_wait)
+    if queue_wait:
+        profile.add('http rate limit wait', queue_wait)
+
+    def done(body):
+        profile.add('http body', body)
+        profile.add_request(request.method, request.url.split('?')[0], response.status_code,
+                            first_byte - queue_wait, body, queue_wait)
+
+    response.raw = TimedRaw(response.raw, done)
+    return response
+
+
+def format_table(summary):
+    total = summary['total']
+    lines = ['{:<24} {:>6} {:>10} {:>7}'.format('phase', 'count', 'ms', '%')]
+    for name, totals in summary['phases'].items():
+        lines.append('{:<24} {:>6} {:>10.2f} {:>6.1f}%'.format(
+            name, totals['count'], totals['seconds'] * 1000, 100 * totals['seconds'] / total if total else 0))
+    lines.append('{:<24} {:>6} {:>10.2f}'.format('total', '', total * 1000))
+    for request in summary['requests']:
+        lines.append('  {} {} {}: first byte {:.2f}ms, body {:.2f}ms{}'.format(
+            request['method'], request['url'], request['status'],
+            request['first_byte'] * 1000, request['body'] * 1000,
+            ', waited {:.2f}ms'.format(request['queue_wait'] * 1000) if request['queue_wait'] else ''))
+    return '\n'.join(lines) + '\n'
+
+
+def run(mode, func, phases=(), started=None):
+    """
+    Call func() with profiling of given mode on, then report.
+
+    phases are (name, start, end) perf_counter times of phases
+    that happened before profiling could be turned on,
+    started is when the run started (default: now).
+    """
+    global _current
+    if mode not in MODES:
+        from .utils import quit
+        quit('unknown profile mode: {} (use one of: {})'.format(mode, ', '.join(MODES)), exitcode=1)
+    if mode == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func)
+        finally:
+            profiler.dump_stats(PSTATS_FILE)
+            print('profile saved to ' + PSTATS_FILE, file=sys.stderr)
+    profile = _current = Profile()
+    if started is not None:
+        profile.started = started
+    for name, start, end in phases:
+        profile.add(name, end - start)
+    try:
+        with profile.phase('run'):
+            return func()
+    finally:
+        _current = None
+        summary = profile.summary(time.perf_counter() - profile.started)
+        if mode == 'jsonl':
+            summary['time'] = time.time()
+            sys.stderr.write(json.dumps(summary) + '\n')
+        else:
+            sys.stderr.write(format_table(summary))
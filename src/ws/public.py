@@ -1,2 +1,6 @@
-from .parse import Command, Flag, Option, ArgumentDefinition
+from .parse import Command, Flag, Option, ArgumentDefinition, Result
 from .service_utils import Service
+from .http import AsyncSession, SessionManager, get_session_manager, iter_body
+from .pagination import iter_pages, next_link, pages_needed, paginate, stream_json
+from .jsonstream import JsonStream, project
+from .upload import StreamingBody, UploadFile, multipart
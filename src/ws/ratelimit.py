@@ -0,0 +1,256 @@
+"""
+Client-side rate limiting of HTTP requests.
+
+Every host and credential pair gets a token bucket, filled according
+to X-RateLimit-Limit, X-RateLimit-Remaining and X-RateLimit-Reset
+response headers. Requests over the limit wait in queue until reset
+instead of failing. Responses saying limit was hit (429, or 403 with
+no requests remaining) block the bucket until reset or Retry-After
+and are retried, as are 5xx responses to idempotent requests,
+with jittered exponential backoff.
+"""
+import hashlib
+import random
+import sys
+import threading
+import time
+
+from .cache import parse_http_date
+
+RETRIES = 5
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 60
+# assumed length of window refilled after reset, until response tells its end
+PROVISIONAL_WINDOW = 60  # seconds
+REPORT_WAIT = 1  # tell user about waits longer than that, in seconds
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+def header_number(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_after(headers, now):
+    """
+    Return time given by Retry-After header (seconds or http date), or None.
+    """
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return now + float(value)
+    except ValueError:
+        return parse_http_date(value)
+
+
+def backoff(attempt):
+    """
+    Return delay before retry number attempt (counted from 0).
+    """
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1)
+
+
+def is_limited(status, headers):
+    """
+    Tell if response says rate limit was exceeded.
+    """
+    if status == 429:
+        return True
+    return status == 403 and (header_number(headers, 'x-ratelimit-remaining') == 0 or 'retry-after' in headers)
+
+
+class Bucket:
+    """
+    Token bucket for one host and credential.
+
+    It holds as many tokens as server says are remaining and is refilled
+    to the limit when rate limit window resets. Until first response
+    with rate limit headers, requests are not limited.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.limit = None
+        self.tokens = None
+        self.reset = None  # when server refills its limit, local time
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+        # held by request waiting for its turn, so waiting ones go in order
+        self.queue = threading.Lock()
+
+    def delay(self, now):
+        """
+        Take token if available and return 0,
+        otherwise return time to wait for one.
+        """
+        with self.lock:
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens is None:
+                return 0
+            if self.reset is not None and now >= self.reset:
+                self.tokens = self.limit
+                # requests sent in new window may all fail, or return no
+                # rate limit headers, so don't let it last for good
+                self.reset = now + PROVISIONAL_WINDOW
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return self.reset - now
+
+    def acquire(self):
+        """
+        Wait until request can be sent, return time waited.
+        """
+        start = time.time()
+        # other requests wait already
+        waited = not self.queue.acquire(blocking=False)
+        if waited:
+            self.queue.acquire()
+        try:
+            while True:
+                now = time.time()
+                delay = self.delay(now)
+                if not delay:
+                    return now - start if waited else 0
+                if delay > REPORT_WAIT and not waited:
+                    print('waiting {:.0f}s for rate limit of {}'.format(delay, self.name), file=sys.stderr)
+                waited = True
+                time.sleep(delay)
+        finally:
+            self.queue.release()
+
+    def learn(self, headers, now):
+        """
+        Update limit and remaining tokens from response headers.
+        """
+        limit = header_number(headers, 'x-ratelimit-limit')
+        remaining = header_number(headers, 'x-ratelimit-remaining')
+        reset = header_number(headers, 'x-ratelimit-reset')
+        if limit is None or remaining is None or reset is None:
+            return
+        # reset is server time, correct it for clock difference
+        date = parse_http_date(headers.get('date'))
+        if date is not None:
+            reset -= date - now
+        with self.lock:
+            self.limit = limit
+            if self.tokens is None or self.reset is None or reset > self.reset + 1:
+                # first response, or first one in new window
+                self.tokens = remaining
+            else:
+                # responses to requests sent at once come back in any order,
+                # and ones still in flight are not counted by server yet
+                self.tokens = min(self.tokens, remaining)
+            self.reset = reset
+
+    def block(self, until):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, until)
+
+
+class RateLimiter:
+    """
+    Token buckets of all hosts and credentials used in this process.
+    """
+
+    def __init__(self, retries=RETRIES):
+        self.retries = retries
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'delayed': 0, 'waited': 0.0, 'retries': 0}
+
+    @staticmethod
+    def key(host, credential):
+        if credential is None:
+            return host
+        return host + ' ' + hashlib.sha1(credential.encode('utf-8')).hexdigest()[:12]
+
+    def bucket(self, host, credential=None):
+        key = self.key(host, credential)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            with self.lock:
+                bucket = self.buckets.setdefault(key, Bucket(host))
+        return bucket
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def wait(self, bucket):
+        waited = bucket.acquire()
+        self.count('requests')
+        if waited:
+            self.count('delayed')
+            self.count('waited', waited)
+        return waited
+
+    def retry_delay(self, bucket, method, status, headers, attempt, resendable):
+        """
+        Return how long to wait before sending request again
+        after response with given status and headers, or None if it should not be.
+        """
+        now = time.time()
+        limited = is_limited(status, headers)
+        if not limited and (status not in RETRY_STATUSES or method not in IDEMPOTENT_METHODS):
+            return None
+        if attempt >= self.retries or not resendable:
+            return None
+        until = retry_after(headers, now)
+        if until is None and limited:
+            until = bucket.reset
+        if until is None or until <= now:
+            until = now + backoff(attempt)
+        if limited:
+            # make all requests to this host wait, not only this one
+            bucket.block(until)
+            return 0
+        return until - now
+
+    def send(self, send, request, host):
+        """
+        Send request with send(request) when bucket for host and its
+        credentials allows, retrying rate limited and failed ones.
+        Time spent waiting is set as queue_wait attribute of response.
+        """
+        bucket = self.bucket(host, request.headers.get('Authorization'))
+        # streamed bodies (see ws.upload) can't be sent again
+        resendable = request.body is None or isinstance(request.body, (bytes, str))
+        waited = 0
+        attempt = 0
+        while True:
+            waited += self.wait(bucket)
+            response = send(request)
+            headers = response.headers
+            bucket.learn(headers, time.time())
+            delay = self.retry_delay(bucket, request.method, response.status_code, headers, attempt, resendable)
+            if delay is None:
+                response.queue_wait = waited
+                return response
+            response.close()
+            self.count('retries')
+            attempt += 1
+            if delay:
+                time.sleep(delay)
+                waited += delay
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Return process-wide RateLimiter.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
@@ -0,0 +1,104 @@
+"""
+Running parsed ws command lines inside a long-lived process.
+"""
+import io
+import sys
+
+from . import WsCommand
+from .utils import redirect_stdio
+
+
+def exit_status(exc):
+    """
+    Translate SystemExit into numeric process exit status.
+    """
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+def execute(tokens, service_manager):
+    """
+    Parse and run one command line, return its exit status.
+
+    Unlike running ws as a script, errors and quit() don't end
+    current process.
+    """
+    from .pipeline import is_pipeline
+    service_manager.recheck()
+    if is_pipeline(tokens):
+        from . import pipeline
+        return pipeline.run(tokens, service_manager)
+    wscmd = WsCommand(None, service_manager=service_manager)
+    try:
+        wscmd.parse(tokens)
+        wscmd.run()
+    except SystemExit as e:
+        return exit_status(e)
+    except Exception as e:
+        print('error: ' + repr(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+async def aexecute(tokens, service_manager):
+    """
+    Like execute(), but runs command in current event loop
+    (see ws.aio.run_command).
+    """
+    from .pipeline import is_pipeline
+    service_manager.recheck()
+    if is_pipeline(tokens):
+        from . import pipeline
+        return await pipeline.arun(tokens, service_manager)
+    return await arun(WsCommand(None, service_manager=service_manager), tokens)
+
+
+async def arun(wscmd, tokens=None):
+    """
+    Run WsCommand in current event loop, parsing tokens with it first,
+    if given. Return exit status.
+    """
+    from . import aio
+    try:
+        if tokens is not None:
+            wscmd.parse(tokens)
+        if wscmd.command or wscmd.service:
+            result = await aio.run_command(wscmd.command or wscmd.service)
+            if result is not None:
+                from .output import write_result
+                if not await aio.to_thread(write_result, result, None, wscmd.env.output, wscmd.env.fields):
+                    return 1
+        else:
+            await aio.to_thread(wscmd.run)
+    except SystemExit as e:
+        return exit_status(e)
+    except (BrokenPipeError, ConnectionResetError):
+        # reader went away, like next stage of pipeline (see ws.pipeline)
+        return 1
+    except Exception as e:
+        print('error: ' + repr(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+async def acapture(tokens, service_manager):
+    """
+    Execute command line with its own empty stdin and captured output.
+    Return (exit status, stdout text, stderr text).
+    """
+    return await capture(aexecute(tokens, service_manager))
+
+
+async def capture(coroutine):
+    """
+    Await coroutine returning exit status (like aexecute) with its own
+    empty stdin and captured output. Return (exit status, stdout text, stderr text).
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with redirect_stdio(stdin=io.StringIO(), stdout=stdout, stderr=stderr):
+        exitcode = await coroutine
+    return exitcode, stdout.getvalue(), stderr.getvalue()
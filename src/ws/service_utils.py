@@ -10,8 +10,74 @@ class Service(Command):
     """
     Base class for all services
     """
+    endpoint = None
+    http_options = {}  # see ws.http.DEFAULT_OPTIONS
+    # query parameter taking comma separated fields to return,
+    # if api supports it (fields are selected with --fields)
+    fields_param = None
 
     def __init__(self, env, *args, **kwargs):
         super().__init__(self, *args, **kwargs)
         self.meta = Dummy()
         self.env = env
+
+    def fields(self):
+        """
+        Return list of field paths (tuples) selected with --fields, or None.
+        """
+        return self.env.fields if self.env is not None else None
+
+    def wants_records(self):
+        """
+        Return True if records were asked for (with --fields or --output,
+        or by next stage of pipeline), rather than text formatted by service.
+        """
+        env = self.env
+        return env is not None and (env.fields is not None or env.output is not None or env.pipe is not None)
+
+    def input_records(self):
+        """
+        Return iterator of records written by previous stage of pipeline
+        (see ws.pipeline), or None if service isn't in one.
+        """
+        if self.env is None or self.env.input is None:
+            return None
+        return self.env.input.records()
+
+    def upload_data(self, fields=None):
+        """
+        Return keyword arguments for session.request sending files
+        given with --file (see ws.upload.upload_data), or empty dict.
+        """
+        if self.env is None or not self.env.files:
+            return {}
+        from .upload import upload_data
+        return upload_data(self.env.files, fields)
+
+    def fields_params(self):
+        """
+        Return query parameters asking api for selected fields only.
+        """
+        fields = self.fields()
+        if not fields or not self.fields_param:
+            return {}
+        from .jsonstream import format_fields
+        return {self.fields_param: format_fields(fields)}
+
+    def session(self, endpoint=None):
+        """
+        Return pooled http session for service endpoint
+        """
+        if self.env is not None:
+            session_manager = self.env.http
+        else:
+            from .http import get_session_manager
+            session_manager = get_session_manager()
+        return session_manager.session(endpoint or self.endpoint, **self.http_options)
+
+    def asession(self, endpoint=None):
+        """
+        Return ws.http.AsyncSession for service endpoint
+        """
+        from .http import AsyncSession
+        return AsyncSession(self.session(endpoint))
@@ -2,54 +2,119 @@ import os
 
 from importlib import import_module
 
+from ws import profile
 from ws.service_utils import Service
 
+from .declarative import CACHE_DIR, SERVICES_DIR, DeclarativeServices
+from .index import INDEX_PATH, ServiceIndex, service_stub
+
+SEARCH_PATH = '~/.ws/cache/search.marshal'
+
 
 class ServiceManager:
     """
     Handle service loading and discovery
+
+    Services are discovered through ServiceIndex, and returned
+    as stub classes (see ws.services.index.IndexedService),
+    which import real service module only when run.
+    Json services (see ws.services.declarative) come second,
+    python service of the same name wins.
     """
 
     def load_service_module(self, service_name):
-        return import_module('ws.services.{}.service'.format(service_name))
+        return import_module('{}.{}.service'.format(self.package, service_name))
 
     def load_service(self, service_name):
-        service_module = self.load_service_module(service_name)
+        """
+        Import service module and return real service class.
+        """
+        with profile.phase('service load'):
+            service_module = self.load_service_module(service_name)
         if hasattr(service_module, 'SERVICE'):
             return getattr(service_module, 'SERVICE')
         else:
             for item in dir(service_module):
                 obj = getattr(service_module, item)
-                if issubclass(obj, Service):
+                if isinstance(obj, type) and issubclass(obj, Service) and obj is not Service:
                     return obj
         raise Exception('Service not found: ' + service_name)
 
+    def recheck(self):
+        """
+        Make next lookups check service files for changes again,
+        they are checked once in between (see ServiceIndex.recheck).
+        Called before every command.
+        """
+        self.index.recheck()
+        self.declarative.recheck()
+
     def has_service(self, service_name):
         """
         return True if a service with given name exists
         """
         if service_name in self.service_dict:
             return True
-        elif os.path.exists(os.path.join(os.path.dirname(__file__), service_name)):
-            return True
-        return False
+        return self.index.has(service_name) or self.declarative.has(service_name)
 
     def all_services(self):
-        basedir = os.path.dirname(__file__)
         services = []
-        for service_name in os.listdir(basedir):
-            if not service_name.startswith('__') and not service_name.startswith('.'):
-                service = self.load_service(service_name)
+        records = self.index.all()
+        for service_name, record in records.items():
+            service = self.service_dict.get(service_name)
+            if service is None:
+                service = service_stub(service_name, record, self)
+                self.service_dict[service_name] = service
+            services.append(service)
+        for service_name, service in self.declarative.all().items():
+            if service_name not in records:
                 services.append(service)
         return services
 
+    def service_records(self):
+        """
+        Return dict of (stamp, record) of all services, keyed by name.
+        Records come from index, so only new or changed python services
+        are imported. Stamp changes whenever record may change.
+        """
+        records = dict((service_name, (self.index.stamp(service_name), record))
+                       for service_name, record in self.index.all().items())
+        for service_name, loaded in self.declarative.all_records().items():
+            records.setdefault(service_name, loaded)
+        return records
+
+    def search_index(self):
+        """
+        Return ws.services.search.SearchIndex, loaded once.
+        """
+        if self._search_index is None:
+            from .search import SearchIndex
+            self._search_index = SearchIndex(self.search_path)
+        return self._search_index
+
     def get_service(self, service_name):
         if service_name in self.service_dict:
             return self.service_dict[service_name]
+        elif not self.index.has(service_name) and self.declarative.has(service_name):
+            # not kept in service_dict, declarative services keep
+            # their classes until json file changes
+            return self.declarative.get(service_name)
         else:
-            service = self.load_service(service_name)
+            service = service_stub(service_name, self.index.get(service_name), self)
             self.service_dict[service_name] = service
             return service
 
-    def __init__(self):
+    def __init__(self, services_dir=None, package='ws.services', index_path=INDEX_PATH,
+                 declarative_dir=SERVICES_DIR, declarative_cache=CACHE_DIR, search_path=SEARCH_PATH):
+        """
+        services_dir is directory of package with services
+        (importable as package), ws.services by default,
+        declarative_dir is directory with json services,
+        search_path is file with index used by :search.
+        """
         self.service_dict = {}
+        self.package = package
+        self.index = ServiceIndex(services_dir or os.path.dirname(__file__), self.load_service, index_path)
+        self.declarative = DeclarativeServices(declarative_dir, declarative_cache)
+        self.search_path = search_path
+        self._search_index = None
@@ -0,0 +1,580 @@
+"""
+Services described by json files in ~/.ws/services, instead of python code.
+
+    {
+        "description": "Git repository hosting service",
+        "endpoint": "https://api.github.com",
+        "commands": [{
+            "name": "search",
+            "description": "search github repositories",
+            "path": "/search/repositories",
+            "arguments": {"min_amount": 1, "param": "q"},
+            "options": [{"shortname": "r", "longname": "results", "default": 10, "type": "int"}],
+            "params": {"per_page": 100},
+            "response": {
+                "paginate": true, "limit": "results", "items": "items",
+                "header": "{total_count} search results:\\n",
+                "template": "{name} {description}\\n{html_url}\\n\\n"
+            }
+        }]
+    }
+
+Service is named after its file (github.json is github). Commands can be
+nested with "commands" and have "aliases", "flags", "options" and
+"arguments" like python commands. Flags, options and arguments become
+request parameters: options and arguments under name given as "param"
+(option name and "args" by default; arguments are joined with "join",
+a space by default, or sent as list if it is null), flags under their
+"param" with their "value" (true by default) only when given. Flags and
+options of service and parent commands apply to subcommands too.
+"params" are sent always.
+
+Command with "path" (appended to endpoint, or a full url) sends request
+with "method" (GET by default), with parameters in query string, or as
+"body" ("json", "form" or "multipart"). Files given with --file are sent
+with parameters as multipart/form-data by commands with "form" or
+"multipart" body, and as the body itself (one file only, parameters in
+query string) by other commands with method other than GET; the rest
+refuses them. Parameters used in path, like
+"/users/{user}/repos", are not sent again (their values are escaped,
+so they stay within their path segment). Response is written as is,
+unless "response" says how to format json it returns: "items" is path
+of list of results in it, written one by one with "template" (or as json
+records without it), "header" is formatted with the rest of response
+(top level fields, when "items" is a path of names, as items are then
+decoded while they arrive). Templates use str.format syntax, with {a.b}
+or {a[b]} for nested fields. "paginate" follows Link headers, "limit"
+names option limiting amount of items. With --fields or --output, items
+are written as records (with only selected fields, which are also sent
+to api in "fields_param" query parameter, if service has it).
+
+Json files are compiled to plain records with templates parsed, which
+are cached in ~/.ws/cache/declarative with marshal, keyed by hash of
+json file, so starting ws doesn't parse or validate specs again.
+Service classes are created from those records, without importing
+any module.
+"""
+import contextlib
+import hashlib
+import itertools
+import json
+import marshal
+import os
+import re
+import string
+import sys
+import threading
+import urllib.parse
+
+from ws.jsonstream import JsonStream, project
+from ws.parse import Result
+from ws.service_utils import Service
+
+from .index import OPTION_TYPES, IndexedCommand
+
+SERVICES_DIR = '~/.ws/services'
+CACHE_DIR = '~/.ws/cache/declarative'
+SUFFIX = '.json'
+# changes whenever compiled records change, invalidating cached ones
+COMPILER_VERSION = b'2'
+BODIES = (None, 'json', 'form', 'multipart')
+FIELD_SEPARATORS = re.compile(r'[.\[\]]+')
+_MISSING = object()
+
+
+def compile_template(text, where):
+    """
+    Parse str.format template into list of
+    [literal, field path or None, format spec, conversion].
+    """
+    if text is None:
+        return None
+    if not isinstance(text, str):
+        raise Exception('{}: template must be a string'.format(where))
+    parts = []
+    try:
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            path = None
+            if field is not None:
+                path = [int(key) if key.isdigit() else key for key in FIELD_SEPARATORS.split(field) if key]
+                if not path:
+                    raise ValueError('positional field {} in template'.format('{}'))
+            parts.append([literal, path, spec or '', conversion])
+    except ValueError as e:
+        raise Exception('{}: {}'.format(where, e))
+    return parts
+
+
+def lookup(data, path):
+    for key in path:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return _MISSING
+    return data
+
+
+def quote_path_value(value):
+    quoted = urllib.parse.quote(str(value), safe='')
+    if quoted in ('.', '..'):
+        # would be taken as relative path segment
+        quoted = quoted.replace('.', '%2E')
+    return quoted
+
+
+def render(template, data, quote=None):
+    """
+    Format data with compiled template, missing fields are left empty.
+    quote(text), if given, is applied to every formatted field.
+    """
+    parts = []
+    for literal, path, spec, conversion in template:
+        parts.append(literal)
+        if path is not None:
+            value = lookup(data, path)
+            if value is _MISSING:
+                continue
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 's':
+                value = str(value)
+            value = format(value, spec)
+            parts.append(value if quote is None else quote(value))
+    return ''.join(parts)
+
+
+def _check(spec, where, keys):
+    if not isinstance(spec, dict):
+        raise Exception('{}: expected an object'.format(where))
+    unknown = set(spec) - set(keys)
+    if unknown:
+        raise Exception('{}: unknown keys: {}'.format(where, ', '.join(sorted(unknown))))
+
+
+def _compile_flag(spec, where, bindings):
+    _check(spec, where, ('shortname', 'longname', 'help', 'description', 'param', 'value'))
+    if not spec.get('shortname') and not spec.get('longname'):
+        raise Exception('{}: flag needs shortname or longname'.format(where))
+    canonical = spec.get('longname') or spec.get('shortname')
+    bindings.append(['flag', canonical, spec.get('param', canonical), spec.get('value', True)])
+    return {
+        'shortname': spec.get('shortname'),
+        'longname': spec.get('longname'),
+        'canonical': canonical,
+        'default': False,
+        'help': spec.get('help'),
+        'description': spec.get('description'),
+    }
+
+
+def _compile_option(spec, where, bindings):
+    _check(spec, where, ('shortname', 'longname', 'help', 'description', 'param', 'default',
+                         'type', 'required', 'multiple'))
+    if not spec.get('shortname') and not spec.get('longname'):
+        raise Exception('{}: option needs shortname or longname'.format(where))
+    if spec.get('type', 'str') not in OPTION_TYPES:
+        raise Exception('{}: type must be one of: {}'.format(where, ', '.join(OPTION_TYPES)))
+    canonical = spec.get('longname') or spec.get('shortname')
+    bindings.append(['option', canonical, spec.get('param', canonical), spec.get('type', 'str')])
+    return {
+        'shortname': spec.get('shortname'),
+        'longname': spec.get('longname'),
+        'canonical': canonical,
+        'default': spec.get('default'),
+        'help': spec.get('help'),
+        'description': spec.get('description'),
+        'type': spec.get('type', 'str'),
+        'required': bool(spec.get('required', False)),
+        'nargs': 1,
+        'multiple': bool(spec.get('multiple', False)),
+        'flag_value': None,
+    }
+
+
+def _compile_response(spec, where, options):
+    if spec is None:
+        return None
+    _check(spec, where, ('items', 'template', 'header', 'paginate', 'limit'))
+    if spec.get('limit') is not None and spec['limit'] not in options:
+        raise Exception('{}: limit must name an option of the command'.format(where))
+    items = spec.get('items')
+    return {
+        'items': compile_template('{' + items + '}', where + '.items')[0][1] if items else None,
+        'template': compile_template(spec.get('template'), where + '.template'),
+        'header': compile_template(spec.get('header'), where + '.header'),
+        'paginate': bool(spec.get('paginate', False)),
+        'limit': spec.get('limit'),
+    }
+
+
+def compile_command(spec, where, name=None):
+    """
+    Return record of command (in format of ws.services.index records,
+    with request description added) compiled from its spec.
+    """
+    keys = ('name', 'aliases', 'description', 'flags', 'options', 'arguments', 'commands',
+            'params', 'method', 'path', 'body', 'response')
+    if name is not None:
+        keys += ('endpoint', 'http_options', 'fields_param')
+    _check(spec, where, keys)
+    name = name or spec.get('name')
+    if not name or not isinstance(name, str):
+        raise Exception('{}: command needs a name'.format(where))
+    where = '{}.{}'.format(where, name) if spec.get('name') else where
+    bindings = []
+    flags = [_compile_flag(flag, '{}.flags[{}]'.format(where, n), bindings)
+             for n, flag in enumerate(spec.get('flags', []))]
+    options = [_compile_option(option, '{}.options[{}]'.format(where, n), bindings)
+               for n, option in enumerate(spec.get('options', []))]
+    arguments = spec.get('arguments')
+    if arguments is not None:
+        _check(arguments, where + '.arguments', ('help', 'description', 'min_amount', 'max_amount', 'param', 'join'))
+        bindings.append(['arguments', None, arguments.get('param', 'args'), arguments.get('join', ' ')])
+        arguments = dict((key, arguments.get(key)) for key in ('help', 'description', 'min_amount', 'max_amount'))
+    if spec.get('body') not in BODIES:
+        raise Exception('{}: body must be "json", "form" or "multipart"'.format(where))
+    if not isinstance(spec.get('params', {}), dict):
+        raise Exception('{}.params: expected an object'.format(where))
+    record = {
+        'name': name,
+        'aliases': list(spec.get('aliases', [])),
+        'description': spec.get('description'),
+        'flags': flags,
+        'options': options,
+        'arguments': arguments,
+        'commands': [compile_command(cmd, '{}.commands[{}]'.format(where, n))
+                     for n, cmd in enumerate(spec.get('commands', []))],
+        'params': spec.get('params', {}),
+        'bindings': bindings,
+        'method': spec.get('method', 'GET').upper(),
+        'path': compile_template(spec.get('path'), where + '.path'),
+        'body': spec.get('body'),
+        'response': _compile_response(spec.get('response'), where + '.response',
+                                      [option['canonical'] for option in options]),
+    }
+    if 'endpoint' in spec:
+        record['endpoint'] = spec['endpoint']
+    if 'http_options' in spec:
+        record['http_options'] = spec['http_options']
+    if 'fields_param' in spec:
+        record['fields_param'] = spec['fields_param']
+    return record
+
+
+def compile_service(name, data, where):
+    """
+    Return service record compiled from json spec (as bytes).
+    """
+    try:
+        spec = json.loads(data.decode('utf-8'))
+    except ValueError as e:
+        raise Exception('{}: invalid json: {}'.format(where, e))
+    record = compile_command(spec, where, name=name)
+    if not record.get('endpoint'):
+        raise Exception('{}: service needs an endpoint'.format(where))
+    return record
+
+
+class DeclarativeCommand(IndexedCommand):
+    """
+    Command compiled from json spec. Grammar comes from record
+    like with index stubs, but running it sends described request.
+    """
+
+    def bound_params(self):
+        """
+        Return request parameters from flags, options and arguments
+        of this command and its parents.
+        """
+        chain = []
+        command = self
+        while isinstance(command, DeclarativeCommand):
+            chain.append(command)
+            command = command.parent if command.parent is not command else None
+        params = {}
+        for command in reversed(chain):
+            params.update(command.record['params'])
+            for kind, canonical, param, value in command.record['bindings']:
+                if kind == 'flag':
+                    if command.flags.get(canonical):
+                        params[param] = value
+                elif kind == 'option':
+                    given = command.options.get(canonical)
+                    if given is not None:
+                        convert = OPTION_TYPES[value]
+                        params[param] = [convert(v) for v in given] if isinstance(given, list) else convert(given)
+                elif command.arguments:
+                    params[param] = list(command.arguments) if value is None else value.join(command.arguments)
+        return params
+
+    def run(self):
+        if self.command or self.record['path'] is None:
+            return super().run()
+        service = self
+        while service.parent is not service:
+            service = service.parent
+        params = self.bound_params()
+        # values can't change path or add query to it
+        path = render(self.record['path'], params, quote_path_value)
+        for literal, field, spec, conversion in self.record['path']:
+            if field is not None:
+                params.pop(field[0], None)
+        url = path if '://' in path else service.endpoint.rstrip('/') + path
+        params.update(service.fields_params())
+        session = service.session()
+        method = self.record['method']
+        response = self.record['response']
+        files = service.env.files if service.env is not None else []
+        if files and (method == 'GET' or self.record['body'] == 'json'):
+            raise Exception('{} does not send files'.format(self.name))
+        if response is None:
+            from ws.http import iter_body
+            http_response = session.request(method, url, stream=True, **self.request_data(params, files))
+            http_response.raise_for_status()
+            return Result(iter_body(http_response))
+        limit = self.options.get(response['limit']) if response['limit'] else None
+        fields = service.fields()
+        return Result(self.format(self.pages(session, method, url, params, fields, files), response,
+                                  None if limit is None else int(limit), fields, service.wants_records()))
+
+    def request_data(self, params, files=()):
+        from ws.upload import upload_data
+        body = self.record['body']
+        if body == 'json':
+            return {'json': params}
+        elif body == 'multipart' or body == 'form' and files:
+            return upload_data(files, params)
+        elif body == 'form':
+            return {'data': params}
+        elif files:
+            if len(files) > 1:
+                raise Exception('{} sends one file as request body, not {}'.format(self.name, len(files)))
+            return dict(upload_data(files), params=params)
+        return {'params': params}
+
+    def pages(self, session, method, url, params, fields, files=()):
+        """
+        Return iterator of decoded responses. Items at simple paths
+        are decoded as they arrive (pages are ws.jsonstream.JsonStream).
+        """
+        from ws.pagination import decode_json, iter_pages, stream_json
+        items = self.record['response']['items']
+        if items is not None and all(isinstance(key, str) for key in items):
+            decode = stream_json(items, fields)
+        else:
+            decode = decode_json
+        if method == 'GET' and self.record['body'] is None:
+            if self.record['response']['paginate']:
+                return iter_pages(session, url, params, decode=decode, stream=True)
+            return iter_pages(session, url, params, decode=decode, stream=True,
+                              next_page=lambda response: None, lookahead=0)
+        return iter([decode(session.request(method, url, stream=True, **self.request_data(params, files)))])
+
+    def page_items(self, page, fields):
+        """
+        Return (document, iterator of projected items) of decoded page.
+        """
+        if isinstance(page, JsonStream):
+            return page.document, iter(page)
+        items = page if self.record['response']['items'] is None else lookup(page, self.record['response']['items'])
+        if items is _MISSING or items is None:
+            items = []
+        elif not isinstance(items, list):
+            items = [items]
+        return page, iter(project(items, fields))
+
+    def format(self, pages, response, limit, fields, records=False):
+        """
+        Yield items formatted with template, or as records
+        if there is no template or records were asked for.
+        """
+        count = 0
+        with contextlib.closing(pages):
+            for number, page in enumerate(pages):
+                try:
+                    document, items = self.page_items(page, fields)
+                    # with streamed page, reads members preceding items
+                    first = next(items, _MISSING)
+                    if number == 0 and response['header'] and not records:
+                        yield render(response['header'], document)
+                    if first is _MISSING:
+                        return
+                    for item in itertools.chain((first,), items):
+                        yield render(response['template'], item) if response['template'] and not records else item
+                        count += 1
+                        if limit is not None and count >= limit:
+                            return
+                finally:
+                    if isinstance(page, JsonStream):
+                        page.close()
+
+
+class DeclarativeService(DeclarativeCommand, Service):
+    pass
+
+
+def _command_class(record, base):
+    subcommands = tuple(_command_class(cmd, DeclarativeCommand) for cmd in record['commands'])
+    return type(str(record['name']), (base,), {
+        'name': record['name'],
+        'aliases': tuple(record['aliases']),
+        'description': record['description'],
+        'record': record,
+        'subcommands': subcommands,
+    })
+
+
+def service_class(record):
+    """
+    Create DeclarativeService subclass from compiled record.
+    """
+    service = _command_class(record, DeclarativeService)
+    service.endpoint = record['endpoint']
+    service.http_options = record.get('http_options', {})
+    service.fields_param = record.get('fields_param')
+    return service
+
+
+class DeclarativeServices:
+    """
+    Json services from services_dir, keyed by file name without .json.
+    """
+
+    def __init__(self, services_dir=SERVICES_DIR, cache_dir=CACHE_DIR):
+        self.services_dir = os.path.expanduser(services_dir)
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.names = None
+        self.names_stamp = None
+        self.names_checked = False  # since recheck()
+        self.version = 0  # incremented whenever set of services changes
+        self.records = {}  # name: (stamp of json file, compiled record)
+        self.classes = {}  # name: service class
+        self.lock = threading.Lock()  # shared by threads of ws daemon
+
+    def recheck(self):
+        """
+        Make next lookup check services directory for changes again.
+        """
+        self.names_checked = False
+
+    def service_names(self):
+        if self.names_checked:
+            return self.names
+        with self.lock:
+            if self.names_checked:
+                return self.names
+            try:
+                stamp = os.stat(self.services_dir).st_mtime_ns
+            except OSError:
+                stamp = None  # no services directory
+            if self.names is None or stamp != self.names_stamp:
+                names = set()
+                if stamp is not None:
+                    names = set(
+                        name[:-len(SUFFIX)] for name in os.listdir(self.services_dir)
+                        if name.endswith(SUFFIX) and not name.startswith('.')
+                    )
+                if names != self.names:
+                    self.names = names
+                    self.version += 1
+                self.names_stamp = stamp
+            self.names_checked = True
+            return self.names
+
+    def has(self, name):
+        return name in self.service_names()
+
+    def compiled(self, name, path):
+        """
+        Return compiled record of service, from cache if json file
+        with the same contents was compiled before.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        key = hashlib.sha1(COMPILER_VERSION + b'\0' + name.encode('utf-8') + b'\0' + data).hexdigest()
+        cache_path = os.path.join(self.cache_dir, key + '.marshal')
+        try:
+            with open(cache_path, 'rb') as f:
+                return marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        record = compile_service(name, data, path)
+        tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(marshal.dumps(record))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # cache only
+        return record
+
+    def file_stamp(self, name):
+        """
+        Return stamp of json file of service, which changes
+        whenever the file is edited.
+        """
+        stat = os.stat(os.path.join(self.services_dir, name + SUFFIX))
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def stamps(self):
+        """
+        Return sorted list of (name, stamp) of json files of all services.
+        """
+        stamps = []
+        for name in sorted(self.service_names()):
+            try:
+                stamps.append((name, self.file_stamp(name)))
+            except OSError:
+                stamps.append((name, None))
+        return stamps
+
+    def load(self, name):
+        """
+        Return (stamp of json file, compiled record) of service,
+        compiling json file if it changed.
+        """
+        path = os.path.join(self.services_dir, name + SUFFIX)
+        stamp = self.file_stamp(name)
+        loaded = self.records.get(name)
+        if loaded is None or loaded[0] != stamp:
+            with self.lock:
+                loaded = self.records.get(name)
+                if loaded is None or loaded[0] != stamp:
+                    loaded = self.records[name] = (stamp, self.compiled(name, path))
+        return loaded
+
+    def get(self, name):
+        """
+        Return service class.
+        """
+        record = self.load(name)[1]
+        service = self.classes.get(name)
+        if service is None or service.record is not record:
+            service = self.classes[name] = service_class(record)
+        return service
+
+    def _each(self, load):
+        """
+        Return dict of load(name) for all services, skipping
+        (and reporting) invalid specs.
+        """
+        loaded = {}
+        for name in sorted(self.service_names()):
+            try:
+                loaded[name] = load(name)
+            except Exception as e:
+                print('ws: skipping service {}: {}'.format(name, e), file=sys.stderr)
+        return loaded
+
+    def all(self):
+        """
+        Return dict of all service classes.
+        """
+        return self._each(self.get)
+
+    def all_records(self):
+        """
+        Return dict of (stamp, record) of all services.
+        """
+        return self._each(self.load)
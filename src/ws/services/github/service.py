@@ -1,6 +1,11 @@
-import requests
+import contextlib
+import itertools
 
-from ws.public import Service, Command, Option, ArgumentDefinition
+from ws.public import Service, Command, Option, ArgumentDefinition, Result, iter_pages, pages_needed, stream_json
+
+# fields used by text output
+TEXT_FIELDS = [('name',), ('description',), ('html_url',)]
+_END = object()
 
 
 class Search(Command):
@@ -15,19 +20,44 @@ class Search(Command):
         return ArgumentDefinition(min_amount=1)
 
     def run(self):
-        result = requests.get(
+        limit = int(self.options['results'])
+        records = self.parent.wants_records()
+        per_page = min(limit, self.parent.max_per_page)
+        params = {'q': ' '.join(self.arguments), 'per_page': per_page}
+        params.update(self.parent.fields_params())
+        pages = iter_pages(
+            self.parent.session(),
             '{}/search/repositories'.format(self.parent.endpoint),
-            params={'q': ' '.join(self.arguments), 'per_page': int(self.options['results'])}
-        ).json()
-        output = [
-            '{} search results:'.format(result['total_count']),
-        ]
-        for item in result['items']:
-            output.append('{} {}'.format(item['name'], item['description']))
-            output.append(item['html_url'])
-            output.append('')
-        print('\n'.join(output))
-        # return output
+            params=params,
+            decode=stream_json(('items',), self.parent.fields() if records else TEXT_FIELDS),
+            max_pages=pages_needed(limit, per_page),
+            stream=True,
+        )
+        return Result(self.format(pages, limit, records))
+
+    def format(self, pages, limit, records=False):
+        """
+        Yield search results as text, or as records if asked for.
+        """
+        count = 0
+        with contextlib.closing(pages):
+            for page in pages:
+                with contextlib.closing(page):
+                    items = iter(page)
+                    # reads fields preceding items, like total_count
+                    first = next(items, _END)
+                    if not count and not records:
+                        yield '{} search results:\n'.format(page.document.get('total_count'))
+                    if first is _END:
+                        return
+                    for item in itertools.chain((first,), items):
+                        if records:
+                            yield item
+                        else:
+                            yield '{} {}\n{}\n\n'.format(item['name'], item['description'], item['html_url'])
+                        count += 1
+                        if count >= limit:
+                            return
 
 
 class Github(Service):
@@ -35,6 +65,7 @@ class Github(Service):
     name = 'github'
     description = 'Git repository hosting service'
     endpoint = 'https://api.github.com'
+    max_per_page = 100
 
     def available_commands(self):
         return [Search]
@@ -0,0 +1,340 @@
+"""
+On-disk index of installed services.
+
+Discovery, help and shell completion only need names, descriptions
+and command grammar of services. Those are extracted once per service
+version and stored in ~/.ws/cache/services.json, so that service
+modules are imported only when one of their commands is executed.
+
+An index entry is refreshed when modification time or size
+of any file in service package (or its subpackages) changes.
+Service files are checked once per command (see ServiceIndex.recheck).
+"""
+import json
+import os
+import threading
+
+from ws.parse import ArgumentDefinition, Command, Flag, Option
+from ws.service_utils import Service
+
+INDEX_PATH = '~/.ws/cache/services.json'
+INDEX_VERSION = 4
+OPTION_TYPES = {'str': str, 'int': int, 'float': float, 'bool': bool}
+MAX_DEPTH = 8
+
+
+def _jsonable(value):
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return value
+
+
+def describe_flag(flag):
+    return {
+        'shortname': flag.shortname,
+        'longname': flag.longname,
+        'canonical': flag.canonical,
+        'default': _jsonable(flag.default),
+        'help': flag.help,
+        'description': flag.description,
+    }
+
+
+def describe_option(option):
+    return {
+        'shortname': option.shortname,
+        'longname': option.longname,
+        'canonical': option.canonical,
+        'default': _jsonable(option.default),
+        'help': option.help,
+        'description': option.description,
+        'type': getattr(option.type, '__name__', 'str'),
+        'required': option.required,
+        'nargs': option.nargs,
+        'multiple': option.multiple,
+        'flag_value': _jsonable(option.flag_value),
+    }
+
+
+def describe_command(command, depth=0):
+    """
+    Return json-serializable grammar of command instance.
+    """
+    arg_def = command.argument_definition()
+    record = {
+        'name': command.name,
+        'aliases': list(command.aliases),
+        'description': command.description,
+        'flags': [describe_flag(flag) for flag in command.available_flags()],
+        'options': [describe_option(option) for option in command.available_options()],
+        'arguments': None,
+        'commands': [],
+    }
+    if arg_def:
+        record['arguments'] = {
+            'help': arg_def.help,
+            'description': arg_def.description,
+            'min_amount': arg_def.min_amount,
+            'max_amount': arg_def.max_amount,
+        }
+    if depth < MAX_DEPTH:
+        record['commands'] = [
+            describe_command(cmd(parent=command), depth + 1)
+            for cmd in command.available_commands()
+        ]
+    return record
+
+
+def describe_service(service_class):
+    return describe_command(service_class(env=None))
+
+
+def _stamp(dirname):
+    """
+    Return value that changes whenever any file in directory
+    or its subdirectories changes.
+    """
+    stamp = []
+    for root, dirs, files in os.walk(dirname):
+        dirs[:] = [name for name in dirs if name != '__pycache__' and not name.startswith('.')]
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stamp.append([os.path.relpath(path, dirname), stat.st_mtime_ns, stat.st_size])
+    stamp.sort()
+    return stamp
+
+
+class IndexedCommand(Command):
+    """
+    Command stub with grammar taken from index entry.
+
+    It parses exactly like command it was created from, but running it
+    is left to real command class (see IndexedService.run).
+    """
+    record = None
+    subcommands = ()
+
+    def available_flags(self):
+        return [Flag(**flag) for flag in self.record['flags']]
+
+    def available_options(self):
+        options = []
+        for option in self.record['options']:
+            option = dict(option, type=OPTION_TYPES.get(option['type'], str))
+            options.append(Option(**option))
+        return options
+
+    def argument_definition(self):
+        if self.record['arguments'] is None:
+            return None
+        return ArgumentDefinition(**self.record['arguments'])
+
+    def available_commands(self):
+        return list(self.subcommands)
+
+
+class IndexedService(IndexedCommand, Service):
+    """
+    Service stub. Real service module is imported
+    when the service is about to run.
+    """
+    service_manager = None
+    service_name = None  # name of service package
+
+    def load(self):
+        """
+        Return instance of real service class
+        with the same parsed flags, options, arguments and commands.
+        """
+        real_class = self.service_manager.load_service(self.service_name)
+        return transfer_state(self, real_class(env=self.env))
+
+    def resolve(self):
+        return self.load()
+
+    def run(self):
+        return self.load().run()
+
+
+def transfer_state(source, target):
+    target.flags.update(source.flags)
+    target.options.update(source.options)
+    target.arguments = source.arguments
+    if source.command:
+        command_class = target.get_command(source.command.name)
+        target.command = transfer_state(source.command, command_class(target))
+    return target
+
+
+def _command_stub(record, base):
+    subcommands = tuple(_command_stub(cmd, IndexedCommand) for cmd in record['commands'])
+    return type(str(record['name']), (base,), {
+        'name': record['name'],
+        'aliases': tuple(record['aliases']),
+        'description': record['description'],
+        'record': record,
+        'subcommands': subcommands,
+    })
+
+
+def service_stub(service_name, record, service_manager):
+    """
+    Create IndexedService subclass from index entry.
+    """
+    stub = _command_stub(record, IndexedService)
+    stub.service_manager = service_manager
+    stub.service_name = service_name
+    return stub
+
+
+class ServiceIndex:
+    """
+    Service records, keyed by service name,
+    kept in sync with service packages in services_dir.
+
+    Shared by threads of ws daemon, so checking service files,
+    refreshing records and saving index is done under lock.
+    """
+
+    def __init__(self, services_dir, load_service, path=INDEX_PATH):
+        self.services_dir = services_dir
+        self.load_service = load_service
+        self.path = os.path.expanduser(path)
+        self.entries = None
+        self.names = None
+        self.names_stamp = None
+        self.dirty = False
+        self.version = 0  # incremented whenever set of services changes
+        # names and entries checked against service files since recheck()
+        self.names_checked = False
+        self.checked = set()
+        # reentrant, as refreshing record loads service,
+        # which may look up services too
+        self.lock = threading.RLock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get('version') == INDEX_VERSION and data.get('services_dir') == self.services_dir:
+            self.entries = data['services']
+        else:
+            self.entries = {}
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {'version': INDEX_VERSION, 'services_dir': self.services_dir, 'services': self.entries}
+            tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                # index is only a cache, we can live without saving it
+                return
+            self.dirty = False
+
+    def recheck(self):
+        """
+        Make next lookups check service files for changes again.
+        """
+        with self.lock:
+            self.names_checked = False
+            self.checked = set()
+
+    def service_names(self):
+        """
+        Return set of names of installed services.
+        """
+        if self.names_checked:
+            return self.names
+        with self.lock:
+            if self.names_checked:
+                return self.names
+            stamp = os.stat(self.services_dir).st_mtime_ns
+            if self.names is None or stamp != self.names_stamp:
+                names = set(
+                    name for name in os.listdir(self.services_dir)
+                    if not name.startswith('__') and not name.startswith('.')
+                    and os.path.isdir(os.path.join(self.services_dir, name))
+                )
+                if names != self.names:
+                    self.names = names
+                    self.version += 1
+                self.names_stamp = stamp
+            self.names_checked = True
+            return self.names
+
+    def cached(self, name):
+        """
+        Return record of a service as currently stored in index
+        (possibly stale or None), without checking service files.
+        """
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            entry = self.entries.get(name)
+            return entry['service'] if entry else None
+
+    def has(self, name):
+        return name in self.service_names()
+
+    def stamp(self, name):
+        """
+        Return stamp of service files its record was made from, or None.
+        """
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            entry = self.entries.get(name)
+            return entry['stamp'] if entry else None
+
+    def _refresh(self, name):
+        if self.entries is None:
+            self._load()
+        entry = self.entries.get(name)
+        if entry is not None and name in self.checked:
+            return entry['service']
+        stamp = _stamp(os.path.join(self.services_dir, name))
+        if entry is None or entry['stamp'] != stamp:
+            entry = {'stamp': stamp, 'service': describe_service(self.load_service(name))}
+            self.entries[name] = entry
+            self.dirty = True
+        self.checked.add(name)
+        return entry['service']
+
+    def get(self, name):
+        """
+        Return record of a single service, refreshing it if needed.
+        """
+        with self.lock:
+            record = self._refresh(name)
+            self.save()
+            return record
+
+    def all(self):
+        """
+        Return dict of records of all services, refreshing stale ones.
+        """
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            names = self.service_names()
+            records = dict((name, self._refresh(name)) for name in sorted(names))
+            for name in list(self.entries):
+                if name not in names:
+                    del self.entries[name]
+                    self.dirty = True
+            self.save()
+            return records
@@ -0,0 +1,352 @@
+"""
+Ranked search over installed services, for :search command.
+
+Service names, descriptions, command names and help texts are split into
+terms and kept in an inverted index (term: services with weighted frequency)
+stored with marshal in ~/.ws/cache/search.marshal. It is built from
+service records (see ws.services.index and ws.services.declarative),
+so no service module is imported, and updated incrementally: only
+services whose stamp changed are indexed again. Nothing is checked
+at all while service directories, service index file and json files
+of declarative services are unchanged.
+
+Results are ranked with BM25. Query terms match index terms exactly,
+as prefixes (weighted less) and, when they don't match anything,
+with one typo (edit distance 1, weighted even less).
+"""
+import array
+import bisect
+import heapq
+import itertools
+import math
+import marshal
+import os
+import re
+
+SEARCH_VERSION = 1
+TERM = re.compile(r'[a-z0-9]+')
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+# weights of fields in term frequencies
+NAME_WEIGHT = 3
+COMMAND_WEIGHT = 2
+TEXT_WEIGHT = 1
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+PREFIX_FACTOR = 0.7
+FUZZY_FACTOR = 0.5
+MIN_PREFIX = 2
+MIN_FUZZY = 4
+MAX_EXPANSIONS = 50
+
+
+def terms(text):
+    return TERM.findall(text.lower()) if text else []
+
+
+def record_terms(record, counts=None, weight=NAME_WEIGHT):
+    """
+    Return dict of weighted term frequencies of service or command record.
+    """
+    if counts is None:
+        counts = {}
+
+    def add(text, weight):
+        for term in terms(text):
+            counts[term] = counts.get(term, 0) + weight
+
+    add(record['name'], weight)
+    for alias in record['aliases']:
+        add(alias, weight)
+    add(record['description'], TEXT_WEIGHT)
+    for item in record['flags'] + record['options']:
+        add(item['longname'], TEXT_WEIGHT)
+        add(item['help'], TEXT_WEIGHT)
+        add(item['description'], TEXT_WEIGHT)
+    if record['arguments']:
+        add(record['arguments']['help'], TEXT_WEIGHT)
+        add(record['arguments']['description'], TEXT_WEIGHT)
+    for command in record['commands']:
+        record_terms(command, counts, COMMAND_WEIGHT)
+    return counts
+
+
+def edits(word):
+    """
+    Yield words at edit distance 1 from word.
+    """
+    for idx in range(len(word) + 1):
+        head, tail = word[:idx], word[idx:]
+        if tail:
+            yield head + tail[1:]
+            if len(tail) > 1:
+                yield head + tail[1] + tail[0] + tail[2:]
+        for char in ALPHABET:
+            yield head + char + tail
+            if tail:
+                yield head + char + tail[1:]
+
+
+def sources_stamp(service_manager):
+    """
+    Return value that changes whenever set of services, service
+    index or json file of any declarative service changes.
+    """
+    stamp = []
+    for path in (service_manager.index.services_dir, service_manager.index.path,
+                 service_manager.declarative.services_dir):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stamp.append(None)
+        else:
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+    stamp.append(service_manager.declarative.stamps())
+    return stamp
+
+
+class SearchIndex:
+    """
+    Inverted index of services, kept in file at path.
+
+    Services get numeric ids (slots of removed ones are reused),
+    postings are arrays of (id, frequency) pairs stored as bytes, so
+    loading index doesn't create objects for every posting. Stamps and
+    terms of services, needed only to update index, are kept marshalled
+    separately and loaded when update is needed.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.stamp = None
+        self.names = None  # service name by id, None for free slots
+        self.descriptions = None
+        self.lengths = None  # array of weighted lengths, by id
+        self.postings = None  # term: bytes of array of (id, frequency) pairs
+        self.terms = None  # sorted terms, for prefix matching
+        self.count = 0
+        self.total_length = 0
+        self.updates = None  # marshalled stamps and terms by id, until needed
+        self.ids = None  # name: id
+        self.free = None  # ids of free slots
+        self.changed = {}  # term: {id: frequency} for postings changed since saved
+        self.doc_stamps = None
+        self.doc_terms = None  # space separated terms, by id
+        self.dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = marshal.loads(f.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            data = {}
+        if data.get('version') == SEARCH_VERSION:
+            self.stamp = data['stamp']
+            self.names = data['names']
+            self.descriptions = data['descriptions']
+            self.lengths = array.array('I', data['lengths'])
+            self.postings = data['postings']
+            self.terms = data['terms']
+            self.count = data['count']
+            self.total_length = data['total_length']
+            self.updates = data['updates']
+        else:
+            self.stamp = None
+            self.names = []
+            self.descriptions = []
+            self.lengths = array.array('I')
+            self.postings = {}
+            self.terms = []
+            self.count = 0
+            self.total_length = 0
+            self.updates = marshal.dumps(([], []))
+
+    def _prepare_update(self):
+        if self.ids is None:
+            self.doc_stamps, self.doc_terms = marshal.loads(self.updates)
+            self.ids = dict((name, doc_id) for doc_id, name in enumerate(self.names) if name is not None)
+            self.free = [doc_id for doc_id, name in enumerate(self.names) if name is None]
+
+    def save(self):
+        if not self.dirty:
+            return
+        if self.ids is not None:
+            self.updates = marshal.dumps((self.doc_stamps, self.doc_terms))
+        for term, posting in self.changed.items():
+            self.postings[term] = array.array('I', itertools.chain.from_iterable(posting.items())).tobytes()
+        self.changed = {}
+        data = {
+            'version': SEARCH_VERSION,
+            'stamp': self.stamp,
+            'names': self.names,
+            'descriptions': self.descriptions,
+            'lengths': self.lengths.tobytes(),
+            'postings': self.postings,
+            'terms': self.sorted_terms(),
+            'count': self.count,
+            'total_length': self.total_length,
+            'updates': self.updates,
+        }
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(marshal.dumps(data))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # can be built again
+            return
+        self.dirty = False
+
+    def posting(self, term):
+        """
+        Return posting of term as {id: frequency}, to be changed.
+        """
+        posting = self.changed.get(term)
+        if posting is None:
+            pairs = iter(array.array('I', self.postings[term]))
+            posting = self.changed[term] = dict(zip(pairs, pairs))
+        return posting
+
+    def pairs(self, term):
+        """
+        Return list of (id, frequency) in posting of term.
+        """
+        posting = self.changed.get(term)
+        if posting is not None:
+            return list(posting.items())
+        pairs = iter(array.array('I', self.postings[term]))
+        return list(zip(pairs, pairs))
+
+    def sorted_terms(self):
+        if self.terms is None:
+            self.terms = sorted(self.postings)
+        return self.terms
+
+    def add(self, name, stamp, record):
+        self._prepare_update()
+        self.remove(name)
+        counts = record_terms(record)
+        length = sum(counts.values())
+        if self.free:
+            doc_id = self.free.pop()
+        else:
+            doc_id = len(self.names)
+            self.names.append(None)
+            self.descriptions.append(None)
+            self.lengths.append(0)
+            self.doc_stamps.append(None)
+            self.doc_terms.append(None)
+        self.ids[name] = doc_id
+        self.names[doc_id] = name
+        self.descriptions[doc_id] = record['description']
+        self.lengths[doc_id] = length
+        self.doc_stamps[doc_id] = stamp
+        self.doc_terms[doc_id] = ' '.join(counts)
+        self.count += 1
+        self.total_length += length
+        for term, frequency in counts.items():
+            if term not in self.postings:
+                self.postings[term] = b''
+                self.terms = None
+            self.posting(term)[doc_id] = frequency
+        self.dirty = True
+
+    def remove(self, name):
+        self._prepare_update()
+        doc_id = self.ids.pop(name, None)
+        if doc_id is None:
+            return
+        for term in self.doc_terms[doc_id].split():
+            posting = self.posting(term)
+            del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+                del self.changed[term]
+                self.terms = None
+        self.count -= 1
+        self.total_length -= self.lengths[doc_id]
+        self.names[doc_id] = self.descriptions[doc_id] = None
+        self.doc_stamps[doc_id] = self.doc_terms[doc_id] = None
+        self.lengths[doc_id] = 0
+        self.free.append(doc_id)
+        self.dirty = True
+
+    def update(self, service_manager, force=False):
+        """
+        Index new and changed services, drop removed ones.
+        With force, every service is checked even if service
+        directories look unchanged.
+        """
+        if self.names is None:
+            self._load()
+        if not force and self.stamp == sources_stamp(service_manager):
+            return
+        records = service_manager.service_records()
+        self._prepare_update()
+        for name in list(self.ids):
+            if name not in records:
+                self.remove(name)
+        for name, (stamp, record) in records.items():
+            doc_id = self.ids.get(name)
+            if doc_id is None or self.doc_stamps[doc_id] != stamp:
+                self.add(name, stamp, record)
+        # taken after reading records, which may update service index
+        stamp = sources_stamp(service_manager)
+        if stamp != self.stamp:
+            self.stamp = stamp
+            self.dirty = True
+        self.save()
+
+    def expand(self, word):
+        """
+        Return list of (term, factor) index terms matching query word.
+        """
+        matches = []
+        if word in self.postings:
+            matches.append((word, 1.0))
+        if len(word) >= MIN_PREFIX:
+            index_terms = self.sorted_terms()
+            prefixed = []
+            idx = bisect.bisect_left(index_terms, word)
+            while idx < len(index_terms) and index_terms[idx].startswith(word):
+                if index_terms[idx] != word:
+                    prefixed.append(index_terms[idx])
+                idx += 1
+            if len(prefixed) > MAX_EXPANSIONS:
+                # the most common ones
+                prefixed.sort(key=lambda term: -len(self.pairs(term)))
+                del prefixed[MAX_EXPANSIONS:]
+            matches.extend((term, PREFIX_FACTOR) for term in prefixed)
+        if not matches and len(word) >= MIN_FUZZY:
+            similar = set(term for term in edits(word) if term in self.postings)
+            matches.extend((term, FUZZY_FACTOR) for term in sorted(similar)[:MAX_EXPANSIONS])
+        return matches
+
+    def search(self, query, limit=10):
+        """
+        Return list of (score, name, description) of best matching
+        services, best first.
+        """
+        if self.names is None:
+            self._load()
+        if not self.count:
+            return []
+        average_length = self.total_length / self.count
+        lengths = self.lengths
+        scores = {}
+        for word in set(terms(query)):
+            word_scores = {}
+            for term, factor in self.expand(word):
+                pairs = self.pairs(term)
+                idf = math.log(1 + (self.count - len(pairs) + 0.5) / (len(pairs) + 0.5))
+                weight = factor * idf * (K1 + 1)
+                for doc_id, frequency in pairs:
+                    score = weight * frequency / (frequency + K1 * (1 - B + B * lengths[doc_id] / average_length))
+                    # best of matches of the same word
+                    if score > word_scores.get(doc_id, 0):
+                        word_scores[doc_id] = score
+            for doc_id, score in word_scores.items():
+                scores[doc_id] = scores.get(doc_id, 0) + score
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self.names[item[0]]))
+        return [(score, self.names[doc_id], self.descriptions[doc_id]) for doc_id, score in best]
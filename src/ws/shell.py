@@ -0,0 +1,132 @@
+"""
+Interactive shell.
+
+Imported lazily by WsCommand.run_shell, as prompt_toolkit and pygments
+are only needed when ws is used interactively.
+"""
+import os
+import sys
+import traceback
+
+from .completion import CompletionIndex
+from .lineparser import LineParser
+from .tokenize import tokenize, TokenType
+from .utils import quit
+
+try:
+    from prompt_toolkit.shortcuts import get_input
+    from prompt_toolkit.history import FileHistory
+    from prompt_toolkit.validation import Validator
+    from prompt_toolkit.completion import Completer, Completion
+    from prompt_toolkit.layout.lexers import Lexer
+except ImportError:
+    quit('Cannot import prompt_toolkit. Please install it.', exitcode=1)
+
+# pygment is prompt_toolkit dependency, so we know its there
+from pygments import token as pygment_token
+
+from . import VERSION_STR, WsCommand, pipeline, setup_user_directories
+
+
+class WsCmdValidator(Validator):
+
+    def __init__(self, line_parser):
+        self.line_parser = line_parser
+        super().__init__()
+
+    def validate(self, document):
+        parsed = self.line_parser.parse(document.text)
+        if parsed.error is not None:
+            # raise ValidationError(message=repr(parsed.error), index=0)
+            raise parsed.error
+
+
+class WsCompleter(Completer):
+
+    def __init__(self, line_parser, completion_index):
+        self.line_parser = line_parser
+        self.completion_index = completion_index
+
+    def get_completions(self, document, complete_event):
+        word = document.get_word_before_cursor(WORD=True)
+        text = document.text_before_cursor
+        parsed = self.line_parser.parse(text[:len(text) - len(word)])
+        levels = parsed.levels()
+        if not levels:
+            return
+        command = levels[-1][0]
+        for completion, meta in self.completion_index.complete(command, word):
+            yield Completion(completion, -len(word), display_meta=meta)
+
+
+class WsLexer(Lexer):
+
+    def __init__(self, line_parser):
+        super().__init__()
+        self.line_parser = line_parser
+
+    def get_tokens(self, cli, text):
+        tokens = []
+        if not text:
+            return tokens
+        position = 0
+        for ws_token in self.line_parser.parse(text).tokens:
+            if ws_token.position > position:
+                tokens.append((pygment_token.Whitespace, text[position:ws_token.position]))
+            token_type = pygment_token.Generic
+            if ws_token.tokentype == TokenType.Service:
+                token_type = pygment_token.Keyword
+            elif ws_token.tokentype == TokenType.Flag:
+                token_type = pygment_token.Number
+            elif ws_token.tokentype == TokenType.OptionName:
+                token_type = pygment_token.Literal
+            elif ws_token.tokentype == TokenType.Command:
+                token_type = pygment_token.Operator
+
+            tokens.append((token_type, text[ws_token.position:ws_token.end]))
+            position = ws_token.end
+        if len(text) > position:
+                tokens.append((pygment_token.Whitespace, text[position:]))
+        return tokens
+
+
+def run_shell(service_manager):
+    """
+    Run interactive shell
+    """
+    print('Welcome to ws shell (v{}) '.format(VERSION_STR))
+    print('type :help for help, type :q or press ^D to quit')
+    setup_user_directories()
+    histfile = os.path.join(os.path.expanduser("~/.ws"), "history")
+    history = FileHistory(histfile)
+    prompt = 'ws: '
+    # shared by lexer, validator and completer,
+    # so that each version of the line is parsed once
+    line_parser = LineParser(lambda: WsCommand(None, service_manager=service_manager))
+    completer = WsCompleter(line_parser, CompletionIndex(service_manager))
+    validator = WsCmdValidator(line_parser)
+    lexer = WsLexer(line_parser)
+
+    while True:
+        service_manager.recheck()
+        try:
+            line = get_input(
+                prompt,
+                history=history,
+                validator=validator,
+                completer=completer,
+                lexer=lexer
+            ).strip()
+        except EOFError:
+            quit()
+        tokens = tokenize(line)
+        if pipeline.is_pipeline(tokens):
+            pipeline.run(tokens, service_manager)
+            continue
+        wscmd = WsCommand(None, service_manager=service_manager)
+        try:
+            wscmd.parse(tokens)
+            wscmd.run()
+        except Exception as e:
+            print('error: ' + repr(e), file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
@@ -0,0 +1,136 @@
+"""
+Coalescing of identical concurrent calls (single flight).
+
+When the shell, :batch, :map or a pipeline run the same request
+at the same time, only the first caller (leader) makes it, others
+wait for its result and get it too. Results are also kept for
+a short memo window, so requests following right after are answered
+without network as well. Errors are shared with waiting callers,
+but not kept.
+
+Used by ws.http for GET requests, keyed by method, url (with query
+parameters) and credentials, see ws.http.WsAdapter.
+"""
+import collections
+import threading
+import time
+
+MEMO_TTL = 1.0  # seconds
+
+
+class Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.shared = True
+        self.expires = None
+
+
+class SingleFlight:
+    """
+    Calls in progress and memoized results of this process, by key.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.expiring = collections.deque()  # (expiry time, key) of memoized values
+        self.lock = threading.Lock()
+        self.stats = {'misses': 0, 'joined': 0, 'hits': 0, 'unshared': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def call(self, key, func, ttl=MEMO_TTL):
+        """
+        Return value of func() for key, calling it only if no other
+        thread is calling it for the same key, and no value was
+        returned in last ttl seconds.
+
+        func returns (value, shared): when shared is false (like
+        response too large to keep), value goes to the leader only,
+        and waiting callers call func themselves.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None and flight.expires is not None and flight.expires <= time.monotonic():
+                del self.flights[key]
+                flight = None
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                leader = True
+                self.stats['misses'] += 1
+            else:
+                leader = False
+                self.stats['hits' if flight.done.is_set() else 'joined'] += 1
+        if leader:
+            return self.lead(key, flight, func, ttl)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        if not flight.shared:
+            self.count('unshared')
+            return func()[0]
+        return flight.value
+
+    def lead(self, key, flight, func, ttl):
+        try:
+            flight.value, flight.shared = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            # interrupted, let waiting callers try themselves
+            flight.shared = False
+            raise
+        finally:
+            with self.lock:
+                if flight.error is not None or not flight.shared or ttl <= 0:
+                    if self.flights.get(key) is flight:
+                        del self.flights[key]
+                else:
+                    now = time.monotonic()
+                    flight.expires = now + ttl
+                    self.expiring.append((flight.expires, key))
+                    self.expire(now)
+            flight.done.set()
+        return flight.value
+
+    def forget(self, match):
+        """
+        Drop memoized values of keys for which match(key) is true.
+        Calls in progress are left alone.
+        """
+        with self.lock:
+            for key, flight in list(self.flights.items()):
+                if flight.expires is not None and match(key):
+                    del self.flights[key]
+
+    def expire(self, now):
+        """
+        Drop memoized values past their window. Called with lock held.
+        """
+        expiring = self.expiring
+        while expiring and expiring[0][0] <= now:
+            key = expiring.popleft()[1]
+            flight = self.flights.get(key)
+            if flight is not None and flight.expires is not None and flight.expires <= now:
+                del self.flights[key]
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """
+    Return process-wide SingleFlight.
+    """
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -1,3 +1,4 @@
+import re
 from enum import Enum
 
 
@@ -13,29 +14,80 @@ class TokenType(Enum):
 
 
 class Token:
+    """
+    Word of command line.
+
+    text is the word with quotes and escapes removed,
+    text[position:end] of the line is the word as it was typed.
+    """
+    __slots__ = ('text', 'position', 'end', 'tokentype')
 
-    def __init__(self, text, position, tokentype=TokenType.Unknown):
+    def __init__(self, text, position, tokentype=TokenType.Unknown, end=None):
         self.text = text
         self.tokentype = tokentype
         self.position = position
+        self.end = position + len(text) if end is None else end
+
+
+# word is a run of plain characters, quoted strings and escaped characters,
+# unterminated quote or trailing backslash extend the word to end of line
+WORD = re.compile(r"""(?:[^\s'"\\]+|'[^']*'?|"(?:[^"\\]|\\.?)*"?|\\.?)+""", re.S)
+WORD_PART = re.compile(r"""([^'"\\]+)|'([^']*)'?|"((?:[^"\\]|\\.?)*)"?|\\(.?)""", re.S)
+# inside double quotes backslash escapes only these, as in sh
+DOUBLE_QUOTED_ESCAPE = re.compile(r"""\\([\\"$`])""")
+SPECIAL = re.compile(r"""['"\\]""")
+
+
+def unquote(word):
+    """
+    Remove quotes and escapes from word, shell-style.
+    """
+    quote = word[0]
+    if quote in '\'"' and len(word) > 1 and word[-1] == quote and not SPECIAL.search(word, 1, len(word) - 1):
+        return word[1:-1]
+    parts = []
+    for plain, single, double, escaped in WORD_PART.findall(word):
+        if double:
+            parts.append(DOUBLE_QUOTED_ESCAPE.sub(r'\1', double))
+        else:
+            # only one group matched, others are empty
+            parts.append(plain or single or escaped)
+    return ''.join(parts)
 
 
 def tokenize(text):
     """
-    Split text into tokens
+    Split text into tokens, handling single and double quotes
+    and backslash escapes like sh does.
     """
     tokens = []
-    if not text:
+    append = tokens.append
+    if not SPECIAL.search(text):
+        # nothing to unquote, str.split is much faster than regex
+        find = text.find
+        position = 0
+        for word in text.split():
+            position = find(word, position)
+            append(Token(word, position))
+            position += len(word)
         return tokens
-    in_space = text[0].isspace()
-    start = 0
-    for idx, ch in enumerate(text):
-        if ch.isspace() != in_space:
-            if not in_space:
-                tokens.append(Token(text[start:idx], start))
-            in_space = ch.isspace()
-            start = idx
-    if not in_space:
-        tokens.append(Token(text[start:], start))
-    # TODO: handle quotes and double quotes and escape sequences
+    for match in WORD.finditer(text):
+        word = match.group()
+        if '"' in word or "'" in word or '\\' in word:
+            append(Token(unquote(word), match.start(), end=match.end()))
+        else:
+            append(Token(word, match.start()))
+    return tokens
+
+
+def argv_tokens(argv):
+    """
+    Create tokens from already split arguments (like sys.argv),
+    with positions as if they were joined by single spaces.
+    """
+    tokens = []
+    idx = 0
+    for arg in argv:
+        tokens.append(Token(arg, idx))
+        idx += len(arg) + 1
     return tokens
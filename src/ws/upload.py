@@ -0,0 +1,165 @@
+"""
+Streaming file uploads.
+
+Files given with `ws --file remotename localname ...` are available
+to services as Env.files, and sent with Service.upload_data() (json
+services send them from commands with "body", see
+ws.services.declarative). Their content is never read into memory whole:
+regular files are memory-mapped and sent in slices, pipes and standard
+input are read in chunks and sent with chunked transfer encoding.
+"""
+import mmap
+import os
+import stat
+import sys
+import uuid
+
+from .utils import resolve_path
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadFile:
+    """
+    Local file to be sent under remote name.
+    "-" as path means standard input.
+    """
+
+    def __init__(self, name, path, content_type='application/octet-stream'):
+        self.name = name
+        self.path = path
+        self.content_type = content_type
+
+    @property
+    def filename(self):
+        return 'stdin' if self.path == '-' else os.path.basename(self.path)
+
+    def open(self):
+        if self.path == '-':
+            return sys.stdin.buffer
+        return open(resolve_path(self.path), 'rb')
+
+    def size(self):
+        """
+        Return file size, or None if not known upfront (pipes, stdin).
+        """
+        if self.path == '-':
+            return None
+        st = os.stat(resolve_path(self.path))
+        return st.st_size if stat.S_ISREG(st.st_mode) else None
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Yield file content in chunks (memoryviews of mapped file,
+        or bytes for streams).
+        """
+        f = self.open()
+        try:
+            size = self.size()
+            if size:
+                yield from _mapped_chunks(f, size, chunk_size)
+            elif size is None:
+                read = getattr(f, 'read1', f.read)
+                while True:
+                    chunk = read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            # stdin is not ours to close
+            if self.path != '-':
+                f.close()
+
+    def body(self, chunk_size=CHUNK_SIZE):
+        """
+        Return request body streaming file content.
+        """
+        return StreamingBody([lambda: self.chunks(chunk_size)], self.size())
+
+
+def _mapped_chunks(f, size, chunk_size):
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, 'madvise'):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mapped)
+    try:
+        for offset in range(0, size, chunk_size):
+            yield view[offset:offset + chunk_size]
+    finally:
+        try:
+            view.release()
+            mapped.close()
+        except BufferError:
+            # last chunk is still referenced by its consumer,
+            # mapping will be released with it
+            pass
+
+
+class StreamingBody:
+    """
+    Request body produced by generators, for requests' data argument.
+
+    When total length is known it is exposed as `len` attribute,
+    so that Content-Length is sent; otherwise requests falls back
+    to chunked transfer encoding.
+    """
+
+    def __init__(self, parts, length=None):
+        # bytes, or callables returning iterables of chunks
+        self.parts = parts
+        if length is not None:
+            self.len = length
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                yield from part()
+
+
+def multipart(fields=None, files=(), boundary=None, chunk_size=CHUNK_SIZE):
+    """
+    Return (body, content type) of multipart/form-data request
+    with given fields (dict of names to str values) and UploadFiles.
+    """
+    boundary = boundary or uuid.uuid4().hex
+    delimiter = '--{}\r\n'.format(boundary).encode('ascii')
+    parts = []
+    length = 0
+    for name, value in (fields or {}).items():
+        part = (
+            delimiter
+            + 'Content-Disposition: form-data; name="{}"\r\n\r\n'.format(name).encode('utf-8')
+            + str(value).encode('utf-8') + b'\r\n'
+        )
+        parts.append(part)
+        length += len(part)
+    for upload in files:
+        header = (
+            delimiter
+            + 'Content-Disposition: form-data; name="{}"; filename="{}"\r\n'.format(
+                upload.name, upload.filename).encode('utf-8')
+            + 'Content-Type: {}\r\n\r\n'.format(upload.content_type).encode('ascii')
+        )
+        parts.extend([header, lambda upload=upload: upload.chunks(chunk_size), b'\r\n'])
+        size = upload.size()
+        length = None if length is None or size is None else length + len(header) + size + 2
+    closing = '--{}--\r\n'.format(boundary).encode('ascii')
+    parts.append(closing)
+    if length is not None:
+        length += len(closing)
+    return StreamingBody(parts, length), 'multipart/form-data; boundary=' + boundary
+
+
+def upload_data(files, fields=None):
+    """
+    Return keyword arguments for session.request sending files:
+    multipart/form-data with fields and files, or content of the only
+    file as request body, if fields is None.
+    """
+    if fields is None and len(files) == 1:
+        upload = files[0]
+        return {'data': upload.body(), 'headers': {'Content-Type': upload.content_type}}
+    body, content_type = multipart(fields, files)
+    return {'data': body, 'headers': {'Content-Type': content_type}}
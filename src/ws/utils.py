@@ -1,3 +1,6 @@
+import contextlib
+import contextvars
+import os
 import sys
 
 
@@ -16,3 +19,82 @@ def quit(msg='Bye', exitcode=0):
         else:
             print(msg)
     sys.exit(exitcode)
+
+
+class ContextStream:
+    """
+    File-like proxy writing to (or reading from) a stream chosen per context.
+
+    Installed in place of sys.stdout/sys.stderr/sys.stdin when ws runs
+    several commands at once in one process (daemon, batch runs),
+    so every command sees its own standard streams.
+    """
+
+    def __init__(self, default):
+        self._default = default
+        self._target = contextvars.ContextVar('stream', default=None)
+
+    def get(self):
+        target = self._target.get()
+        return self._default if target is None else target
+
+    def set(self, stream):
+        return self._target.set(stream)
+
+    def reset(self, token):
+        self._target.reset(token)
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __iter__(self):
+        return iter(self.get())
+
+
+def install_context_stdio():
+    """
+    Replace sys.stdin, sys.stdout and sys.stderr with ContextStream proxies.
+    """
+    for name in ('stdin', 'stdout', 'stderr'):
+        stream = getattr(sys, name)
+        if not isinstance(stream, ContextStream):
+            setattr(sys, name, ContextStream(stream))
+
+
+_current_dir = contextvars.ContextVar('current_dir', default=None)
+
+
+@contextlib.contextmanager
+def redirect_stdio(stdin=None, stdout=None, stderr=None, cwd=None):
+    """
+    Temporarily redirect standard streams for current context.
+    Installs ContextStream proxies (see install_context_stdio) on first use.
+
+    cwd sets directory used by resolve_path,
+    process working directory is left untouched.
+    """
+    install_context_stdio()
+    tokens = []
+    for name, stream in (('stdin', stdin), ('stdout', stdout), ('stderr', stderr)):
+        if stream is not None:
+            proxy = getattr(sys, name)
+            tokens.append((proxy, proxy.set(stream)))
+    cwd_token = _current_dir.set(cwd) if cwd is not None else None
+    try:
+        yield
+    finally:
+        for proxy, token in reversed(tokens):
+            proxy.reset(token)
+        if cwd_token is not None:
+            _current_dir.reset(cwd_token)
+
+
+def resolve_path(path):
+    """
+    Return absolute path, resolving relative paths against directory
+    of the caller that issued current command.
+    """
+    cwd = _current_dir.get()
+    if cwd is None:
+        return os.path.abspath(os.path.expanduser(path))
+    return os.path.normpath(os.path.join(cwd, os.path.expanduser(path)))
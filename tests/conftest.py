@@ -0,0 +1,6 @@
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'src')
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
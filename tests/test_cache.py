@@ -0,0 +1,75 @@
+import http.server
+import threading
+
+import pytest
+import requests
+
+from ws.cache import ResponseCache, freshness_lifetime, parse_cache_control
+from ws.http import WsAdapter
+
+
+@pytest.fixture
+def server():
+    """
+    Local http server answering with Accept header of request,
+    cacheable for a minute, varying by Accept (and everything, for /any).
+    Returns its url and list of paths it was asked for.
+    """
+    requests_seen = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requests_seen.append(self.path)
+            body = (self.headers.get('Accept') or '').encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'max-age=60')
+            self.send_header('Vary', '*' if self.path == '/any' else 'Accept, X-Variant')
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{}'.format(httpd.server_address[1]), requests_seen
+    httpd.shutdown()
+
+
+@pytest.fixture
+def session(tmp_path):
+    session = requests.Session()
+    session.mount('http://', WsAdapter(cache=ResponseCache(str(tmp_path))))
+    return session
+
+
+def test_cached_per_accept_header(server, session):
+    url, seen = server
+    for _ in range(2):
+        assert session.get(url + '/a', headers={'Accept': 'text/a'}).text == 'text/a'
+        assert session.get(url + '/a', headers={'Accept': 'text/b'}).text == 'text/b'
+    assert seen == ['/a', '/a']
+
+
+def test_vary_header_must_match(server, session):
+    url, seen = server
+    assert session.get(url + '/v', headers={'X-Variant': '1'}).status_code == 200
+    assert session.get(url + '/v', headers={'X-Variant': '1'}).status_code == 200
+    assert session.get(url + '/v', headers={'X-Variant': '2'}).status_code == 200
+    assert seen == ['/v', '/v']
+
+
+def test_vary_star_not_stored(server, session):
+    url, seen = server
+    session.get(url + '/any')
+    session.get(url + '/any')
+    assert seen == ['/any', '/any']
+
+
+def test_freshness():
+    assert parse_cache_control('max-age=60, Private') == {'max-age': '60', 'private': None}
+    assert freshness_lifetime({'cache-control': 'max-age=60'}, 0) == 60
+    assert freshness_lifetime({'cache-control': 'no-cache, max-age=60'}, 0) == 0
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from ws.jsonstream import JsonStream, parse_fields, project
+
+DOCUMENT = {
+    'total_count': 3,
+    'items': [
+        {'name': 'a', 'stars': 10, 'owner': {'login': 'x', 'id': 1}},
+        {'name': 'b', 'stars': 2.5e3, 'owner': {'login': 'y', 'id': 2}},
+        {'name': 'ć', 'stars': -7, 'owner': None},
+    ],
+    'incomplete_results': False,
+}
+
+
+def chunked(data, size):
+    return [data[idx:idx + size] for idx in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 1000])
+def test_items_across_chunk_boundaries(size):
+    data = json.dumps(DOCUMENT, ensure_ascii=False).encode('utf-8')
+    stream = JsonStream(chunked(data, size), ['items'])
+    assert list(stream) == DOCUMENT['items']
+    assert stream.document == {'total_count': 3, 'incomplete_results': False}
+
+
+def test_fields():
+    data = json.dumps(DOCUMENT).encode('utf-8')
+    stream = JsonStream(chunked(data, 5), ['items'], parse_fields('name,owner.login'))
+    assert list(stream) == [
+        {'name': 'a', 'owner': {'login': 'x'}},
+        {'name': 'b', 'owner': {'login': 'y'}},
+        {'name': 'ć', 'owner': None},
+    ]
+
+
+def test_top_level_array():
+    assert list(JsonStream(['[1, ', '2', '3, {"a": [4]}]'])) == [1, 23, {'a': [4]}]
+
+
+def test_no_array_at_path():
+    stream = JsonStream([b'{"message": "Not Found"}'], ['items'])
+    assert list(stream) == []
+    assert stream.document == {'message': 'Not Found'}
+    stream = JsonStream([b'{"a": 1}'])
+    assert list(stream) == []
+    assert stream.document == {'a': 1}
+
+
+def test_nested_path():
+    stream = JsonStream([b'{"data": {"x": 1, "nodes": [{"id": 1}, {"id": 2}]}, "y": 2}'], ['data', 'nodes'])
+    assert list(stream) == [{'id': 1}, {'id': 2}]
+    assert stream.document == {'y': 2}
+
+
+def test_decoded():
+    stream = JsonStream.decoded(DOCUMENT, ['items'], [('name',)])
+    assert list(stream) == [{'name': 'a'}, {'name': 'b'}, {'name': 'ć'}]
+    assert stream.document == {'total_count': 3, 'incomplete_results': False}
+
+
+@pytest.mark.parametrize('data', [b'{"items": [1, 2', b'{"items": [1 2]}', b'[1] x', b'{"items": [tru'])
+def test_invalid_json(data):
+    with pytest.raises(ValueError):
+        list(JsonStream(chunked(data, 3), ['items']))
+
+
+def test_close_closes_chunks():
+    # like ws.http.BodyChunks
+    class Chunks:
+        closed = False
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            raise StopIteration
+
+        def close(self):
+            self.closed = True
+
+    chunks = Chunks()
+    stream = JsonStream(chunks)
+    stream.close()
+    assert chunks.closed
+
+
+def test_project():
+    value = {'a': [{'b': 1, 'c': 2}, {'b': 3}], 'd': {'e': 1, 'f': 2}}
+    assert project(value, [('a', 'b'), ('d', 'e'), ('d', 'f'), ('missing',)]) == {
+        'a': [{'b': 1}, {'b': 3}], 'd': {'e': 1, 'f': 2}}
+    assert parse_fields(['name, owner.login', '']) == [('name',), ('owner', 'login')]
+    assert parse_fields(None) is None
@@ -0,0 +1,38 @@
+from ws import WsCommand
+from ws.lineparser import LineParser, retokenize
+from ws.tokenize import TokenType, tokenize
+
+
+def parser():
+    return LineParser(lambda: WsCommand(None, service_manager=None))
+
+
+def types(parsed):
+    return [token.tokentype for token in parsed.tokens]
+
+
+def test_retokenize_reuses_tokens_before_change():
+    old_text = ':batch -j 4 file'
+    tokens, kept = retokenize(old_text, tokenize(old_text), ':batch -j 4 other')
+    assert kept == 3
+    assert [token.text for token in tokens] == [':batch', '-j', '4', 'other']
+    assert [(token.position, token.end) for token in tokens] == [(0, 6), (7, 9), (10, 11), (12, 17)]
+
+
+def test_incremental_parse_types_tokens():
+    line_parser = parser()
+    line_parser.parse(':batch -j 4 fil')
+    parsed = line_parser.parse(':batch -j 4 file')
+    assert parsed.error is None
+    assert types(parsed) == [TokenType.Command, TokenType.OptionName, TokenType.OptionValue, TokenType.Argument]
+
+
+def test_incremental_parse_leaves_cached_lines_alone():
+    line_parser = parser()
+    first = line_parser.parse(':batch -j 4 file')
+    first_types = types(first)
+    second = line_parser.parse(':batch -j 4 -u')
+    assert types(second)[-1] == TokenType.Flag
+    assert not any(old is new for old, new in zip(first.tokens, second.tokens))
+    assert types(first) == first_types
+    assert line_parser.parse(':batch -j 4 file') is first
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from ws.pagination import iter_pages, pages_needed, paginate
+
+
+class Page:
+    def __init__(self, number, items):
+        self.number = number
+        self.items = items
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Session:
+    """
+    Listing of pages of page_size items, with page number as url.
+    """
+
+    def __init__(self, pages=5, page_size=3, fail_at=None):
+        self.pages = pages
+        self.page_size = page_size
+        self.fail_at = fail_at
+        self.requested = []
+        self.created = []
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None):
+        number = int(url)
+        with self.lock:
+            self.requested.append(number)
+        if number == self.fail_at:
+            raise IOError('page {} failed'.format(number))
+        start = number * self.page_size
+        page = Page(number, list(range(start, start + self.page_size)))
+        with self.lock:
+            self.created.append(page)
+        return page
+
+    def next_page(self, page):
+        return str(page.number + 1) if page.number + 1 < self.pages else None
+
+
+def pages(session, **kwargs):
+    return iter_pages(session, '0', next_page=session.next_page, decode=lambda page: page, **kwargs)
+
+
+def wait_for(condition):
+    deadline = time.time() + 2
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.001)
+
+
+@pytest.mark.parametrize('lookahead', [0, 1, 3])
+def test_pages_in_order(lookahead):
+    session = Session()
+    assert [page.number for page in pages(session, lookahead=lookahead)] == [0, 1, 2, 3, 4]
+    assert session.requested == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('lookahead', [0, 1, 3])
+def test_max_pages(lookahead):
+    session = Session()
+    assert [page.number for page in pages(session, lookahead=lookahead, max_pages=2)] == [0, 1]
+    time.sleep(0.01)
+    assert session.requested == [0, 1]
+
+
+def test_cursor_params():
+    requested = []
+
+    class CursorSession:
+        def get(self, url, params=None):
+            requested.append(params)
+            return params['cursor']
+
+    def next_page(cursor):
+        return ('url', {'cursor': cursor + 1}) if cursor < 2 else None
+
+    listing = iter_pages(CursorSession(), 'url', {'cursor': 0}, next_page=next_page, decode=lambda page: page)
+    assert list(listing) == [0, 1, 2]
+    assert requested == [{'cursor': 0}, {'cursor': 1}, {'cursor': 2}]
+
+
+def test_fetches_ahead_at_most_lookahead_pages():
+    session = Session(pages=10)
+    listing = pages(session, lookahead=2)
+    assert next(listing).number == 0
+    # current page and two ahead
+    wait_for(lambda: len(session.requested) == 3)
+    time.sleep(0.01)
+    assert session.requested == [0, 1, 2]
+    listing.close()
+
+
+def test_close_closes_pages_fetched_ahead():
+    session = Session(pages=10)
+    listing = pages(session, lookahead=2)
+    first = next(listing)
+    wait_for(lambda: len(session.created) == 3)
+    listing.close()
+    time.sleep(0.01)
+    assert len(session.requested) <= 4
+    # consumer closes pages it got, the rest are closed by iter_pages
+    assert not first.closed
+    wait_for(lambda: all(page.closed for page in session.created[1:]))
+
+
+def test_error_raised_in_order():
+    session = Session(fail_at=2)
+    listing = pages(session, lookahead=3)
+    assert [next(listing).number, next(listing).number] == [0, 1]
+    with pytest.raises(IOError):
+        next(listing)
+
+
+def test_paginate_limit():
+    session = Session()
+    items = paginate(session, '0', next_page=session.next_page, decode=lambda page: page,
+                     items=lambda page: page.items, limit=4, page_size=3)
+    assert list(items) == [0, 1, 2, 3]
+    time.sleep(0.01)
+    assert session.requested == [0, 1]
+    # page stopped in the middle of is closed
+    assert session.created[1].closed
+
+
+def test_pages_needed():
+    assert pages_needed(1, 30) == 1
+    assert pages_needed(30, 30) == 1
+    assert pages_needed(31, 30) == 2
+    assert pages_needed(0, 30) == 1
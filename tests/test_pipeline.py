@@ -0,0 +1,84 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+from ws.output import write_result
+from ws.pipeline import Pipe, PipeReader, PipeWriter
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'bench')
+
+
+@pytest.fixture(scope='module')
+def github(tmp_path_factory):
+    """
+    Point github service to local stub server, with ws files in temporary home.
+    """
+    sys.path.insert(0, BENCH)
+    import github_stub
+    from ws.services.github.service import Github
+    server, url = github_stub.start()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('HOME', str(tmp_path_factory.mktemp('home')))
+        patch.setattr(Github, 'endpoint', url)
+        yield
+    server.shutdown()
+    sys.path.remove(BENCH)
+
+
+def run(line):
+    from ws.runner import acapture
+    from ws.services import ServiceManager
+    from ws.tokenize import tokenize
+    return asyncio.run(acapture(tokenize(line), ServiceManager()))
+
+
+def piped(records):
+    pipe = Pipe()
+
+    def produce():
+        try:
+            write_result(iter(records), PipeWriter(pipe))
+        finally:
+            pipe.end()
+
+    thread = threading.Thread(target=produce)
+    thread.start()
+    return PipeReader(pipe), thread
+
+
+def test_records_pass_as_objects():
+    records = [{'name': 'a', 'owner': {'login': 'x'}}, {'name': 'b', 'owner': None}]
+    reader, thread = piped(records)
+    assert list(reader.records()) == records
+    thread.join()
+
+
+def test_records_read_as_json_lines():
+    reader, thread = piped([{'name': 'a'}, {'name': 'b'}])
+    assert reader.readline() == '{"name": "a"}\n'
+    assert reader.read() == '{"name": "b"}\n'
+    thread.join()
+
+
+def test_map_fills_fields_of_records(github):
+    exitcode, out, err = run('github search -r 3 python :| :map -p github search -r 1 {name}')
+    assert (exitcode, err) == (0, '')
+    lines = out.splitlines()
+    assert [line.split('\t')[0] for line in lines if 'matching' in line] == ['repo0', 'repo1', 'repo2']
+    assert 'repo2\trepo0 repository 0 matching repo2' in lines
+
+
+def test_map_unwraps_single_field_records(github):
+    exitcode, out, err = run('--fields name github search -r 2 python :| :map github search -r 1 {}')
+    assert (exitcode, err) == (0, '')
+    assert [line for line in out.splitlines() if 'matching' in line] == [
+        'repo0 repository 0 matching repo0', 'repo0 repository 0 matching repo1']
+
+
+def test_pipeline_stage_error_status(github):
+    exitcode, out, err = run('github search -r 2 python :| :nosuchcommand')
+    assert exitcode == 1
+    assert 'nosuchcommand' in err
@@ -0,0 +1,142 @@
+import pytest
+
+from ws.ratelimit import PROVISIONAL_WINDOW, Bucket, RateLimiter, is_limited
+
+
+def headers(limit, remaining, reset):
+    return {'x-ratelimit-limit': str(limit), 'x-ratelimit-remaining': str(remaining),
+            'x-ratelimit-reset': str(reset)}
+
+
+def test_not_limited_before_headers():
+    bucket = Bucket('host')
+    assert bucket.delay(0) == 0
+
+
+def test_waits_for_reset_when_no_tokens_left():
+    bucket = Bucket('host')
+    bucket.learn(headers(10, 1, 100), 0)
+    assert bucket.delay(1) == 0
+    assert bucket.delay(2) == 98
+
+
+def test_refills_at_reset():
+    bucket = Bucket('host')
+    bucket.learn(headers(2, 0, 100), 0)
+    assert bucket.delay(100) == 0
+    assert bucket.delay(100) == 0
+
+
+def test_refilled_window_ends_without_rate_limit_headers():
+    # requests of new window failed, or came back without headers,
+    # so its end was never learned
+    bucket = Bucket('host')
+    bucket.learn(headers(2, 0, 100), 0)
+    assert bucket.delay(100) == 0
+    assert bucket.delay(100) == 0
+    assert bucket.delay(101) == PROVISIONAL_WINDOW - 1
+    assert bucket.delay(100 + PROVISIONAL_WINDOW) == 0
+
+
+def test_new_window_learned_after_refill():
+    bucket = Bucket('host')
+    bucket.learn(headers(2, 0, 100), 0)
+    assert bucket.delay(100) == 0
+    bucket.learn(headers(2, 0, 3700), 100)
+    assert bucket.delay(101) == 3599
+
+
+def test_blocked_until():
+    bucket = Bucket('host')
+    bucket.block(50)
+    assert bucket.delay(10) == 40
+    assert bucket.delay(50) == 0
+
+
+def test_is_limited():
+    assert is_limited(429, {})
+    assert is_limited(403, {'x-ratelimit-remaining': '0'})
+    assert not is_limited(403, {'x-ratelimit-remaining': '5'})
+    assert not is_limited(200, {})
+
+
+class Request:
+    def __init__(self, method='GET', body=None, headers=None):
+        self.method = method
+        self.body = body
+        self.headers = headers or {}
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Make time.sleep of ws.ratelimit only advance its clock, return list of sleeps.
+    """
+    sleeps = []
+    clock = [1000.0]
+
+    def sleep(delay):
+        sleeps.append(delay)
+        clock[0] += delay
+    monkeypatch.setattr('ws.ratelimit.time.sleep', sleep)
+    monkeypatch.setattr('ws.ratelimit.time.time', lambda: clock[0])
+    return sleeps
+
+
+def sender(*responses):
+    sent = []
+
+    def send(request):
+        sent.append(request)
+        return responses[len(sent) - 1]
+    return send, sent
+
+
+def test_send_retries_rate_limited(sleeps):
+    limited, ok = Response(429, {'retry-after': '30'}), Response(200)
+    send, sent = sender(limited, ok)
+    limiter = RateLimiter()
+    response = limiter.send(send, Request(), 'host')
+    assert response is ok
+    assert len(sent) == 2
+    assert limited.closed and not ok.closed
+    assert limiter.stats['retries'] == 1
+    # whole host was blocked until Retry-After
+    assert sleeps == [30]
+    assert response.queue_wait == 30
+
+
+def test_send_backs_off_on_server_error(sleeps):
+    send, sent = sender(Response(503), Response(200))
+    assert RateLimiter().send(send, Request(), 'host').status_code == 200
+    assert len(sleeps) == 1 and 0.25 <= sleeps[0] <= 0.5
+
+
+def test_send_gives_up_after_retries(sleeps):
+    send, sent = sender(*[Response(503) for _ in range(3)])
+    assert RateLimiter(retries=2).send(send, Request(), 'host').status_code == 503
+    assert len(sent) == 3
+
+
+@pytest.mark.parametrize('request_', [Request('POST'), Request('PUT', body=iter([b'x']))])
+def test_send_does_not_resend(sleeps, request_):
+    send, sent = sender(Response(503), Response(200))
+    assert RateLimiter().send(send, request_, 'host').status_code == 503
+    assert len(sent) == 1
+
+
+def test_buckets_by_credentials():
+    limiter = RateLimiter()
+    assert limiter.bucket('host', 'token a') is limiter.bucket('host', 'token a')
+    assert limiter.bucket('host', 'token a') is not limiter.bucket('host', 'token b')
+    assert limiter.bucket('host') is not limiter.bucket('host', 'token a')
@@ -0,0 +1,34 @@
+import json
+import os
+
+from ws.services import ServiceManager
+
+
+def write_service(path, description):
+    path.write_text(json.dumps({
+        'endpoint': 'http://localhost',
+        'description': description,
+        'commands': [{'name': 'get', 'path': '/'}],
+    }))
+
+
+def test_search_sees_json_service_edited_in_place(tmp_path):
+    services = tmp_path / 'services'
+    services.mkdir()
+    spec = services / 'zoo.json'
+    write_service(spec, 'Zebra sightings')
+    manager = ServiceManager(
+        index_path=str(tmp_path / 'services.json'), declarative_dir=str(services),
+        declarative_cache=str(tmp_path / 'declarative'), search_path=str(tmp_path / 'search.marshal'))
+    index = manager.search_index()
+    index.update(manager)
+    assert [name for _, name, _ in index.search('zebra')] == ['zoo']
+
+    # same directory, new contents and mtime of the file only
+    write_service(spec, 'Giraffe sightings')
+    stat = os.stat(spec)
+    os.utime(spec, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    manager.recheck()
+    index.update(manager)
+    assert index.search('zebra') == []
+    assert [name for _, name, _ in index.search('giraffe')] == ['zoo']
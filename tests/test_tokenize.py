@@ -0,0 +1,53 @@
+import pytest
+
+from ws.tokenize import argv_tokens, tokenize, unquote
+
+
+def words(line):
+    return [(token.text, line[token.position:token.end]) for token in tokenize(line)]
+
+
+def test_plain_words():
+    assert words('  github  search repos ') == [
+        ('github', 'github'), ('search', 'search'), ('repos', 'repos')]
+    assert tokenize('') == []
+
+
+def test_quotes():
+    line = '''github search "hello world" 'it''s' a"b c"d'''
+    assert words(line) == [
+        ('github', 'github'), ('search', 'search'),
+        ('hello world', '"hello world"'), ('its', "'it''s'"), ('ab cd', 'a"b c"d')]
+
+
+def test_escapes():
+    assert [token.text for token in tokenize(r'a\ b "c\"d" "e\nf" \\ \'')] == ['a b', 'c"d', r'e\nf', '\\', "'"]
+
+
+def test_single_quotes_keep_backslashes():
+    assert [token.text for token in tokenize(r"'a\b' x")] == [r'a\b', 'x']
+
+
+def test_unterminated_quote_extends_to_end():
+    line = 'say "hello  world'
+    assert words(line) == [('say', 'say'), ('hello  world', '"hello  world')]
+    assert [token.text for token in tokenize('trailing \\')] == ['trailing', '']
+
+
+def test_positions():
+    line = 'a  "b c"  d'
+    tokens = tokenize(line)
+    assert [(token.position, token.end) for token in tokens] == [(0, 1), (3, 8), (10, 11)]
+
+
+@pytest.mark.parametrize('word, text', [
+    ('"plain"', 'plain'), ("'plain'", 'plain'), ('"a\\$b"', 'a$b'), ('"a\\qb"', 'a\\qb'), ('x"y"z', 'xyz'),
+])
+def test_unquote(word, text):
+    assert unquote(word) == text
+
+
+def test_argv_tokens():
+    tokens = argv_tokens(['github', 'hello world', ''])
+    assert [(token.text, token.position, token.end) for token in tokens] == [
+        ('github', 0, 6), ('hello world', 7, 18), ('', 19, 19)]
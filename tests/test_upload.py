@@ -0,0 +1,105 @@
+import asyncio
+import http.server
+import json
+import threading
+
+import pytest
+
+from ws.upload import UploadFile, multipart
+
+
+@pytest.fixture
+def server():
+    """
+    Local http server recording requests it gets, as (method, path, headers, body).
+    """
+    requests = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            requests.append((self.command, self.path, dict(self.headers), body))
+            self.send_response(200)
+            self.send_header('Content-Length', '3')
+            self.end_headers()
+            self.wfile.write(b'ok\n')
+
+        do_PUT = do_POST
+
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{}'.format(httpd.server_address[1]), requests
+    httpd.shutdown()
+
+
+@pytest.fixture
+def service(server, tmp_path, monkeypatch):
+    """
+    Install json service sending files to server, in temporary home.
+    """
+    monkeypatch.setenv('HOME', str(tmp_path))
+    services = tmp_path / '.ws' / 'services'
+    services.mkdir(parents=True)
+    (services / 'store.json').write_text(json.dumps({
+        'endpoint': server[0],
+        'commands': [
+            {'name': 'upload', 'method': 'POST', 'path': '/upload', 'body': 'multipart',
+             'arguments': {'min_amount': 1, 'max_amount': 1, 'param': 'title'}},
+            {'name': 'put', 'method': 'PUT', 'path': '/raw', 'arguments': {'param': 'title'}},
+            {'name': 'get', 'path': '/raw'},
+        ],
+    }))
+    (tmp_path / 'doc.txt').write_bytes(b'file content')
+    monkeypatch.chdir(tmp_path)
+    return server[1]
+
+
+def run(line):
+    from ws.runner import acapture
+    from ws.services import ServiceManager
+    from ws.tokenize import tokenize
+    return asyncio.run(acapture(tokenize(line), ServiceManager()))
+
+
+def test_multipart_body(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_bytes(b'hello')
+    body, content_type = multipart({'title': 'x'}, [UploadFile('doc', str(path))], boundary='b')
+    data = b''.join(bytes(chunk) for chunk in body)
+    assert content_type == 'multipart/form-data; boundary=b'
+    assert data == (
+        b'--b\r\nContent-Disposition: form-data; name="title"\r\n\r\nx\r\n'
+        b'--b\r\nContent-Disposition: form-data; name="doc"; filename="a.txt"\r\n'
+        b'Content-Type: application/octet-stream\r\n\r\nhello\r\n--b--\r\n')
+    assert body.len == len(data)
+
+
+def test_json_service_sends_multipart(service):
+    exitcode, out, err = run('--file doc doc.txt store upload hello')
+    assert (exitcode, out, err) == (0, 'ok\n', '')
+    [(method, path, headers, body)] = service
+    assert (method, path) == ('POST', '/upload')
+    assert headers['Content-Type'].startswith('multipart/form-data; boundary=')
+    assert b'name="title"\r\n\r\nhello\r\n' in body
+    assert b'name="doc"; filename="doc.txt"' in body
+    assert b'\r\n\r\nfile content\r\n' in body
+
+
+def test_json_service_sends_file_as_body(service):
+    exitcode, out, err = run('--file doc doc.txt store put hello')
+    assert (exitcode, out, err) == (0, 'ok\n', '')
+    [(method, path, headers, body)] = service
+    assert (method, path, body) == ('PUT', '/raw?title=hello', b'file content')
+    assert headers['Content-Type'] == 'application/octet-stream'
+
+
+def test_get_refuses_files(service):
+    exitcode, out, err = run('--file doc doc.txt store get')
+    assert exitcode == 1
+    assert 'does not send files' in err
+    assert service == []